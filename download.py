@@ -1,51 +1,277 @@
 """
 download.py
 
-Downloads relevant Wikipedia dumps (enwiki and enwikibooks) 
-and converts them to text files using the WikiUtils GitHub repo.
-The files downloaded and extracted here are utilized in wiki_demo.py,
-which converts the text files to ontologies.
+Downloads relevant Wikipedia dumps (enwiki and enwikibooks)
+and compiles each wiki's page and categorylinks dumps straight into a
+graph snapshot (e.g. enwiki-20201020.wcg) that WCGTaxonomy loads.
+With --text, the dumps are also converted to text files using the WikiUtils
+GitHub repo, for wiki_demo.py, which converts the text files to ontologies.
+
+The dumps are downloaded concurrently, into .part files that are resumed
+with HTTP Range requests if interrupted, and are checked against the
+size the server reports and the wiki's sha1sums (or md5sums) manifest
+before being renamed into place, so a dump file that exists is always
+complete. Each wiki is compiled (and
+each dump extracted) as soon as its files are in, while the other
+downloads go on.
 """
 
+import hashlib
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 import requests # requests.get, for downloading wiki dumps
 import subprocess # subprocess.Popen, for running the extraction commands
 from pathlib import Path # for checking if a file already exists in pwd
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                'oddoneout'))
+
+WIKIDUMPS_URL = "https://dumps.wikimedia.org"
+CHUNK_SIZE = 1 << 20
+MANIFESTS = (('sha1', 'sha1sums.txt'), ('md5', 'md5sums.txt'))
+
+
+class DownloadError(Exception):
+    """
+    A dump could not be downloaded, or did not match its checksum.
+    """
+
+
 def analyze_dump_filename(filename):
     (_, dump_date, filetype) = filename[:-len('.sql.gz')].split('-')
     return dump_date, filetype
 
 
-def download(dumps_to_download, wikidumps_url = "https://dumps.wikimedia.org"):
-    for dump in dumps_to_download:
-        # First check if dump is already downloaded
-        if not Path(dump).is_file():
-                        
-            # Form the URL of the dump to download and issue request to it
-            wiki = dump[:dump.find('-')]
-            dump_date, _ = analyze_dump_filename(dump)
-            dump_url = wikidumps_url + "/" + wiki + "/" + dump_date + "/" + dump
-            dump_contents = requests.get(dump_url, stream=True)
-            
-            # Write dump to file
-            with open(dump, "wb") as dump_file:
-                for chunk in dump_contents.iter_content(chunk_size=1024):
-                    if chunk:
-                        dump_file.write(chunk)
+def dump_directory_url(dump, wikidumps_url=WIKIDUMPS_URL):
+    wiki = dump[:dump.find('-')]
+    dump_date, _ = analyze_dump_filename(dump)
+    return wikidumps_url + "/" + wiki + "/" + dump_date
+
+
+_sessions = threading.local()
+
+
+def _session():
+    # requests sessions are not thread-safe, so each thread keeps its own
+    # (and its pooled connections)
+    if not hasattr(_sessions, 'session'):
+        _sessions.session = requests.Session()
+    return _sessions.session
+
+
+def fetch_checksums(dumps_to_download, wikidumps_url=WIKIDUMPS_URL, timeout=60):
+    """
+    Returns {dump: (algorithm, hexdigest)} from the sha1sums manifest of
+    each wiki and date, or the md5sums one if there is no sha1sums.
+    Dumps that no manifest lists are left out.
+
+    """
+    checksums = dict()
+    directories = {dump_directory_url(dump, wikidumps_url): dump
+                   for dump in dumps_to_download}
+    for directory, dump in directories.items():
+        prefix = dump[:dump.rfind('-') + 1]
+        for algorithm, suffix in MANIFESTS:
+            response = _session().get(directory + "/" + prefix + suffix,
+                                      timeout=timeout)
+            if response.status_code != 200:
+                continue
+            for line in response.text.splitlines():
+                parts = line.split()
+                if len(parts) == 2:
+                    checksums.setdefault(parts[1], (algorithm, parts[0].lower()))
+            break
+    return {dump: checksums[dump] for dump in dumps_to_download if dump in checksums}
+
+
+def _hash_file(hasher, filename):
+    with open(filename, 'rb') as reader:
+        for chunk in iter(lambda: reader.read(CHUNK_SIZE), b''):
+            hasher.update(chunk)
+
+
+def _file_size(response):
+    # The size of the whole file the response is (part of), from its
+    # Content-Range, or the Content-Length of a 200; None if unknown
+    if response.headers.get('Content-Encoding', 'identity') != 'identity':
+        # iter_content decodes the body, so the sizes would not match
+        return None
+    total = response.headers.get('Content-Range', '').rpartition('/')[2]
+    if total.isdigit():
+        return int(total)
+    length = response.headers.get('Content-Length', '')
+    if response.status_code == 200 and length.isdigit():
+        return int(length)
+    return None
+
+
+def download_dump(dump, wikidumps_url=WIKIDUMPS_URL, checksum=None,
+                  retries=3, timeout=60):
+    """
+    Downloads a dump into dump + '.part', resuming a partial file with a
+    Range request, and renames it to dump once complete and matching
+    checksum, an (algorithm, hexdigest) pair, if given. Whether or not
+    there is a checksum, the file must have the size the server reports;
+    a shorter one is resumed, and a longer one fetched again.
+    Raises DownloadError if the checksum does not match (the .part file is
+    removed) or the download fails retries times.
+
+    """
+    if Path(dump).is_file():
+        return dump
+    url = dump_directory_url(dump, wikidumps_url) + "/" + dump
+    part = dump + '.part'
+    for attempt in range(retries + 1):
+        offset = os.path.getsize(part) if Path(part).is_file() else 0
+        headers = {'Range': 'bytes=%d-' % offset} if offset else {}
+        cause = None
+        try:
+            with _session().get(url, stream=True, headers=headers,
+                                timeout=timeout) as response:
+                size = _file_size(response)
+                if response.status_code == 416:
+                    # Nothing left to fetch: the .part file is whole,
+                    # unless it is longer than the dump
+                    if size is None or offset == size:
+                        break
+                    os.remove(part)
+                    failure = '{} has {} bytes, the dump {}'.format(part, offset, size)
+                else:
+                    response.raise_for_status()
+                    # A 200 to a Range request is the whole file again
+                    mode = 'ab' if response.status_code == 206 else 'wb'
+                    with open(part, mode) as dump_file:
+                        for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                            dump_file.write(chunk)
+                    received = os.path.getsize(part)
+                    if size is None or received == size:
+                        break
+                    failure = 'got {} of {} bytes'.format(received, size)
+        except requests.RequestException as error:
+            failure = cause = error
+        if attempt == retries:
+            raise DownloadError("{}: {}".format(dump, failure)) from cause
+    if checksum is not None:
+        algorithm, expected = checksum
+        hasher = hashlib.new(algorithm)
+        _hash_file(hasher, part)
+        if hasher.hexdigest() != expected:
+            os.remove(part)
+            raise DownloadError("{}: {} is {}, expected {}".format(
+                dump, algorithm, hasher.hexdigest(), expected))
+    os.replace(part, dump)
+    return dump
+
+
+def download(dumps_to_download, wikidumps_url=WIKIDUMPS_URL, workers=4,
+             verify=True, on_complete=None):
+    """
+    Downloads the dumps that are not already there, workers at a time.
+    on_complete(dump) is called, from a download thread, as each dump is
+    ready. Raises the first DownloadError once all downloads are over.
+
+    """
+    checksums = fetch_checksums(dumps_to_download, wikidumps_url) if verify else {}
+
+    def fetch(dump):
+        download_dump(dump, wikidumps_url, checksums.get(dump))
+        if on_complete is not None:
+            on_complete(dump)
+        return dump
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(fetch, dump) for dump in dumps_to_download]
+    return [future.result() for future in futures]
+
+
+def extract_dump(dump):
+    output_file = dump[:-len('.sql.gz')]
+    _, filetype = analyze_dump_filename(dump)
+    # Check if files have already been extracted
+    if not Path(output_file).is_file():
+        # Extract into text file using WikiUtils repo
+        proc = subprocess.Popen(["python", "WikiUtils/parse_mysqldump.py",
+                                 dump, filetype, output_file])
+        proc.wait()
 
 
 def extract(dumps_to_download):
-    extracted_files = [filename[:-len('.sql.gz')] for filename in dumps_to_download]
-    for i in range(len(extracted_files)):
-        output_file = extracted_files[i]
-        dump = dumps_to_download[i]
-        _, filetype = analyze_dump_filename(dump)
-        # Check if files have already been extracted
-        if not Path(extracted_files[i]).is_file():
-            # Extract into text file using WikiUtils repo
-            proc = subprocess.Popen(["python", "WikiUtils/parse_mysqldump.py",
-                                     dump, filetype, output_file])
-            proc.wait()
+    for dump in dumps_to_download:
+        extract_dump(dump)
+
+
+def snapshot_inputs(dumps):
+    """
+    Returns {snapshot filename: (categorylinks dump, page dump)} for each
+    wiki and date that has both dumps among dumps.
+
+    """
+    pairs = dict()
+    for dump in dumps:
+        dump_date, filetype = analyze_dump_filename(dump)
+        snapshot = dump[:dump.find('-')] + "-" + dump_date + ".wcg"
+        pairs.setdefault(snapshot, dict())[filetype] = dump
+    return {snapshot: (files['categorylinks'], files['page'])
+            for snapshot, files in pairs.items()
+            if 'categorylinks' in files and 'page' in files}
+
+
+def compile_snapshot(snapshot, catlinks_dump, pages_dump):
+    # Streams a wiki's page and categorylinks .sql.gz dumps into a
+    # snapshot, with no intermediate text files
+    from wikigraph import compileSnapshot
+    if not Path(snapshot).is_file():
+        compileSnapshot(catlinks_dump, pages_dump, snapshot,
+                        approximate_counts=snapshot.startswith('enwiki-'))
+
+
+def compile_snapshots(dumps_to_download):
+    for snapshot, (catlinks_dump, pages_dump) in snapshot_inputs(dumps_to_download).items():
+        compile_snapshot(snapshot, catlinks_dump, pages_dump)
+
+
+def download_and_compile(dumps_to_download, wikidumps_url=WIKIDUMPS_URL,
+                         workers=4, text=False):
+    """
+    Downloads the dumps, compiling each wiki's snapshot (and, with text=True,
+    extracting each dump) as soon as its files are downloaded, while the
+    remaining downloads continue.
+
+    """
+    inputs = snapshot_inputs(dumps_to_download)
+    lock = threading.Lock()
+    downloaded = set()
+    jobs = []
+    with ThreadPoolExecutor(max_workers=2) as processor:
+        def on_complete(dump):
+            with lock:
+                downloaded.add(dump)
+                if text:
+                    jobs.append(processor.submit(extract_dump, dump))
+                for snapshot, dumps in inputs.items():
+                    if dump in dumps and all(d in downloaded for d in dumps):
+                        jobs.append(processor.submit(compile_snapshot, snapshot,
+                                                     *dumps))
+
+        try:
+            download(dumps_to_download, wikidumps_url, workers,
+                     on_complete=on_complete)
+        finally:
+            # Every job is waited for; a download error, if any, is the one
+            # raised, and otherwise the first failed job's
+            with lock:
+                pending = list(jobs)
+            errors = []
+            for job in pending:
+                try:
+                    job.result()
+                except Exception as error:
+                    errors.append(error)
+    if errors:
+        raise errors[0]
 
 
 if __name__ == "__main__":
@@ -56,5 +282,4 @@ if __name__ == "__main__":
         "enwiki-" + my_dump_date + "-categorylinks.sql.gz",
         "enwikibooks-" + my_dump_date + "-page.sql.gz",
         "enwikibooks-" + my_dump_date + "-categorylinks.sql.gz"]
-    download(dumps_to_download)
-    extract(dumps_to_download)
\ No newline at end of file
+    download_and_compile(dumps_to_download, text="--text" in sys.argv)
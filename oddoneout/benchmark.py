@@ -0,0 +1,345 @@
+"""
+benchmark.py
+
+Times the taxonomy backends and the solver, so that performance can be
+tracked over time alongside the correctness tests.
+
+For every backend and graph size it measures how long the taxonomy takes
+to load, the latency distribution of get_ancestor_categories,
+get_descendant_instances, Specificity and lowest_common_ancestor over
+random samples, an end-to-end solve_puzzles run, and the peak resident set
+size. Each (backend, size) runs in a process of its own, so peak RSS is
+not inflated by the runs before it. The report is JSON.
+
+GraphTaxonomy and WCGTaxonomy are run on synthetic DAGs of the requested
+sizes (see synthetic_taxonomy), with puzzles generated from the graph.
+WordnetTaxonomy is run on the WordNet corpus, with the data/anomia puzzles,
+and is skipped if the corpus is not installed.
+
+e.g. python benchmark.py --sizes=1000,100000 --backends=graph,wcg
+                         --output=benchmark.json
+"""
+
+import json
+import math
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import sys
+import tempfile
+import time
+from taxonomy import GraphTaxonomy, Specificity, lowest_common_ancestor
+from wikigraph import WCGTaxonomy, compileSnapshot
+from solver import TaxonomySimilarity, solve_puzzles, silent_logger
+from puzzle import OddOneOutPuzzle, iter_puzzle_set
+
+
+BACKENDS = ('graph', 'wcg', 'wordnet')
+ANOMIA_SETS = ('common1', 'common2')
+
+
+def synthetic_taxonomy(num_nodes, branching=8, extra_parent_rate=0.1, seed=0):
+    """
+    Returns (root, parents) for a random DAG of num_nodes nodes, in the
+    form GraphTaxonomy takes. About one node in branching is a category:
+    each category but the root hangs under a random earlier category, and
+    each instance under a random category; with probability
+    extra_parent_rate a node gets a second parent, so that ancestor sets
+    overlap as they do in the real graphs.
+
+    """
+    rng = random.Random(seed)
+    num_categories = max(1, num_nodes // branching)
+    categories = ['Contents'] + ['C%d' % i for i in range(1, num_categories)]
+    parents = {'Contents': []}
+
+    def pick_parents(limit):
+        chosen = [categories[rng.randrange(limit)]]
+        if limit > 1 and rng.random() < extra_parent_rate:
+            other = categories[rng.randrange(limit)]
+            if other != chosen[0]:
+                chosen.append(other)
+        return chosen
+
+    for i in range(1, num_categories):
+        parents[categories[i]] = pick_parents(i)
+    for i in range(num_nodes - num_categories):
+        parents['I%d' % i] = pick_parents(num_categories)
+    return 'Contents', parents
+
+
+def synthetic_puzzles(root, parents, num_puzzles, seed=0):
+    """
+    Generates puzzles from a synthetic taxonomy: three instances of one
+    category, and an odd one out that is not a descendant of it.
+
+    """
+    rng = random.Random(seed)
+    members = dict()
+    instances = []
+    for node, node_parents in parents.items():
+        if node.startswith('I'):
+            instances.append(node)
+            for parent in node_parents:
+                members.setdefault(parent, []).append(node)
+
+    # The ancestors of the categories, memoized, and of the instances
+    closures = dict()
+
+    def ancestors(node):
+        if node in closures:
+            return closures[node]
+        result = set()
+        for parent in parents[node]:
+            if parent not in result:
+                result.add(parent)
+                result |= ancestors(parent)
+        if not node.startswith('I'):
+            closures[node] = result
+        return result
+
+    # Only the categories with an instance outside them can have an odd
+    # one out (in a small taxonomy, every instance may be under the root)
+    everywhere = None
+    for node_parents in {tuple(parents[instance]) for instance in instances}:
+        covered = set(node_parents).union(*map(ancestors, node_parents))
+        everywhere = covered if everywhere is None else everywhere & covered
+    candidates = [category for category, words in members.items()
+                  if len(words) >= 3 and category not in everywhere]
+
+    puzzles = []
+    while candidates and len(puzzles) < num_puzzles:
+        category = rng.choice(candidates)
+        wordset = rng.sample(members[category], 3)
+        oddone = rng.choice(instances)
+        if oddone not in wordset and category not in ancestors(oddone):
+            puzzles.append(OddOneOutPuzzle(oddone, wordset, category))
+    return puzzles
+
+
+def write_wcg_dump(root, parents, directory):
+    """
+    Writes a synthetic taxonomy as categorylinks and page text files, in
+    the format download.py extracts. Returns their filenames.
+
+    """
+    categories = {parent for node_parents in parents.values()
+                  for parent in node_parents} | {root}
+    page_ids = {node: page_id for (page_id, node) in enumerate(parents, 1)}
+    pages_filename = os.path.join(directory, 'synthetic-page')
+    catlinks_filename = os.path.join(directory, 'synthetic-categorylinks')
+    with open(pages_filename, 'w') as pages_file:
+        for node, page_id in page_ids.items():
+            namespace = 14 if node in categories else 0
+            pages_file.write("{}\t{}\t'{}'\t0\t100\t'wikitext'\tNULL\n".format(
+                page_id, namespace, node))
+    with open(catlinks_filename, 'w') as catlinks_file:
+        for node, node_parents in parents.items():
+            link_type = "'subcat'" if node in categories else "'page'"
+            for parent in node_parents:
+                catlinks_file.write("{}\t'{}'\t{}\n".format(
+                    page_ids[node], parent, link_type))
+    return catlinks_filename, pages_filename
+
+
+def latency_summary(latencies):
+    """
+    Summarizes a list of latencies, in seconds, as milliseconds.
+
+    """
+    if not latencies:
+        return {'count': 0}
+    ordered = sorted(latencies)
+
+    def percentile(p):
+        return ordered[min(len(ordered) - 1, math.ceil(p / 100 * len(ordered)) - 1)]
+
+    return {'count': len(ordered),
+            'mean_ms': 1000 * sum(ordered) / len(ordered),
+            'p50_ms': 1000 * percentile(50),
+            'p90_ms': 1000 * percentile(90),
+            'p99_ms': 1000 * percentile(99),
+            'max_ms': 1000 * ordered[-1]}
+
+
+def time_calls(function, arguments):
+    latencies = []
+    for args in arguments:
+        start = time.perf_counter()
+        function(*args)
+        latencies.append(time.perf_counter() - start)
+    return latency_summary(latencies)
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def measure_taxonomy(taxonomy, words, categories, puzzles):
+    """
+    Times the taxonomy queries on the given sample of words and categories
+    and an end-to-end solve_puzzles over the puzzles. Each query runs on
+    caches warmed only by the queries timed before it.
+
+    """
+    specificity = Specificity(taxonomy)
+    operations = {
+        'get_ancestor_categories': time_calls(
+            taxonomy.get_ancestor_categories, [(word,) for word in words]),
+        'get_descendant_instances': time_calls(
+            taxonomy.get_descendant_instances,
+            [(category,) for category in categories]),
+        'specificity': time_calls(
+            specificity, [(category,) for category in categories]),
+        'lowest_common_ancestor': time_calls(
+            lowest_common_ancestor,
+            [(taxonomy, puzzle.wordset, puzzle.oddone) for puzzle in puzzles]),
+    }
+    (correct, incorrect, unattempted), seconds = timed(
+        solve_puzzles, puzzles, TaxonomySimilarity(taxonomy), silent_logger)
+    return {'operations': operations,
+            'solve_puzzles': {'puzzles': len(puzzles), 'seconds': seconds,
+                              'puzzles_per_second': len(puzzles) / seconds
+                              if seconds > 0 else None,
+                              'correct': correct, 'incorrect': incorrect,
+                              'unattempted': unattempted}}
+
+
+def _sample(rng, population, size):
+    population = list(population)
+    return rng.sample(population, min(size, len(population)))
+
+
+def benchmark_graph(num_nodes, num_samples, seed):
+    root, parents = synthetic_taxonomy(num_nodes, seed=seed)
+    puzzles = synthetic_puzzles(root, parents, num_samples, seed)
+
+    def load():
+        taxonomy = GraphTaxonomy(root, parents)
+        taxonomy.num_descendant_instances(root)
+        return taxonomy
+
+    taxonomy, seconds = timed(load)
+    rng = random.Random(seed)
+    words = _sample(rng, (node for node in parents if taxonomy.is_instance(node)),
+                    num_samples)
+    categories = _sample(rng, taxonomy.get_categories(), num_samples)
+    result = measure_taxonomy(taxonomy, words, categories, puzzles)
+    result['load'] = {'seconds': seconds}
+    return result
+
+
+def benchmark_wcg(num_nodes, num_samples, seed):
+    root, parents = synthetic_taxonomy(num_nodes, seed=seed)
+    puzzles = [OddOneOutPuzzle("'%s'" % puzzle.oddone,
+                               ["'%s'" % word for word in puzzle.wordset],
+                               "'%s'" % puzzle.category)
+               for puzzle in synthetic_puzzles(root, parents, num_samples, seed)]
+    with tempfile.TemporaryDirectory() as directory:
+        catlinks_filename, pages_filename = write_wcg_dump(root, parents, directory)
+        snapshot_filename = os.path.join(directory, 'synthetic.wcg')
+        _, text_seconds = timed(WCGTaxonomy, catlinks_filename, pages_filename)
+        _, compile_seconds = timed(compileSnapshot, catlinks_filename,
+                                   pages_filename, snapshot_filename)
+        taxonomy, snapshot_seconds = timed(
+            lambda: WCGTaxonomy(snapshot_filename=snapshot_filename))
+        rng = random.Random(seed)
+        words = _sample(rng, ("'%s'" % node for node in parents
+                              if node.startswith('I')), num_samples)
+        categories = _sample(rng, taxonomy.get_categories(), num_samples)
+        result = measure_taxonomy(taxonomy, words, categories, puzzles)
+    result['load'] = {'text_seconds': text_seconds,
+                      'compile_seconds': compile_seconds,
+                      'snapshot_seconds': snapshot_seconds}
+    return result
+
+
+def benchmark_wordnet(num_nodes, num_samples, seed):
+    # The corpus has a fixed size: num_nodes is ignored
+    from wordnet import WordnetTaxonomy
+    try:
+        taxonomy, seconds = timed(WordnetTaxonomy)
+    except LookupError as error:
+        return {'skipped': 'WordNet corpus not available: {}'.format(error).strip()}
+    puzzles = []
+    for name in ANOMIA_SETS:
+        puzzles.extend(iter_puzzle_set(name))
+    rng = random.Random(seed)
+    words = _sample(rng, sorted({word for puzzle in puzzles
+                                 for word in puzzle.get_choices()}), num_samples)
+    categories = _sample(rng, taxonomy.get_categories(), num_samples)
+    result = measure_taxonomy(taxonomy, words, categories, puzzles)
+    result['load'] = {'seconds': seconds}
+    return result
+
+
+BENCHMARKS = {'graph': benchmark_graph, 'wcg': benchmark_wcg,
+              'wordnet': benchmark_wordnet}
+
+
+def _run_benchmark(backend, num_nodes, num_samples, seed):
+    result = BENCHMARKS[backend](num_nodes, num_samples, seed)
+    # ru_maxrss is in kilobytes on Linux, and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        peak //= 1024
+    result['peak_rss_kb'] = peak
+    return result
+
+
+def run_benchmarks(backends=BACKENDS, sizes=(1000, 10000), num_samples=1000,
+                   seed=0, isolate=True):
+    """
+    Runs every backend at every size (WordnetTaxonomy only once) and
+    returns the report. With isolate=True, each run is in a fresh child
+    process, so peak RSS is per run.
+
+    """
+    unknown = [backend for backend in backends if backend not in BENCHMARKS]
+    if unknown:
+        raise ValueError('unknown backends: {}'.format(', '.join(unknown)))
+    runs = []
+    for backend in backends:
+        for num_nodes in (sizes if backend != 'wordnet' else sizes[:1]):
+            args = (backend, num_nodes, num_samples, seed)
+            if isolate:
+                methods = multiprocessing.get_all_start_methods()
+                context = multiprocessing.get_context(
+                    'fork' if 'fork' in methods else None)
+                with context.Pool(1, maxtasksperchild=1) as pool:
+                    result = pool.apply(_run_benchmark, args)
+            else:
+                result = _run_benchmark(*args)
+            result.update(backend=backend,
+                          nodes=num_nodes if backend != 'wordnet' else None)
+            runs.append(result)
+    return {'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'config': {'backends': list(backends), 'sizes': list(sizes),
+                       'samples': num_samples, 'seed': seed},
+            'runs': runs}
+
+
+if __name__ == "__main__":
+    options = dict(arg[2:].split("=", 1) for arg in sys.argv[1:]
+                   if arg.startswith("--") and "=" in arg)
+    unknown = set(options) - {'backends', 'sizes', 'samples', 'seed', 'output'}
+    if unknown or len(options) != len(sys.argv) - 1:
+        sys.exit("usage: python benchmark.py [--backends=graph,wcg,wordnet] "
+                 "[--sizes=1000,10000] [--samples=1000] [--seed=0] "
+                 "[--output=FILE]")
+    report = run_benchmarks(
+        backends=options.get('backends', ','.join(BACKENDS)).split(','),
+        sizes=[int(size) for size in options.get('sizes', '1000,10000').split(',')],
+        num_samples=int(options.get('samples', 1000)),
+        seed=int(options.get('seed', 0)))
+    if 'output' in options:
+        with open(options['output'], 'w') as output:
+            json.dump(report, output, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
@@ -0,0 +1,463 @@
+"""
+categorygraph.py
+
+Compact, integer-indexed representation of the Wikipedia Category Graph.
+
+Every title (page titles and category labels) is interned once in a
+sorted string table, and pages and category links are stored as flat
+integer arrays with CSR-style (offsets + values) adjacency, so that the
+whole enwiki category graph fits in a few GB of memory.
+"""
+
+from array import array
+from collections.abc import Mapping
+from bisect import bisect_right
+from itertools import islice
+from snapshot import write_snapshot, open_snapshot
+
+
+# Layout version of the snapshots written by CategoryGraph.save
+SNAPSHOT_KIND = 'wcg'
+SNAPSHOT_VERSION = 2
+
+# Arrays stored in a snapshot, in the order of CategoryGraph's arguments
+SNAPSHOT_SECTIONS = ('page_ids', 'page_namespaces', 'page_titles',
+                     'title_page_offsets', 'title_pages',
+                     'parent_offsets', 'parent_categories',
+                     'member_offsets', 'member_pages', 'member_types',
+                     'category_labels')
+
+# Codes used to store the categorylinks page types
+LINK_TYPES = ("'page'", "'subcat'", "'file'")
+PAGE, SUBCAT, FILE = range(len(LINK_TYPES))
+
+
+class StringTable:
+    """
+    A sorted table of distinct strings, stored as one UTF-8 blob plus
+    an array of offsets into it. The position of a string in the table
+    is its id; ids follow the byte order of the encoded strings, so
+    looking up a string is a binary search over the blob.
+
+    """
+
+    def __init__(self, blob, offsets):
+        self.blob = blob
+        self.offsets = offsets
+
+    @classmethod
+    def from_strings(cls, strings):
+        return cls.from_sorted_encoded(sorted(set(
+            s.encode('utf-8', 'surrogateescape') for s in strings)))
+
+    @classmethod
+    def from_sorted_encoded(cls, encoded):
+        offsets = array('q', [0])
+        position = 0
+        for s in encoded:
+            position += len(s)
+            offsets.append(position)
+        return cls(b''.join(encoded), offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, string_id):
+        return self.encoded(string_id).decode('utf-8', 'surrogateescape')
+
+    def encoded(self, string_id):
+        return bytes(self.blob[self.offsets[string_id]:self.offsets[string_id + 1]])
+
+    def index(self, s):
+        """
+        Returns the id of the given string, or None if it is not in the table.
+
+        """
+        key = s.encode('utf-8', 'surrogateescape')
+        lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.encoded(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(self) and self.encoded(lo) == key:
+            return lo
+        return None
+
+
+def csr(num_rows, rows, values, typecode='i'):
+    """
+    Groups values by row into CSR form. Returns (offsets, grouped), where
+    the values of row r are grouped[offsets[r]:offsets[r + 1]]. The sort is
+    stable, so values keep their input order within each row.
+
+    """
+    offsets = array('q', bytes(8 * (num_rows + 1)))
+    for r in rows:
+        offsets[r + 1] += 1
+    for r in range(num_rows):
+        offsets[r + 1] += offsets[r]
+    position = array('q', offsets[:-1])
+    grouped = array(typecode, bytes(array(typecode).itemsize * len(values)))
+    for r, value in zip(rows, values):
+        grouped[position[r]] = value
+        position[r] += 1
+    return offsets, grouped
+
+
+class CategoryGraph:
+    """
+    Pages and category links of a Wikipedia dump.
+
+    Pages are numbered by ascending page_id. Titles are numbered by their
+    position in the string table. For every title, the pages with that title
+    are kept in dump order; for every page, its categories are kept in
+    categorylinks order; for every category label, its member pages are
+    kept together with their link type.
+
+    """
+
+    def __init__(self, titles, page_ids, page_namespaces, page_titles,
+                 title_page_offsets, title_pages,
+                 parent_offsets, parent_categories,
+                 member_offsets, member_pages, member_types,
+                 category_labels):
+        self.titles = titles
+        self.page_ids = page_ids
+        self.page_namespaces = page_namespaces
+        self.page_titles = page_titles
+        self.title_page_offsets = title_page_offsets
+        self.title_pages = title_pages
+        self.parent_offsets = parent_offsets
+        self.parent_categories = parent_categories
+        self.member_offsets = member_offsets
+        self.member_pages = member_pages
+        self.member_types = member_types
+        self.category_labels = category_labels
+        # Optional per-title descendant instance counts (see wikigraph.py)
+        self.descendant_counts = None
+        self.meta = dict()
+        self.snapshot_filename = None
+
+    def __reduce_ex__(self, protocol):
+        # A memory-mapped graph is sent to other processes as its filename,
+        # so that they map the same file instead of receiving a copy
+        if self.snapshot_filename is not None:
+            return (load_category_graph, (self.snapshot_filename,))
+        return super().__reduce_ex__(protocol)
+
+    def save(self, filename, meta=None):
+        """
+        Writes the graph to a snapshot file; meta is a dict of extra
+        JSON-serializable values to store with it (e.g. precomputed counts).
+
+        """
+        sections = {'titles_blob': self.titles.blob,
+                    'titles_offsets': self.titles.offsets}
+        for name in SNAPSHOT_SECTIONS:
+            sections[name] = getattr(self, name)
+        if self.descendant_counts is not None:
+            sections['descendant_counts'] = self.descendant_counts
+        meta = dict(meta or {})
+        meta.update(num_titles=self.num_titles(),
+                    num_pages=self.num_pages(),
+                    num_links=len(self.parent_categories))
+        write_snapshot(filename, SNAPSHOT_KIND, SNAPSHOT_VERSION, sections, meta)
+
+    def num_titles(self):
+        return len(self.titles)
+
+    def num_pages(self):
+        return len(self.page_ids)
+
+    def title_id(self, title):
+        return self.titles.index(title)
+
+    def title(self, title_id):
+        return self.titles[title_id]
+
+    def page_index(self, page_id):
+        """
+        Returns the index of the page with the given page_id, or None.
+
+        """
+        i = bisect_right(self.page_ids, page_id) - 1
+        if i >= 0 and self.page_ids[i] == page_id:
+            return i
+        return None
+
+    def page_title(self, page):
+        return self.page_titles[page]
+
+    def pages_with_title(self, title_id):
+        return self.title_pages[self.title_page_offsets[title_id]:
+                                self.title_page_offsets[title_id + 1]]
+
+    def parents(self, page):
+        return self.parent_categories[self.parent_offsets[page]:
+                                      self.parent_offsets[page + 1]]
+
+    def members(self, title_id):
+        start = self.member_offsets[title_id]
+        end = self.member_offsets[title_id + 1]
+        return zip(self.member_pages[start:end], self.member_types[start:end])
+
+    def is_category_label(self, title_id):
+        """
+        True if the title appears as a category in the categorylinks file.
+
+        """
+        return self.category_labels[title_id] != 0
+
+
+def _page_id_key(key):
+    # The keys of PagesView and CatlinksView that are page_ids, as strings
+    return isinstance(key, str) and key.isdigit()
+
+
+class PagesView(Mapping):
+    """
+    A read-only view of a CategoryGraph in the layout of getAllPages in
+    wikigraph.py: page_id -> [(title, namespace)] and
+    title -> [(page_id, namespace)], with page_ids and namespaces as strings.
+    Each lookup builds a new list, so the graph cannot be modified through it.
+
+    """
+
+    def __init__(self, graph):
+        self.graph = graph
+
+    def __getitem__(self, key):
+        graph = self.graph
+        if _page_id_key(key):
+            page = graph.page_index(int(key))
+            if page is not None:
+                return [(graph.title(graph.page_title(page)),
+                         str(graph.page_namespaces[page]))]
+        title_id = graph.title_id(key) if isinstance(key, str) else None
+        if title_id is not None:
+            pages = graph.pages_with_title(title_id)
+            if len(pages) > 0:
+                return [(str(graph.page_ids[page]), str(graph.page_namespaces[page]))
+                        for page in pages]
+        raise KeyError(key)
+
+    def __iter__(self):
+        graph = self.graph
+        for page_id in graph.page_ids:
+            yield str(page_id)
+        for title_id in range(graph.num_titles()):
+            if len(graph.pages_with_title(title_id)) > 0:
+                yield graph.title(title_id)
+
+    def __len__(self):
+        offsets = self.graph.title_page_offsets
+        return self.graph.num_pages() + sum(
+            1 for title_id in range(self.graph.num_titles())
+            if offsets[title_id + 1] > offsets[title_id])
+
+
+class CatlinksView(Mapping):
+    """
+    A read-only view of a CategoryGraph in the layout of getAllCategories in
+    wikigraph.py: category label -> [(page_id, link type)] and
+    page_id -> [(category label, link type)]. Only the links of the pages of
+    the graph are kept; the type of a page's links follows from its
+    namespace, as in MediaWiki.
+
+    """
+
+    def __init__(self, graph):
+        self.graph = graph
+
+    def _link_type(self, page):
+        namespace = self.graph.page_namespaces[page]
+        return LINK_TYPES[SUBCAT if namespace == 14 else FILE if namespace == 6 else PAGE]
+
+    def __getitem__(self, key):
+        graph = self.graph
+        if _page_id_key(key):
+            page = graph.page_index(int(key))
+            if page is not None and len(graph.parents(page)) > 0:
+                link_type = self._link_type(page)
+                return [(graph.title(category), link_type)
+                        for category in graph.parents(page)]
+        title_id = graph.title_id(key) if isinstance(key, str) else None
+        if title_id is not None and graph.is_category_label(title_id):
+            return [(str(graph.page_ids[page]), LINK_TYPES[link_type])
+                    for page, link_type in graph.members(title_id)]
+        raise KeyError(key)
+
+    def __iter__(self):
+        graph = self.graph
+        for page in range(graph.num_pages()):
+            if len(graph.parents(page)) > 0:
+                yield str(graph.page_ids[page])
+        for title_id in range(graph.num_titles()):
+            if graph.is_category_label(title_id):
+                yield graph.title(title_id)
+
+    def __len__(self):
+        offsets = self.graph.parent_offsets
+        return sum(1 for page in range(self.graph.num_pages())
+                   if offsets[page + 1] > offsets[page]) + \
+            sum(1 for title_id in range(self.graph.num_titles())
+                if self.graph.is_category_label(title_id))
+
+
+class CategoryGraphBuilder:
+    """
+    Collects page and categorylinks rows and packs them into a CategoryGraph.
+    Rows are kept in flat arrays while loading; the titles are interned
+    through a temporary dict that is released by build().
+
+    """
+
+    def __init__(self):
+        self.title_ids = dict()
+        self.title_list = []
+        self.page_ids = array('i')
+        self.page_namespaces = array('h')
+        self.page_titles = array('i')
+        self.link_pages = array('i')
+        self.link_categories = array('i')
+        self.link_types = array('b')
+
+    def intern(self, title):
+        title_id = self.title_ids.get(title)
+        if title_id is None:
+            title_id = len(self.title_list)
+            self.title_ids[title] = title_id
+            self.title_list.append(title)
+        return title_id
+
+    def add_page(self, page_id, namespace, title):
+        self.page_ids.append(int(page_id))
+        self.page_namespaces.append(int(namespace))
+        self.page_titles.append(self.intern(title))
+
+    def add_link(self, page_id, category, link_type):
+        self.link_pages.append(int(page_id))
+        self.link_categories.append(self.intern(category))
+        self.link_types.append(LINK_TYPES.index(link_type))
+
+    def add_pages(self, page_ids, namespaces, title_ids, titles):
+        """
+        Adds many pages at once. title_ids index into titles, a list of
+        distinct titles local to this batch (see parsePageChunk in wikigraph.py).
+
+        """
+        renumber = [self.intern(title) for title in titles]
+        self.page_ids.extend(page_ids)
+        self.page_namespaces.extend(namespaces)
+        self.page_titles.extend(renumber[t] for t in title_ids)
+
+    def add_links(self, page_ids, category_ids, link_types, categories):
+        """
+        Adds many links at once. category_ids index into categories, a list
+        of distinct category labels local to this batch.
+
+        """
+        renumber = [self.intern(category) for category in categories]
+        self.link_pages.extend(page_ids)
+        self.link_categories.extend(renumber[c] for c in category_ids)
+        self.link_types.extend(link_types)
+
+    def relabel(self, label):
+        """
+        Replaces every title t added so far by label(t); titles that get the
+        same label become one. Lets a loader intern keys (e.g. IRIs) while
+        it streams links in, and name them once their labels are known.
+
+        """
+        title_ids = dict()
+        title_list = []
+        renumber = array('i')
+        for title in self.title_list:
+            new_title = label(title)
+            title_id = title_ids.get(new_title)
+            if title_id is None:
+                title_id = title_ids[new_title] = len(title_list)
+                title_list.append(new_title)
+            renumber.append(title_id)
+        self.title_ids = title_ids
+        self.title_list = title_list
+        self.page_titles = array('i', (renumber[t] for t in self.page_titles))
+        self.link_categories = array('i', (renumber[c] for c in self.link_categories))
+
+    def build(self):
+        # Map the provisional (first-seen) title ids onto the sorted ids
+        encoded = [t.encode('utf-8', 'surrogateescape') for t in self.title_list]
+        self.title_ids = None
+        self.title_list = None
+        order = sorted(range(len(encoded)), key=encoded.__getitem__)
+        titles = StringTable.from_sorted_encoded([encoded[i] for i in order])
+        encoded = None
+        num_titles = len(titles)
+        renumber = array('i', bytes(4 * num_titles))
+        for new_id, old_id in enumerate(order):
+            renumber[old_id] = new_id
+
+        # Dumps are normally already sorted by page_id
+        if all(a < b for a, b in zip(self.page_ids,
+                                     islice(self.page_ids, 1, None))):
+            order = range(len(self.page_ids))
+        else:
+            order = sorted(range(len(self.page_ids)),
+                           key=self.page_ids.__getitem__)
+        rank = array('i', bytes(4 * len(order)))
+        for sorted_index, file_index in enumerate(order):
+            rank[file_index] = sorted_index
+        page_ids = array('i', [self.page_ids[i] for i in order])
+        page_namespaces = array('h', [self.page_namespaces[i] for i in order])
+        page_titles = array('i', [renumber[self.page_titles[i]] for i in order])
+        num_pages = len(page_ids)
+
+        # Title -> pages, in dump order
+        title_page_offsets, title_pages = csr(
+            num_titles, [renumber[t] for t in self.page_titles], rank)
+
+        graph = CategoryGraph(titles, page_ids, page_namespaces, page_titles,
+                              title_page_offsets, title_pages,
+                              None, None, None, None, None, None)
+
+        category_labels = array('b', bytes(num_titles))
+        link_pages = array('i')
+        link_categories = array('i')
+        link_types = array('b')
+        for page_id, category, link_type in zip(self.link_pages,
+                                                self.link_categories,
+                                                self.link_types):
+            category = renumber[category]
+            category_labels[category] = 1
+            page = graph.page_index(page_id)
+            if page is not None:
+                link_pages.append(page)
+                link_categories.append(category)
+                link_types.append(link_type)
+
+        graph.parent_offsets, graph.parent_categories = csr(
+            num_pages, link_pages, link_categories)
+        graph.member_offsets, graph.member_pages = csr(
+            num_titles, link_categories, link_pages)
+        _, graph.member_types = csr(
+            num_titles, link_categories, link_types, 'b')
+        graph.category_labels = category_labels
+        return graph
+
+
+def load_category_graph(filename):
+    """
+    Memory-maps a snapshot written by CategoryGraph.save. The returned graph
+    has a meta attribute holding the values stored with it.
+
+    """
+    snapshot = open_snapshot(filename, SNAPSHOT_KIND, SNAPSHOT_VERSION)
+    titles = StringTable(snapshot['titles_blob'], snapshot['titles_offsets'])
+    graph = CategoryGraph(titles, *[snapshot[name] for name in SNAPSHOT_SECTIONS])
+    if 'descendant_counts' in snapshot:
+        graph.descendant_counts = snapshot['descendant_counts']
+    graph.snapshot_filename = filename
+    graph.meta = snapshot.meta
+    return graph
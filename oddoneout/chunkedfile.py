@@ -0,0 +1,54 @@
+"""
+chunkedfile.py
+
+Splits a large line-oriented file into byte ranges that start and end on
+line boundaries, so that several processes can parse it in parallel, each
+reading only its own range.
+"""
+
+import os
+
+
+DEFAULT_CHUNK_SIZE = 64 << 20
+
+
+def line_chunks(filename, num_chunks=1, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Returns a list of (start, end) byte offsets covering the file, in
+    order: at least num_chunks ranges of about equal size, and more if
+    needed to keep them under about chunk_size bytes. Each boundary is
+    moved forward to the start of a line; empty ranges are dropped.
+
+    """
+    size = os.path.getsize(filename)
+    num_chunks = max(num_chunks, -(-size // chunk_size))
+    boundaries = [0]
+    with open(filename, 'rb') as reader:
+        for i in range(1, num_chunks):
+            position = size * i // num_chunks
+            if position <= boundaries[-1]:
+                continue
+            # Skip to the end of the line that the byte before position is on
+            reader.seek(position - 1)
+            reader.readline()
+            boundaries.append(min(reader.tell(), size))
+    boundaries.append(size)
+    return [(start, end) for (start, end) in zip(boundaries, boundaries[1:])
+            if start < end]
+
+
+def read_lines(filename, start, end):
+    """
+    Yields the lines of the byte range [start, end) of a file, decoded as
+    UTF-8, without their line terminators.
+
+    """
+    with open(filename, 'rb') as reader:
+        reader.seek(start)
+        position = start
+        while position < end:
+            line = reader.readline()
+            if not line:
+                break
+            position += len(line)
+            yield line.rstrip(b'\r\n').decode('utf-8', 'surrogateescape')
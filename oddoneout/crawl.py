@@ -0,0 +1,204 @@
+"""
+crawl.py
+
+Resumable crawl of the descendant instances of a DBpedia category.
+
+DBpediaTaxonomy.get_descendant_instances keeps all of its state in memory,
+and computing it for the root takes days, so an interruption loses
+everything. DescendantCrawl runs the same traversal with its state on disk,
+in a directory of its own:
+    visited.log     one line per expanded category, with its subcategories:
+                    category \\t subcategory \\t subcategory ...
+    instances.tsv   one line per instance found: category \\t instance
+    frontier.json   checkpoint of the categories still to expand, with the
+                    length of visited.log it accounts for
+Lines are appended and flushed as each category is expanded (its instances
+first, then its visited.log line), and frontier.json is rewritten
+atomically every checkpoint_every categories. On resume, the visited.log
+lines written after the checkpoint are replayed, so no expansion is lost
+or repeated; a category interrupted halfway is expanded again, which can
+only duplicate instance lines.
+"""
+
+import json
+import os
+import time
+from dbpedia import QUERY_ERRORS
+
+
+class DescendantCrawl:
+
+    def __init__(self, taxonomy, root, directory, checkpoint_every=100,
+                 report_every=10.0, logger=print, clock=time.monotonic):
+        """
+        taxonomy provides get_category_instances and get_subcategories (see
+        DBpediaTaxonomy) and counts its queries in num_queries. root is the
+        name of the category to crawl, as in its IRI. If directory holds
+        the state of an earlier crawl of the same root, it is resumed.
+
+        Progress is reported through logger every report_every seconds.
+
+        """
+        self.taxonomy = taxonomy
+        self.root = root
+        self.directory = directory
+        self.checkpoint_every = checkpoint_every
+        self.report_every = report_every
+        self.logger = logger
+        self.clock = clock
+        os.makedirs(directory, exist_ok=True)
+        self.visited_filename = os.path.join(directory, 'visited.log')
+        self.instances_filename = os.path.join(directory, 'instances.tsv')
+        self.frontier_filename = os.path.join(directory, 'frontier.json')
+        self.visited = set()
+        self.frontier = []
+        self.failed = []
+        self._load()
+
+    def _load(self):
+        checkpoint = {'root': self.root, 'frontier': [self.root],
+                      'failed': [], 'visited_length': 0}
+        if os.path.exists(self.frontier_filename):
+            with open(self.frontier_filename, 'r', encoding='utf-8') as reader:
+                checkpoint = json.load(reader)
+            if checkpoint['root'] != self.root:
+                raise ValueError('{} holds a crawl of {}, not {}'.format(
+                    self.directory, checkpoint['root'], self.root))
+        # Categories that failed last time are retried
+        self.frontier = checkpoint['frontier'] + checkpoint['failed']
+        self._truncate_partial_line(self.visited_filename)
+        self._truncate_partial_line(self.instances_filename)
+        with open(self.visited_filename, 'a+b') as log:
+            log.seek(0)
+            position = 0
+            for line in log:
+                fields = line.decode('utf-8').rstrip('\n').split('\t')
+                self.visited.add(fields[0])
+                if position >= checkpoint['visited_length']:
+                    # Expanded after the checkpoint was written
+                    self.frontier.extend(fields[1:])
+                position += len(line)
+        self.frontier = [category for category in dict.fromkeys(self.frontier)
+                         if category not in self.visited]
+
+    @staticmethod
+    def _truncate_partial_line(filename, block_size=1 << 16):
+        # Drops a line left half-written by an interruption
+        if not os.path.exists(filename):
+            return 0
+        with open(filename, 'r+b') as file:
+            end = file.seek(0, os.SEEK_END)
+            length = end
+            while length > 0:
+                start = max(0, length - block_size)
+                file.seek(start)
+                newline = file.read(length - start).rfind(b'\n')
+                if newline != -1:
+                    length = start + newline + 1
+                    break
+                length = start
+            if length != end:
+                file.truncate(length)
+        return length
+
+    def checkpoint(self):
+        state = {'root': self.root,
+                 'frontier': self.frontier,
+                 'failed': self.failed,
+                 'visited_length': os.path.getsize(self.visited_filename)}
+        temporary = self.frontier_filename + '.tmp'
+        with open(temporary, 'w', encoding='utf-8') as writer:
+            json.dump(state, writer)
+            writer.flush()
+            os.fsync(writer.fileno())
+        os.replace(temporary, self.frontier_filename)
+
+    def done(self):
+        return not self.frontier and not self.failed
+
+    def run(self, max_categories=None):
+        """
+        Expands categories until the frontier is empty (or max_categories
+        have been expanded in this call). Returns True once the crawl is
+        complete; categories whose queries failed are retried on resume.
+
+        """
+        start = last_report = self.clock()
+        start_queries = self.taxonomy.num_queries
+        expanded = 0
+        with open(self.visited_filename, 'a', encoding='utf-8') as visited_log, \
+                open(self.instances_filename, 'a', encoding='utf-8') as instances:
+            while self.frontier and (max_categories is None
+                                     or expanded < max_categories):
+                category = self.frontier.pop()
+                if category in self.visited:
+                    continue
+                try:
+                    found = self.taxonomy.get_category_instances(category)
+                    subcategories = self.taxonomy.get_subcategories(category)
+                except QUERY_ERRORS as error:
+                    self.logger('Query failed for {}: {}'.format(category, error))
+                    self.failed.append(category)
+                    continue
+                instances.writelines('{}\t{}\n'.format(category, instance)
+                                     for instance in found)
+                instances.flush()
+                visited_log.write('\t'.join([category] + subcategories) + '\n')
+                visited_log.flush()
+                self.visited.add(category)
+                self.frontier.extend(subcategory for subcategory in subcategories
+                                     if subcategory not in self.visited)
+                expanded += 1
+                if expanded % self.checkpoint_every == 0:
+                    self.checkpoint()
+                now = self.clock()
+                if now - last_report >= self.report_every:
+                    self.report(expanded, self.taxonomy.num_queries - start_queries,
+                                now - start)
+                    last_report = now
+        self.checkpoint()
+        self.report(expanded, self.taxonomy.num_queries - start_queries,
+                    self.clock() - start)
+        return self.done()
+
+    def report(self, expanded, queries, elapsed):
+        elapsed = max(elapsed, 1e-9)
+        self.logger('{} categories expanded ({} this run), {} to go, {} failed; '
+                    '{:.1f} categories/s, {:.1f} queries/s'.format(
+                        len(self.visited), expanded, len(self.frontier),
+                        len(self.failed), expanded / elapsed, queries / elapsed))
+
+    def descendants(self):
+        """
+        Returns the set of instances found so far.
+
+        """
+        result = set()
+        if os.path.exists(self.instances_filename):
+            with open(self.instances_filename, 'r', encoding='utf-8') as reader:
+                for line in reader:
+                    result.add(line.rstrip('\n').split('\t', 1)[1])
+        return result
+
+
+def crawl_descendant_instances(taxonomy, root, directory, **kwargs):
+    """
+    Crawls (or resumes crawling) the descendant instances of root and
+    returns them once the crawl is complete.
+
+    """
+    crawl = DescendantCrawl(taxonomy, root, directory, **kwargs)
+    crawl.run()
+    return crawl.descendants()
+
+
+if __name__ == "__main__":
+    import sys
+    from dbpedia import DBpediaTaxonomy
+    if len(sys.argv) not in (2, 3):
+        sys.exit("usage: python crawl.py DIRECTORY [CATEGORY]")
+    taxonomy = DBpediaTaxonomy()
+    root = sys.argv[2] if len(sys.argv) == 3 else taxonomy.get_root()
+    crawl = DescendantCrawl(taxonomy, root, sys.argv[1])
+    if crawl.run():
+        print(len(crawl.descendants()), "descendant instances of", root)
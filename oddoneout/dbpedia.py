@@ -7,15 +7,54 @@ It is intended to access the structure of the DBPedia database
 so it can be ordered into an ontology.
 """
 
-from taxonomy import Taxonomy, Specificity
-from SPARQLWrapper import SPARQLWrapper, JSON
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from taxonomy import Taxonomy, Specificity, LRUCache
+from querycache import CacheMiss
+from sparqlclient import SparqlClient, SparqlError
 from collections import defaultdict
 
 
+ENDPOINT = "https://dbpedia.org/sparql"
+
+# Failures of a lookup: the endpoint gave up after its retries, or an
+# offline QueryCache has no answer
+QUERY_ERRORS = (SparqlError, CacheMiss)
+
+
+def sparql_literal(label):
+    # An English-language SPARQL string literal
+    return '"' + label.replace('\\', '\\\\').replace('"', '\\"') + '"@en'
+
+
 class DBpediaTaxonomy(Taxonomy):
     
-    def __init__(self):
-        self.specificity = Specificity()
+    def __init__(self, cache=None, batch_size=50, page_size=10000,
+                 client=None, result_cache_size=10000,
+                 specificity_cache_size=100000, specificity_filename=None):
+        """
+        client is the SparqlClient used to reach the endpoint; the default
+        one pools connections to DBpedia, keeps at most 4 requests in flight
+        and sends at most 5 per second.
+        
+        cache is an optional QueryCache; with it, query results persist
+        across runs, and a cache opened with offline=True replays a previous
+        run without contacting the endpoint.
+        
+        batch_size is the number of labels resolved by one query when
+        expanding ancestors, and page_size the number of result rows
+        fetched per query (the public endpoint caps it at 10000).
+        
+        The results of the last result_cache_size queries are also kept
+        in memory, and the specificities of specificity_cache_size
+        categories in a Specificity, warm-started from specificity_filename
+        if given.
+        
+        """
+        self.cache = cache
+        self.batch_size = batch_size
+        self.page_size = page_size
         self.db_prefixes = """
             PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
             PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
@@ -25,14 +64,49 @@ class DBpediaTaxonomy(Taxonomy):
             PREFIX dbr: <http://dbpedia.org/resource/>
             PREFIX dbc: <http://dbpedia.org/resource/Category>
         """
-        self.sparql = SPARQLWrapper("https://dbpedia.org/sparql")
-        self.ancestors = defaultdict(set)
+        self.client = client if client is not None else SparqlClient(ENDPOINT)
+        self.results = LRUCache(result_cache_size)
+        self.results_lock = threading.Lock()
+        self.num_queries = 0
+        self.num_cache_hits = 0
+        self.ancestors = dict()
+        # Parent categories (skos:broader) of every category expanded so far
+        self.broader = dict()
         self.descendants = defaultdict(set)
         # self.num_insts = len(self.get_descendant_instances(self.get_root()))
         # This takes at least 48 hours to fully calculate,
         # and monopolizes a lot of DBpedia's queryability.
         self.num_insts = 52793963
         # 52,793,963 is the number of wiki pages on Wikipedia as of 25 Feb 2021
+        # DBpediaDumpTaxonomy (dbpedia_dump.py) counts it exactly from the dumps
+        self.specificity = Specificity(self, specificity_cache_size,
+                                       specificity_filename)
+    
+    
+    def _run_query(self, query):
+        # Returns the JSON results of a query, from the caches if possible;
+        # num_queries counts the queries sent to the endpoint, and
+        # num_cache_hits those answered by either cache
+        with self.results_lock:
+            triples = self.results.get(query)
+            if triples is not None:
+                self.num_cache_hits += 1
+        if triples is not None:
+            return triples
+        if self.cache is not None:
+            triples = self.cache.get(query)
+        if triples is None:
+            with self.results_lock:
+                self.num_queries += 1
+            triples = self.client.query(query)
+            if self.cache is not None:
+                self.cache.put(query, triples)
+        else:
+            with self.results_lock:
+                self.num_cache_hits += 1
+        with self.results_lock:
+            self.results[query] = triples
+        return triples
     
     
     def is_instance(self, node_name):
@@ -43,14 +117,11 @@ class DBpediaTaxonomy(Taxonomy):
         }
         """
         #print ("Generated query:", query)
-        self.sparql.setQuery(query)
         try:
-            self.sparql.setReturnFormat(JSON)
-            results = self.sparql.query()
-            triples = results.convert()
+            triples = self._run_query(query)
             #print ("Result:", triples['boolean'])
             return triples['boolean']
-        except:
+        except QUERY_ERRORS:
             print ("Query failed; instance check failed for", node_name)
     
     
@@ -62,14 +133,11 @@ class DBpediaTaxonomy(Taxonomy):
         }
         """
         #print ("Generated query:", query)
-        self.sparql.setQuery(query)
         try:
-            self.sparql.setReturnFormat(JSON)
-            results = self.sparql.query()
-            triples = results.convert()
+            triples = self._run_query(query)
             #print ("Result:", triples['boolean'])
             return triples['boolean']
-        except:
+        except QUERY_ERRORS:
             print ("Query failed; category check failed for", node_name)
 
 
@@ -82,55 +150,160 @@ class DBpediaTaxonomy(Taxonomy):
 
 
     def get_ancestor_categories(self, node_name):
+        # Breadth-first: each level of categories is resolved with one
+        # query per batch_size labels instead of one query per label
         #print("Getting ancestors of", node_name)
+        root = self.get_root()
         if node_name in self.ancestors:
-            return self.ancestors[node_name]
-        elif node_name == self.get_root():
+            return set(self.ancestors[node_name])
+        elif node_name == root:
             return set()
-        else:
+        try:
             if self.is_category(node_name):
-                query = self.db_prefixes + """
-                SELECT ?label
-                WHERE {
-                    ?resource rdfs:label \"""" + node_name + """\"@en;
-                    skos:broader ?subject.
-                    ?subject rdfs:label ?label
-                }
-                """
+                parents = self.get_parent_categories([node_name], "skos:broader")
             else:
+                parents = self.get_parent_categories([node_name], "dct:subject")
+            ancestors = set()
+            frontier = parents[node_name]
+            while frontier:
+                ancestors |= frontier
+                to_expand = [label for label in frontier
+                             if label != root and label not in self.ancestors]
+                unknown = [label for label in to_expand if label not in self.broader]
+                self.broader.update(self.get_parent_categories(unknown, "skos:broader"))
+                next_frontier = set()
+                for label in frontier:
+                    if label in self.ancestors:
+                        ancestors |= self.ancestors[label]
+                for label in to_expand:
+                    next_frontier |= self.broader[label]
+                frontier = next_frontier - ancestors
+        except QUERY_ERRORS:
+            print ("Query failed for ancestors of", node_name)
+            return set()
+        
+        self.ancestors[node_name] = ancestors
+        return set(ancestors)
+
+
+    def prefetch(self, words):
+        """
+        Runs the instance checks and ancestor lookups of many words
+        concurrently, so that the queries of different words overlap instead
+        of running one after another; later calls for these words are then
+        answered from memory. The client's in-flight and rate limits still
+        apply.
+        
+        """
+        words = [word for word in dict.fromkeys(words)
+                 if word not in self.ancestors]
+        calls = [(lookup, word) for word in words
+                 for lookup in (self.is_instance, self.get_ancestor_categories)]
+        
+        async def fetch_all():
+            await asyncio.gather(*[asyncio.to_thread(lookup, word)
+                                   for (lookup, word) in calls])
+        
+        if not calls:
+            return
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            asyncio.run(fetch_all())
+            return
+        # Called from a running event loop (e.g. a notebook), where
+        # asyncio.run cannot start another: use a thread pool instead
+        with ThreadPoolExecutor() as executor:
+            for _ in executor.map(lambda call: call[0](call[1]), calls):
+                pass
+
+
+    def get_parent_categories(self, labels, predicate):
+        """
+        Returns a dict mapping each label to the set of labels of the
+        categories it is linked to by predicate (skos:broader for categories,
+        dct:subject for instances). The labels are resolved batch_size at a
+        time with a VALUES block, and each batch is fetched page_size rows
+        at a time.
+        
+        """
+        parents = {label: set() for label in labels}
+        for start in range(0, len(labels), self.batch_size):
+            values = " ".join(sparql_literal(label)
+                              for label in labels[start:start + self.batch_size])
+            offset = 0
+            while True:
                 query = self.db_prefixes + """
-                SELECT ?label
+                SELECT ?child ?label
                 WHERE {
-                    ?resource rdfs:label \"""" + node_name + """\"@en;
-                    dct:subject ?subject.
+                    VALUES ?child { """ + values + """ }
+                    ?resource rdfs:label ?child;
+                    """ + predicate + """ ?subject.
                     ?subject rdfs:label ?label
                 }
+                ORDER BY ?child ?label
+                LIMIT """ + str(self.page_size) + """
+                OFFSET """ + str(offset) + """
                 """
-            self.sparql.setQuery(query)
-            try:
-                self.sparql.setReturnFormat(JSON)
-                results = self.sparql.query()
-                triples = results.convert()
-                for res in triples['results']['bindings']:
-                    res_label = res['label']['value']
-                    if res_label not in self.ancestors[node_name]:
-                        for anc in self.get_ancestor_categories(res_label):
-                            if anc not in self.ancestors[node_name]:
-                                self.ancestors[node_name].add(anc)
-                        self.ancestors[node_name].add(res_label)
+                bindings = self._run_query(query)['results']['bindings']
+                for res in bindings:
+                    # The endpoint may return a child differently from how
+                    # it was asked (e.g. normalized): such rows are skipped
+                    child_parents = parents.get(res['child']['value'])
+                    if child_parents is not None:
+                        child_parents.add(res['label']['value'])
+                if len(bindings) < self.page_size:
+                    break
+                offset += self.page_size
+        return parents
+
+
+    def get_category_instances(self, category_name):
+        """
+        Returns the labels of the instances directly in a category, given
+        its name as in the category's IRI (with underscores).
+        Raises SparqlError or CacheMiss if the query fails.
+        
+        """
+        query = self.db_prefixes + """
+            SELECT ?label
+            WHERE {
+                ?resource dct:subject <http://dbpedia.org/resource/Category:""" + category_name + """>;
+                rdfs:label ?label
                 
-            except:
-                print ("Query failed for ancestors of", node_name)
-                self.ancestors.pop(node_name)
+                FILTER(lang(?label) = 'en')
+            }
+        """
+        triples = self._run_query(query)
+        return [trip['label']['value'] for trip in triples['results']['bindings']]
+
+
+    def get_subcategories(self, category_name):
+        """
+        Returns the names (with underscores) of the direct subcategories of
+        a category. Raises SparqlError or CacheMiss if the query fails.
         
-        return set(self.ancestors[node_name])
+        """
+        query = self.db_prefixes + """
+            SELECT ?label
+            WHERE {
+                ?resource skos:broader <http://dbpedia.org/resource/Category:""" + category_name + """>;
+                rdfs:label ?label
+                
+                FILTER(lang(?label) = 'en')
+            }
+        """
+        triples = self._run_query(query)
+        return [trip['label']['value'].replace(' ', '_').replace('"', '\"')
+                for trip in triples['results']['bindings']]
 
 
     def get_descendant_instances(self, node_name):
+        # Keeps all of its state in memory; crawl.py runs the same traversal
+        # with checkpoints, so that it can be resumed after an interruption
         category_name = node_name.replace(' ', '_').replace('"', '\"')
         categories = [category_name]
         visited_categories = set()
-        instances = []
         while(categories):
             cat = categories.pop()
             visited_categories.add(cat)
@@ -143,53 +316,23 @@ class DBpediaTaxonomy(Taxonomy):
                 self.descendants[cat] = set(cat)
                 self.descendants[category_name].add(cat)
             else:
-                instances = self.db_prefixes + """
-                    SELECT ?label
-                    WHERE {
-                        ?resource dct:subject <http://dbpedia.org/resource/Category:""" + cat + """>;
-                        rdfs:label ?label
-                        
-                        FILTER(lang(?label) = 'en')
-                    }
-                """
-                self.sparql.setQuery(instances)
                 try:
-                    self.sparql.setReturnFormat(JSON)
-                    results = self.sparql.query()
-                    triples = results.convert()
-                    for trip in triples['results']['bindings']:
-                        instance_name = trip['label']['value']
+                    for instance_name in self.get_category_instances(cat):
                         self.descendants[category_name].add(instance_name)
                     
-                except:
+                except QUERY_ERRORS:
                     print ("Query failed for instances of", cat)
                     if cat in self.descendants:
                         self.descendants.pop(cat)
         
-        
-                subcats = self.db_prefixes + """
-                    SELECT ?label
-                    WHERE {
-                        ?resource skos:broader <http://dbpedia.org/resource/Category:""" + cat + """>;
-                        rdfs:label ?label
-                        
-                        FILTER(lang(?label) = 'en')
-                    }
-                """
-                self.sparql.setQuery(subcats)
                 try:
-                    self.sparql.setReturnFormat(JSON)
-                    results = self.sparql.query()
-                    triples = results.convert()
-                    for trip in triples['results']['bindings']:
-                        subcategory_name = trip['label']['value'].replace(' ', '_').replace('"', '\"')
+                    for subcategory_name in self.get_subcategories(cat):
                         if subcategory_name not in visited_categories:
                             categories.append(subcategory_name)
                     
-                except:
+                except QUERY_ERRORS:
                     print ("Query failed for subcategories of ", cat)
                     if cat in self.descendants:
                         self.descendants.pop(cat)
         
         return self.descendants[category_name]
-        
\ No newline at end of file
@@ -0,0 +1,251 @@
+"""
+dbpedia_dump.py
+
+Implements the DBpediaDumpTaxonomy subclass of the Taxonomy class.
+
+It answers the same questions as DBpediaTaxonomy, but from local DBpedia
+dump files (N-Triples, or the line-based Turtle DBpedia publishes,
+optionally gzip- or bz2-compressed) instead of the SPARQL endpoint:
+    dct:subject     links articles to their categories (article_categories)
+    skos:broader    links categories to their parents (skos_categories)
+    rdfs:label      gives the English label of a resource (labels)
+Other triples are ignored. Resources without a label are named after their
+IRI, as DBpedia does ("Category:Pome_fruits" -> "Pome fruits").
+
+The triples are packed into the same compact CategoryGraph as the
+Wikipedia Category Graph: every resource is a page titled with its label,
+categories in namespace 14, and dct:subject and skos:broader become 'page'
+and 'subcat' links. The graph, with its descendant counts, can be written
+to a snapshot and memory-mapped on later runs.
+"""
+
+import bz2
+import gzip
+import re
+from urllib.parse import unquote
+from taxonomy import Specificity
+from categorygraph import CategoryGraphBuilder, load_category_graph
+from wikigraph import CategoryGraphTaxonomy, countDescendantInstances
+
+
+DCT_SUBJECT = 'http://purl.org/dc/terms/subject'
+SKOS_BROADER = 'http://www.w3.org/2004/02/skos/core#broader'
+RDFS_LABEL = 'http://www.w3.org/2000/01/rdf-schema#label'
+
+CATEGORY_PREFIX = 'Category:'
+ARTICLE_NAMESPACE = 0
+CATEGORY_NAMESPACE = 14
+
+TRIPLE = re.compile(r'<([^>]*)>\s+<([^>]*)>\s+'
+                    r'(?:<([^>]*)>|"((?:[^"\\]|\\.)*)"'
+                    r'(?:@([A-Za-z0-9-]+)|\^\^<[^>]*>)?)\s*\.\s*$')
+
+ESCAPE = re.compile(r'\\(u[0-9A-Fa-f]{4}|U[0-9A-Fa-f]{8}|.)')
+ESCAPES = {'t': '\t', 'b': '\b', 'n': '\n', 'r': '\r', 'f': '\f',
+           '"': '"', "'": "'", '\\': '\\'}
+
+
+def _unescape(match):
+    code = match.group(1)
+    if code[0] in 'uU' and len(code) > 1:
+        return chr(int(code[1:], 16))
+    return ESCAPES.get(code, code)
+
+
+def open_dump(filename):
+    if filename.endswith('.gz'):
+        return gzip.open(filename, 'rt', encoding='utf-8')
+    if filename.endswith('.bz2'):
+        return bz2.open(filename, 'rt', encoding='utf-8')
+    return open(filename, 'r', encoding='utf-8')
+
+
+def read_triples(filename, predicates):
+    """
+    Yields (subject, predicate, object) for the triples of a dump whose
+    predicate is in predicates. IRIs are returned without their brackets;
+    literals are unescaped, and only English or untagged ones are kept.
+
+    """
+    with open_dump(filename) as dump:
+        for line in dump:
+            if line.startswith('#') or not any(p in line for p in predicates):
+                continue
+            match = TRIPLE.match(line)
+            if match is None or match.group(2) not in predicates:
+                continue
+            subject, predicate, iri, literal, language = match.groups()
+            if iri is not None:
+                yield subject, predicate, iri
+            elif language is None or language.lower().startswith('en'):
+                yield subject, predicate, ESCAPE.sub(_unescape, literal)
+
+
+def label_from_iri(iri):
+    """
+    "http://dbpedia.org/resource/Category:Pome_fruits" -> "Pome fruits"
+
+    """
+    name = unquote(iri[iri.rfind('/') + 1:])
+    if name.startswith(CATEGORY_PREFIX):
+        name = name[len(CATEGORY_PREFIX):]
+    return name.replace('_', ' ')
+
+
+def buildDumpGraph(filenames):
+    """
+    Reads the dct:subject, skos:broader and rdfs:label triples of the given
+    dump files into a CategoryGraph.
+
+    The links are streamed into the builder's arrays as they are parsed,
+    with each resource interned by IRI as a page numbered in order of
+    appearance. The labels are read in a second pass over the files that
+    have any, keeping only those of the linked resources, and the titles
+    are then renamed from IRIs to labels.
+
+    """
+    builder = CategoryGraphBuilder()
+    namespaces = builder.page_namespaces
+
+    def resource_id(iri):
+        rid = builder.title_ids.get(iri)
+        if rid is None:
+            rid = len(builder.title_list)
+            builder.add_page(rid, ARTICLE_NAMESPACE, iri)
+        return rid
+
+    label_files = []
+    for filename in filenames:
+        has_labels = False
+        for subject, predicate, obj in read_triples(
+                filename, (DCT_SUBJECT, SKOS_BROADER, RDFS_LABEL)):
+            if predicate == RDFS_LABEL:
+                has_labels = True
+                continue
+            child = resource_id(subject)
+            namespaces[resource_id(obj)] = CATEGORY_NAMESPACE
+            if predicate == DCT_SUBJECT:
+                builder.add_link(child, obj, "'page'")
+            else:
+                namespaces[child] = CATEGORY_NAMESPACE
+                builder.add_link(child, obj, "'subcat'")
+        if has_labels:
+            label_files.append(filename)
+
+    labels = dict()
+    for filename in label_files:
+        for subject, _, label in read_triples(filename, (RDFS_LABEL,)):
+            if subject in builder.title_ids:
+                labels.setdefault(subject, label)
+    builder.relabel(lambda iri: labels.get(iri) or label_from_iri(iri))
+    return builder.build()
+
+
+class DBpediaDumpTaxonomy(CategoryGraphTaxonomy):
+
+    def __init__(self, filenames=(), snapshot_filename=None,
+                 approximate_counts=False, specificity_cache_size=100000,
+                 specificity_filename=None):
+        """
+        Loads the graph either from DBpedia dump files or from a snapshot
+        written by compileSnapshot. As in WCGTaxonomy, descendant counts are
+        computed once, when the dumps are loaded, and stored in the
+        snapshot, and specificities are cached in a Specificity of
+        specificity_cache_size entries, warm-started from
+        specificity_filename if given.
+
+        """
+        if snapshot_filename is not None:
+            self.graph = load_category_graph(snapshot_filename)
+        else:
+            self.graph = buildDumpGraph(filenames)
+        if self.graph.descendant_counts is None:
+            self.graph.descendant_counts = countDescendantInstances(
+                self.graph, approximate_counts)
+        self.num_insts = self.graph.meta.get('num_instances')
+        if self.num_insts is None:
+            self.num_insts = sum(1 for title_id in range(self.graph.num_titles())
+                                 if self._instance_pages(title_id))
+        self.specificity = Specificity(self, specificity_cache_size,
+                                       specificity_filename)
+
+    def _pages(self, title_id, namespace):
+        graph = self.graph
+        return [page for page in graph.pages_with_title(title_id)
+                if graph.page_namespaces[page] == namespace]
+
+    def _instance_pages(self, title_id):
+        # Articles with this label that belong to at least one category
+        return [page for page in self._pages(title_id, ARTICLE_NAMESPACE)
+                if len(self.graph.parents(page)) > 0]
+
+    def is_instance(self, node_name):
+        title_id = self.graph.title_id(node_name)
+        return title_id is not None and len(self._instance_pages(title_id)) > 0
+
+    def is_category(self, node_name):
+        title_id = self.graph.title_id(node_name)
+        return (title_id is not None
+                and (self.graph.is_category_label(title_id)
+                     or len(self._pages(title_id, CATEGORY_NAMESPACE)) > 0))
+
+    def get_root(self):
+        return "Contents"
+
+    def num_instances(self):
+        return self.num_insts
+
+    def get_ancestor_categories(self, node_name):
+        # Same walk as DBpediaTaxonomy: skos:broader from a category,
+        # dct:subject from an instance, and the root is not expanded
+        graph = self.graph
+        title_id = graph.title_id(node_name)
+        if title_id is None or node_name == self.get_root():
+            return set()
+        root = graph.title_id(self.get_root())
+        if self.is_category(node_name):
+            frontier = self._pages(title_id, CATEGORY_NAMESPACE)
+        else:
+            frontier = self._pages(title_id, ARTICLE_NAMESPACE)
+        ancestors = set()
+        while frontier:
+            next_frontier = []
+            for page in frontier:
+                for category in graph.parents(page):
+                    if category in ancestors:
+                        continue
+                    ancestors.add(category)
+                    if category != root:
+                        next_frontier.extend(
+                            self._pages(category, CATEGORY_NAMESPACE))
+            frontier = next_frontier
+        return {graph.title(category) for category in ancestors}
+
+
+def compileSnapshot(filenames, snapshot_filename, approximate_counts=False):
+    """
+    Parses the dump files once and writes the resulting graph, with its
+    precomputed counts, to a snapshot file that
+    DBpediaDumpTaxonomy(snapshot_filename=...) can load in seconds.
+
+    e.g. compileSnapshot(["article_categories_en.ttl.bz2",
+                          "skos_categories_en.ttl.bz2", "labels_en.ttl.bz2"],
+                         "dbpedia.wcg")
+
+    """
+    taxonomy = DBpediaDumpTaxonomy(filenames,
+                                   approximate_counts=approximate_counts)
+    taxonomy.graph.save(snapshot_filename,
+                        {'root': taxonomy.get_root(),
+                         'num_instances': taxonomy.num_instances(),
+                         'approximate_counts': approximate_counts})
+
+
+if __name__ == "__main__":
+    import sys
+    args = [arg for arg in sys.argv[1:] if arg != "--approximate"]
+    if len(args) < 3 or args[0] != "compile":
+        sys.exit("usage: python dbpedia_dump.py compile [--approximate] "
+                 "DUMP [DUMP ...] SNAPSHOT")
+    compileSnapshot(args[1:-1], args[-1],
+                    approximate_counts="--approximate" in sys.argv)
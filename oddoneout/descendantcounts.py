@@ -0,0 +1,228 @@
+"""
+descendantcounts.py
+
+Computes, in a single bottom-up pass, the number of distinct descendant
+instances of every node of a taxonomy graph (the "specificity" of a
+category), so that Specificity lookups do not have to materialize
+descendant sets.
+
+The graph may contain cycles, as the Wikipedia Category Graph does: the
+nodes are first grouped into strongly connected components, which are then
+processed children-first. All members of a component share the same
+descendants.
+
+Exact counting keeps one set of instance ids per component and releases it
+once every parent component has consumed it. At enwiki scale the sets of the
+large categories are too big to keep, so there is also an approximate mode:
+a component keeps an exact set until it holds more than 2**precision ids,
+and a HyperLogLog sketch with 2**precision registers after that. Counts
+below that threshold are exact; larger counts have a relative standard error
+of about 1.04 / sqrt(2**precision), i.e. roughly 1.6% for the default
+precision of 12, and every sketch costs 4 KB.
+"""
+
+import math
+from array import array
+from categorygraph import csr
+
+
+DEFAULT_PRECISION = 12
+
+MASK64 = (1 << 64) - 1
+
+
+def strongly_connected_components(num_nodes, children_of):
+    """
+    Iterative version of Tarjan's algorithm. Nodes are the integers
+    0..num_nodes-1 and children_of(node) returns an iterable of nodes.
+
+    Returns (component, num_components), where component[node] is the
+    component of each node. Components are numbered in the order they are
+    completed, so every component is numbered after all the components it
+    can reach, i.e. children come first.
+
+    """
+    index = array('i', [-1]) * num_nodes
+    lowlink = array('i', [0]) * num_nodes
+    on_stack = bytearray(num_nodes)
+    component = array('i', [-1]) * num_nodes
+    stack = []
+    counter = 0
+    num_components = 0
+    for root in range(num_nodes):
+        if index[root] != -1:
+            continue
+        index[root] = lowlink[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack[root] = 1
+        work = [(root, iter(children_of(root)))]
+        while work:
+            node, children = work[-1]
+            for child in children:
+                if index[child] == -1:
+                    index[child] = lowlink[child] = counter
+                    counter += 1
+                    stack.append(child)
+                    on_stack[child] = 1
+                    work.append((child, iter(children_of(child))))
+                    break
+                elif on_stack[child] and index[child] < lowlink[node]:
+                    lowlink[node] = index[child]
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    if lowlink[node] < lowlink[parent]:
+                        lowlink[parent] = lowlink[node]
+                if lowlink[node] == index[node]:
+                    while True:
+                        member = stack.pop()
+                        on_stack[member] = 0
+                        component[member] = num_components
+                        if member == node:
+                            break
+                    num_components += 1
+    return component, num_components
+
+
+def _mix64(x):
+    """
+    The splitmix64 finalizer: a cheap, well-distributed 64-bit hash of an int.
+
+    """
+    x = (x + 0x9E3779B97F4A7C15) & MASK64
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & MASK64
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & MASK64
+    return x ^ (x >> 31)
+
+
+class HyperLogLog:
+    """
+    HyperLogLog cardinality sketch over integer ids, with 2**precision
+    one-byte registers. Sketches with the same precision can be merged.
+
+    """
+
+    def __init__(self, precision=DEFAULT_PRECISION):
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    def add(self, item):
+        h = _mix64(item)
+        bucket = h >> (64 - self.precision)
+        rest = h & ((1 << (64 - self.precision)) - 1)
+        rank = 64 - self.precision - rest.bit_length() + 1
+        if rank > self.registers[bucket]:
+            self.registers[bucket] = rank
+
+    def update(self, other):
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def __len__(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros > 0:
+            # Small range correction: linear counting
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+
+class _Sketch:
+    """
+    Exact set of ids that turns into a HyperLogLog once it grows past
+    2**precision ids.
+
+    """
+
+    def __init__(self, precision):
+        self.precision = precision
+        self.items = set()
+        self.hll = None
+
+    def _spill(self):
+        self.hll = HyperLogLog(self.precision)
+        for item in self.items:
+            self.hll.add(item)
+        self.items = None
+
+    def add_all(self, items):
+        if self.hll is None:
+            self.items.update(items)
+            if len(self.items) > 1 << self.precision:
+                self._spill()
+        else:
+            for item in items:
+                self.hll.add(item)
+
+    def update(self, other):
+        if other.hll is None:
+            self.add_all(other.items)
+        else:
+            if self.hll is None:
+                self._spill()
+            self.hll.update(other.hll)
+
+    def __len__(self):
+        return len(self.items) if self.hll is None else len(self.hll)
+
+
+def descendant_instance_counts(num_nodes, children_of, instances_of,
+                               approximate=False, precision=DEFAULT_PRECISION):
+    """
+    Counts the distinct instances below every node of a graph whose nodes
+    are the integers 0..num_nodes-1. children_of(node) returns the child
+    nodes and instances_of(node) the integer ids of the instances directly
+    attached to the node. The descendant instances of a node are its own
+    instances plus those of every node reachable through children_of.
+
+    Returns an array of counts indexed by node. With approximate=True,
+    counts above 2**precision are HyperLogLog estimates (see module notes).
+
+    """
+    component, num_components = strongly_connected_components(num_nodes,
+                                                              children_of)
+    member_offsets, member_nodes = csr(num_components, component,
+                                       range(num_nodes))
+
+    def members(c):
+        return member_nodes[member_offsets[c]:member_offsets[c + 1]]
+
+    def child_components(c):
+        result = set()
+        for node in members(c):
+            for child in children_of(node):
+                result.add(component[child])
+        result.discard(c)
+        return result
+
+    # Number of parent components still to consume each component's result
+    pending_parents = array('i', [0]) * num_components
+    for c in range(num_components):
+        for child in child_components(c):
+            pending_parents[child] += 1
+
+    counts = array('q', [0]) * num_nodes
+    results = [None] * num_components
+    for c in range(num_components):
+        if approximate:
+            result = _Sketch(precision)
+            for node in members(c):
+                result.add_all(instances_of(node))
+        else:
+            result = set()
+            for node in members(c):
+                result.update(instances_of(node))
+        for child in child_components(c):
+            result.update(results[child])
+            pending_parents[child] -= 1
+            if pending_parents[child] == 0:
+                results[child] = None
+        size = len(result)
+        for node in members(c):
+            counts[node] = size
+        if pending_parents[c] > 0:
+            results[c] = result
+    return counts
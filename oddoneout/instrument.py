@@ -0,0 +1,342 @@
+"""
+instrument.py
+
+Opt-in instrumentation of the taxonomy and solver hot paths.
+
+While enabled, the functions and methods listed in TARGETS are replaced by
+wrappers that record, per function, the number of calls, the cumulative
+and self (excluding instrumented callees) time, the instrumented callers,
+and for cached lookups the number of hits and misses. Graph traversal
+work shows up as the calls of the node expansion methods (e.g.
+CategoryGraph.parents), and SPARQL round-trips as the calls of
+SparqlClient._request.
+
+Disabled, nothing is wrapped, so there is no overhead at all: enable()
+patches the targets in place and disable() puts the originals back.
+Only the calls made in this process are recorded, not those made in the
+worker processes of solve_puzzles(..., workers=N).
+
+e.g.
+    with instrument.recording(report_filename="run.txt",
+                              stats_filename="run.prof") as recorder:
+        solve_puzzles(puzzles, TaxonomySimilarity(taxonomy))
+    print(recorder.report())
+
+run.prof can be read with pstats (python -m pstats run.prof) or any
+cProfile viewer.
+"""
+
+import functools
+import importlib
+import marshal
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+
+def _lru_hit(cache, key, *args):
+    return key in cache.data
+
+
+def _specificity_hit(specificity, category):
+    return category in specificity.cache
+
+
+# (module, attribute, hit predicate): the attribute is a function or a
+# Class.method; the predicate, called with the arguments of a call before
+# it runs, tells whether the call is a cache hit
+TARGETS = [
+    ('taxonomy', 'LRUCache.get', _lru_hit),
+    ('taxonomy', 'Specificity.__call__', _specificity_hit),
+    ('taxonomy', 'lowest_common_ancestor', None),
+    ('taxonomy', 'lowest_common_ancestor_from_ancestors', None),
+    ('taxonomy', 'closure', None),
+    ('taxonomy', 'GraphTaxonomy.get_ancestor_categories', None),
+    ('taxonomy', 'GraphTaxonomy.get_descendant_instances', None),
+    ('taxonomy', 'GraphTaxonomy.num_descendant_instances', None),
+    ('taxonomy', 'GraphTaxonomy.get_parents', None),
+    ('taxonomy', 'GraphTaxonomy.get_children', None),
+    ('categorygraph', 'CategoryGraph.parents', None),
+    ('categorygraph', 'CategoryGraph.members', None),
+    ('wikigraph', 'WCGTaxonomy.is_instance', None),
+    ('wikigraph', 'WCGTaxonomy.is_category', None),
+    ('wikigraph', 'WCGTaxonomy.get_ancestor_categories', None),
+    ('wikigraph', 'CategoryGraphTaxonomy.get_descendant_instances', None),
+    ('wikigraph', 'CategoryGraphTaxonomy.num_descendant_instances', None),
+    ('wikigraph', 'buildCategoryGraph', None),
+    ('wikigraph', 'countDescendantInstances', None),
+    ('wordnet', 'WordnetTaxonomy.is_instance', None),
+    ('wordnet', 'WordnetTaxonomy.is_category', None),
+    ('wordnet', 'WordnetTaxonomy.get_ancestor_categories', None),
+    ('wordnet', 'WordnetTaxonomy.get_descendant_instances', None),
+    ('wordnet', 'WordnetTaxonomy.num_descendant_instances', None),
+    ('wordnet', 'WordnetTaxonomy._parents', None),
+    ('wordnet', 'WordnetTaxonomy._children', None),
+    ('dbpedia', 'DBpediaTaxonomy.is_instance', None),
+    ('dbpedia', 'DBpediaTaxonomy.is_category', None),
+    ('dbpedia', 'DBpediaTaxonomy.get_ancestor_categories', None),
+    ('dbpedia', 'DBpediaTaxonomy.get_descendant_instances', None),
+    ('dbpedia', 'DBpediaTaxonomy._run_query', None),
+    ('sparqlclient', 'SparqlClient._request', None),
+    ('lca', 'BitsetLCA.get_ancestor_mask', None),
+    ('lca', 'BitsetLCA.lowest_common_ancestor_from_masks', None),
+    ('solver', 'TaxonomySimilarity.__call__', None),
+    ('solver', 'TaxonomySimilarity.score_choices', None),
+    ('solver', 'solve_puzzle', None),
+]
+
+
+class FunctionStats:
+
+    def __init__(self, label):
+        self.label = label
+        self.calls = 0
+        self.total_time = 0.0
+        self.self_time = 0.0
+        self.hits = 0
+        self.misses = 0
+        # caller key -> [calls, self time, total time]
+        self.callers = dict()
+
+
+class Recorder:
+    """
+    Collects the statistics of the instrumented calls.
+
+    """
+
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.stats = dict()
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.start_time = clock()
+        self.end_time = None
+
+    def _stack(self):
+        stack = getattr(self.local, 'stack', None)
+        if stack is None:
+            stack = self.local.stack = []
+        return stack
+
+    def wrap(self, function, key, label, hit):
+        recorder = self
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            stack = recorder._stack()
+            is_hit = hit(*args, **kwargs) if hit is not None else None
+            caller = stack[-1][0] if stack else None
+            frame = [key, 0.0]
+            stack.append(frame)
+            start = recorder.clock()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                elapsed = recorder.clock() - start
+                stack.pop()
+                if stack:
+                    stack[-1][1] += elapsed
+                recorder.record(key, label, caller, elapsed,
+                                elapsed - frame[1], is_hit)
+
+        wrapper.__instrumented__ = function
+        return wrapper
+
+    def record(self, key, label, caller, elapsed, self_time, is_hit=None):
+        with self.lock:
+            stats = self.stats.get(key)
+            if stats is None:
+                stats = self.stats[key] = FunctionStats(label)
+            stats.calls += 1
+            stats.total_time += elapsed
+            stats.self_time += self_time
+            if is_hit is True:
+                stats.hits += 1
+            elif is_hit is False:
+                stats.misses += 1
+            if caller is not None:
+                calls = stats.callers.setdefault(caller, [0, 0.0, 0.0])
+                calls[0] += 1
+                calls[1] += self_time
+                calls[2] += elapsed
+
+    def calls(self, label):
+        """
+        The number of recorded calls of a target, by attribute name
+        (e.g. 'WCGTaxonomy.get_ancestor_categories').
+
+        """
+        return sum(stats.calls for stats in self.stats.values()
+                   if stats.label == label)
+
+    def as_dict(self):
+        """
+        Returns {label: {'calls', 'total_seconds', 'self_seconds', and for
+        cached lookups 'hits', 'misses', 'hit_rate'}}.
+
+        """
+        result = dict()
+        with self.lock:
+            for stats in self.stats.values():
+                entry = {'calls': stats.calls,
+                         'total_seconds': stats.total_time,
+                         'self_seconds': stats.self_time}
+                if stats.hits or stats.misses:
+                    entry.update(hits=stats.hits, misses=stats.misses,
+                                 hit_rate=stats.hits / (stats.hits + stats.misses))
+                result[stats.label] = entry
+        return result
+
+    def report(self, per='solve_puzzle'):
+        """
+        Returns a text report of the calls, by decreasing total time, with
+        the number of calls per call of the function named by per (by
+        default, per puzzle solved) and the cache hit rates.
+
+        """
+        entries = self.as_dict()
+        runs = entries.get(per, {}).get('calls', 0)
+        end = self.end_time if self.end_time is not None else self.clock()
+        lines = ['{} instrumented functions, {:.3f}s wall time'.format(
+                     len(entries), end - self.start_time),
+                 '{:>10} {:>10} {:>10} {:>10} {:>11} {:>8}  {}'.format(
+                     'calls', 'per ' + per[:6], 'total ms', 'self ms',
+                     'mean us', 'hit rate', 'function')]
+        for label, entry in sorted(entries.items(),
+                                   key=lambda item: -item[1]['total_seconds']):
+            hit_rate = entry.get('hit_rate')
+            lines.append('{:>10} {:>10} {:>10.1f} {:>10.1f} {:>11.1f} {:>8}  {}'.format(
+                entry['calls'],
+                '{:.1f}'.format(entry['calls'] / runs) if runs else '-',
+                1000 * entry['total_seconds'], 1000 * entry['self_seconds'],
+                1e6 * entry['total_seconds'] / entry['calls'],
+                '{:.1%}'.format(hit_rate) if hit_rate is not None else '-',
+                label))
+        return '\n'.join(lines)
+
+    def pstats(self):
+        """
+        The statistics in the format of cProfile / pstats:
+        {(filename, line, name): (calls, calls, self time, total time, callers)}
+
+        """
+        with self.lock:
+            return {key: (stats.calls, stats.calls, stats.self_time,
+                          stats.total_time,
+                          {caller: (calls, calls, self_time, total_time)
+                           for caller, (calls, self_time, total_time)
+                           in stats.callers.items()})
+                    for key, stats in self.stats.items()}
+
+    def dump_stats(self, filename):
+        """
+        Writes the statistics to a file that pstats.Stats(filename) loads.
+
+        """
+        with open(filename, 'wb') as writer:
+            marshal.dump(self.pstats(), writer)
+
+
+# The enabled Recorder, and the (owner, attribute, original) of every
+# patched target, for disable()
+_recorder = None
+_patched = []
+
+
+def _function_key(function, label):
+    code = getattr(function, '__code__', None)
+    if code is None:
+        return ('~', 0, label)
+    return (code.co_filename, code.co_firstlineno, label)
+
+
+def _resolve(module_name, attribute):
+    # Returns (owner, name, original), or None if the target is unavailable
+    try:
+        owner = importlib.import_module(module_name)
+    except ImportError:
+        return None
+    *path, name = attribute.split('.')
+    for part in path:
+        owner = getattr(owner, part, None)
+        if owner is None:
+            return None
+    original = owner.__dict__.get(name) if isinstance(owner, type) \
+        else getattr(owner, name, None)
+    if original is None or not callable(original):
+        return None
+    return owner, name, original
+
+
+def enabled():
+    return _recorder is not None
+
+
+def enable(recorder=None, targets=None):
+    """
+    Starts recording the calls of the targets (by default, TARGETS) into
+    recorder (by default, a new Recorder), which is returned.
+    Raises RuntimeError if instrumentation is already enabled.
+
+    """
+    global _recorder
+    if _recorder is not None:
+        raise RuntimeError('instrumentation is already enabled')
+    _recorder = recorder if recorder is not None else Recorder()
+    for module_name, attribute, hit in (targets if targets is not None else TARGETS):
+        resolved = _resolve(module_name, attribute)
+        if resolved is None:
+            continue
+        owner, name, original = resolved
+        wrapper = _recorder.wrap(original, _function_key(original, attribute),
+                                 attribute, hit)
+        if isinstance(owner, type):
+            setattr(owner, name, wrapper)
+            _patched.append((owner, name, original))
+        else:
+            # Module functions are also bound by name in the modules that
+            # imported them (from taxonomy import lowest_common_ancestor)
+            for module in list(sys.modules.values()):
+                if getattr(module, name, None) is original:
+                    setattr(module, name, wrapper)
+                    _patched.append((module, name, original))
+    return _recorder
+
+
+def disable():
+    """
+    Restores the original functions and returns the Recorder, or None if
+    instrumentation was not enabled.
+
+    """
+    global _recorder
+    recorder = _recorder
+    while _patched:
+        owner, name, original = _patched.pop()
+        setattr(owner, name, original)
+    _recorder = None
+    if recorder is not None:
+        recorder.end_time = recorder.clock()
+    return recorder
+
+
+@contextmanager
+def recording(report_filename=None, stats_filename=None, targets=None):
+    """
+    Instruments the calls made in a with block, and yields the Recorder.
+    On exit, writes the text report to report_filename and the pstats
+    file to stats_filename, if given.
+
+    """
+    recorder = enable(targets=targets)
+    try:
+        yield recorder
+    finally:
+        disable()
+        if report_filename is not None:
+            with open(report_filename, 'w') as writer:
+                writer.write(recorder.report() + '\n')
+        if stats_filename is not None:
+            recorder.dump_stats(stats_filename)
@@ -0,0 +1,105 @@
+"""
+lca.py
+
+A bitset engine for lowest_common_ancestor.
+
+Every category of the taxonomy gets a rank, in ascending order of
+(specificity, name), which is the order in which lowest_common_ancestor
+sorts candidate ancestors. A word's ancestor closure is then a bitmap with
+one bit per ranked category, held in a Python int, so the common ancestors
+of a set of words are a bitwise AND of their bitmaps, the target's
+ancestors are removed with AND NOT, and the lowest common ancestor is the
+lowest set bit.
+
+Ranking every category up front costs a specificity for each, which for a
+taxonomy without precomputed counts (e.g. WordnetTaxonomy without an
+index) means walking the descendants of every category. So unless the
+categories are given, they are ranked lazily: each gets the next bit when
+it first turns up among the ancestors of a word, and the lowest common
+ancestor is the (specificity, name) minimum of the bits left, of which
+there are few.
+"""
+
+from taxonomy import LRUCache, lowest_common_ancestor, specificity
+
+
+class BitsetLCA:
+
+    def __init__(self, taxonomy, categories=None, cache_size=100000):
+        """
+        Ranks the given categories by specificity, or, by default, every
+        ancestor category of the words looked up, in the order they are
+        first seen. Ancestor bitmaps are computed on demand and kept in an
+        LRU cache of cache_size words.
+
+        """
+        self.taxonomy = taxonomy
+        # With the categories given, ranks are in (specificity, name) order
+        self.ordered = categories is not None
+        ranked = sorted((specificity(taxonomy, category), category)
+                        for category in categories or ())
+        self.specificities = [spec for (spec, _) in ranked]
+        self.categories = [category for (_, category) in ranked]
+        self.ranks = {category: rank
+                      for (rank, category) in enumerate(self.categories)}
+        self.mask_cache = LRUCache(cache_size)
+
+    def get_ancestor_mask(self, word):
+        """
+        Returns the bitmap of the ancestor categories of a word.
+        Raises KeyError if one of them is not among the given categories.
+
+        """
+        mask = self.mask_cache.get(word)
+        if mask is None:
+            ranks = [self.rank(category)
+                     for category in self.taxonomy.get_ancestor_categories(word)]
+            bits = bytearray(max(ranks, default=0) // 8 + 1)
+            for rank in ranks:
+                bits[rank >> 3] |= 1 << (rank & 7)
+            mask = int.from_bytes(bits, 'little')
+            self.mask_cache[word] = mask
+        return mask
+
+    def rank(self, category):
+        rank = self.ranks.get(category)
+        if rank is None:
+            if self.ordered:
+                raise KeyError(category)
+            rank = self.ranks[category] = len(self.categories)
+            self.specificities.append(specificity(self.taxonomy, category))
+            self.categories.append(category)
+        return rank
+
+    def lowest_common_ancestor_from_masks(self, masks, target_mask):
+        """
+        Same result as lowest_common_ancestor, given the ancestor bitmaps
+        of the words and of the target.
+
+        """
+        common = masks[0]
+        for mask in masks[1:]:
+            common &= mask
+        common &= ~target_mask
+        if common == 0:
+            return self.taxonomy.num_instances(), self.taxonomy.get_root()
+        if self.ordered:
+            rank = (common & -common).bit_length() - 1
+            return self.specificities[rank], self.categories[rank]
+        best = None
+        while common:
+            low = common & -common
+            rank = low.bit_length() - 1
+            if best is None or (self.specificities[rank], self.categories[rank]) < best:
+                best = (self.specificities[rank], self.categories[rank])
+            common ^= low
+        return best
+
+    def lowest_common_ancestor(self, words, target):
+        try:
+            masks = [self.get_ancestor_mask(word) for word in words]
+            target_mask = self.get_ancestor_mask(target)
+        except KeyError:
+            # An ancestor outside the ranked categories: use the set version
+            return lowest_common_ancestor(self.taxonomy, words, target)
+        return self.lowest_common_ancestor_from_masks(masks, target_mask)
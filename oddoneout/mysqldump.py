@@ -0,0 +1,82 @@
+"""
+mysqldump.py
+
+Streaming reader for the gzip-compressed MySQL dumps of Wikipedia tables
+(e.g. enwiki-20201020-page.sql.gz), so that rows can be fed straight into
+a CategoryGraphBuilder without writing intermediate text files.
+
+The dump is read line by line: the CREATE TABLE statement gives the
+column positions, and every INSERT INTO ... VALUES (...),(...); statement
+is split into rows. Values are returned as their SQL literal text, quotes
+and escapes included (e.g. 'Dog_breeds', 14, NULL), which is the form the
+text files extracted by download.py hold.
+"""
+
+import gzip
+import re
+
+
+CREATE_TABLE = re.compile(r'CREATE TABLE `([^`]*)`')
+COLUMN = re.compile(r'\s*`([^`]*)`\s')
+INSERT = re.compile(r'INSERT INTO `([^`]*)` VALUES ')
+ROW = re.compile(r"\(((?:'(?:[^'\\]|\\.)*'|[^'()])*)\)")
+FIELD = re.compile(r"'(?:[^'\\]|\\.)*'|[^,]+")
+
+
+def open_dump(filename):
+    if filename.endswith('.gz'):
+        return gzip.open(filename, 'rt', encoding='utf-8', errors='surrogateescape')
+    return open(filename, 'r', encoding='utf-8', errors='surrogateescape')
+
+
+def _statements(lines):
+    # Yields complete statements; mysqldump writes each INSERT on one line,
+    # but a statement split over several lines is joined back together
+    pending = []
+    for line in lines:
+        if pending:
+            pending.append(line)
+            if line.rstrip().endswith(';'):
+                yield ''.join(pending)
+                pending = []
+        elif line.startswith('INSERT INTO') and not line.rstrip().endswith(';'):
+            pending.append(line)
+        else:
+            yield line
+
+
+def read_rows(filename, columns):
+    """
+    Yields, for every row of the table dumped in filename, the tuple of the
+    values of the given columns (by name), as SQL literal text.
+    Raises ValueError if a column is not in the table.
+
+    """
+    with open_dump(filename) as dump:
+        table = None
+        names = []
+        positions = None
+        for statement in _statements(dump):
+            if table is None:
+                match = CREATE_TABLE.match(statement)
+                if match is not None:
+                    table = match.group(1)
+                continue
+            if positions is None:
+                match = COLUMN.match(statement)
+                if match is not None:
+                    names.append(match.group(1))
+                    continue
+                if statement.startswith(')'):
+                    missing = [c for c in columns if c not in names]
+                    if missing:
+                        raise ValueError('{} has no column {} in {}'.format(
+                            table, ', '.join(missing), filename))
+                    positions = [names.index(c) for c in columns]
+                continue
+            match = INSERT.match(statement)
+            if match is None or match.group(1) != table:
+                continue
+            for row in ROW.finditer(statement, match.end()):
+                fields = FIELD.findall(row.group(1))
+                yield tuple(fields[p] for p in positions)
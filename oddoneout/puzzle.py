@@ -1,4 +1,17 @@
+"""
+puzzle.py
+
+Odd-one-out puzzles: reading the puzzle sets of the data directory, and
+generating puzzles from a map of categories to examples.
+
+The puzzle sets are read lazily, from paths relative to this file rather
+than to the working directory: iter_puzzle_set streams the puzzles of a
+set, and the module attributes common1_puzzles, common2_puzzles,
+proper1_puzzles and proper2_puzzles load a set as a list on first use.
+"""
+
 import codecs
+import os
 import random
 
 
@@ -15,16 +28,55 @@ class OddOneOutPuzzle:
         return str([self.oddone] + self.wordset)
 
 
+DATA_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                              '..', 'data')
+# The puzzle sets, by name, as paths relative to DATA_DIRECTORY
+PUZZLE_SETS = {'common1': os.path.join('anomia', 'common1.tsv.txt'),
+               'common2': os.path.join('anomia', 'common2.tsv.txt'),
+               'proper1': os.path.join('anomia', 'proper1.tsv.txt'),
+               'proper2': os.path.join('anomia', 'proper2.tsv.txt')}
+
+
 def read_ooo_puzzles_from_tsv(filename):
+    """
+    Yields the puzzles of a file of lines
+        CATEGORY <tab> ODD-MAN <tab> ANSWER1 <tab> ANSWER2 ...
+    one at a time, skipping blank lines.
+
+    """
     with codecs.open(filename, 'r', encoding='UTF-8') as reader:
         for line in reader:
             fields = line.split('\t')
+            if len(fields) < 3:
+                continue
             yield OddOneOutPuzzle(fields[1],
                                   [x.strip() for x in fields[2:]],
                                   fields[0])
 
 
-common2_puzzles = list(read_ooo_puzzles_from_tsv("../data/anomia/common2.tsv.txt"))
+def puzzle_set_filename(name):
+    if name not in PUZZLE_SETS:
+        raise ValueError('unknown puzzle set: {}'.format(name))
+    return os.path.join(DATA_DIRECTORY, PUZZLE_SETS[name])
+
+
+def iter_puzzle_set(name):
+    """
+    Yields the puzzles of a set of PUZZLE_SETS (e.g. 'common2'), reading
+    the file as it goes.
+
+    """
+    return read_ooo_puzzles_from_tsv(puzzle_set_filename(name))
+
+
+def __getattr__(name):
+    # common2_puzzles, etc.: read on first use, then kept in the module
+    set_name = name[:-len('_puzzles')] if name.endswith('_puzzles') else None
+    if set_name not in PUZZLE_SETS:
+        raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
+    puzzles = list(iter_puzzle_set(set_name))
+    globals()[name] = puzzles
+    return puzzles
 
 
 def read_category_map_from_csv(csv_filename):
@@ -40,33 +92,81 @@ def read_category_map_from_csv(csv_filename):
     return category_map
 
 
-def generate_puzzle(category_map, category):
+class PuzzleGenerator:
+
+    def __init__(self, category_map, seed=None, num_examples=4):
+        """
+        Generates odd-man-out puzzles from a dictionary that maps categories
+        to examples, as lists [category, oddman, example1, ...] of at most
+        num_examples examples. The categories and examples are copied once,
+        so that each puzzle costs O(num_examples) whatever the number of
+        categories, and the same seed gives the same puzzles. Without a
+        seed, the random module's shared state is used, which random.seed
+        sets.
+
+        """
+        self.random = random if seed is None else random.Random(seed)
+        self.num_examples = num_examples
+        self.categories = list(category_map)
+        self.names = [str(category) for category in self.categories]
+        self.positions = {category: i for (i, category) in enumerate(self.categories)}
+        self.examples = [tuple(category_map[category]) for category in self.categories]
+
+    def generate(self, category):
+        """
+        Generates a puzzle whose theme is the given category; the odd man
+        is an example of another category, drawn uniformly.
+
+        """
+        if len(self.categories) < 2:
+            raise ValueError('puzzles need at least two categories')
+        position = self.positions[category]
+        other = self.random.randrange(len(self.categories) - 1)
+        if other >= position:
+            other += 1
+        examples = self.examples[position]
+        oddman = self.random.choice(self.examples[other])
+        chosen = self.random.sample(examples, min(self.num_examples, len(examples)))
+        return [self.names[position], str(oddman)] + chosen
+
+    def puzzles(self, num_puzzles_per_category=None):
+        """
+        Yields num_puzzles_per_category rounds of one puzzle per category,
+        or rounds without end if it is None.
+
+        """
+        rounds = 0
+        while num_puzzles_per_category is None or rounds < num_puzzles_per_category:
+            for category in self.categories:
+                yield self.generate(category)
+            rounds += 1
+
+
+def generate_puzzle(category_map, category, seed=None):
     """
     Given a dictionary that maps categories to examples, generates
-    an odd-man-out puzzle whose theme is the given category.
+    an odd-man-out puzzle whose theme is the given category, leaving the
+    lists of examples as they are: the same puzzle as
+    PuzzleGenerator(category_map, seed).generate(category), without
+    copying the examples. category_map can also be a PuzzleGenerator, which
+    lists the categories only once, so that a puzzle costs O(4) rather than
+    O(number of categories); seed is then ignored.
 
     """
-
+    if isinstance(category_map, PuzzleGenerator):
+        return category_map.generate(category)
+    rng = random if seed is None else random.Random(seed)
+    others = [other for other in category_map if other != category]
+    if not others:
+        raise ValueError('puzzles need at least two categories')
+    oddman = rng.choice(category_map[rng.choice(others)])
     examples = category_map[category]
-    random.shuffle(examples)
-    categories = set([str(k) for k in category_map.keys()])
-    categories.remove(str(category))
-    another_category = random.choice(list(categories))
-    another_category_examples = category_map[another_category]
-    random.shuffle(another_category_examples)
-    oddman = another_category_examples[0]
-    puzzle = [str(category), str(oddman)] + examples[:4]
-    return puzzle
-
-
-def generate_puzzles(category_map, num_puzzles_per_category):
+    return [str(category), str(oddman)] + rng.sample(examples, min(4, len(examples)))
+
+
+def generate_puzzles(category_map, num_puzzles_per_category, seed=None):
     """
     Generates several odd-man-out puzzles.
 
     """
-    puzzles = []
-    for i in range(num_puzzles_per_category):
-        for category in category_map:
-            puzzle = generate_puzzle(category_map, category)
-            puzzles.append(puzzle)
-    return puzzles
+    return list(PuzzleGenerator(category_map, seed).puzzles(num_puzzles_per_category))
@@ -0,0 +1,151 @@
+"""
+querycache.py
+
+Persistent on-disk cache of SPARQL query results, backed by SQLite.
+
+Results are keyed by the query text with its whitespace normalized
+outside string literals, so queries built from the same template share an
+entry however they are indented, while literals that differ only in their
+whitespace do not. Empty results (a false ASK, a SELECT without bindings) are cached
+too ("negative caching"), optionally with their own, shorter lifetime.
+In offline mode the cache never lets a query through to the endpoint:
+a miss raises CacheMiss, so a run can be replayed without network access.
+"""
+
+import json
+import re
+import sqlite3
+import threading
+import time
+
+# SPARQL string literals, long and short, with their escapes
+LITERAL = re.compile(r'"""(?:[^"\\]|\\.|"(?!""))*"""'
+                     r"|'''(?:[^'\\]|\\.|'(?!''))*'''"
+                     r'|"(?:[^"\\\n]|\\.)*"'
+                     r"|'(?:[^'\\\n]|\\.)*'")
+WHITESPACE = re.compile(r'\s+')
+
+
+class CacheMiss(LookupError):
+    pass
+
+
+def normalize_query(query):
+    # Collapses whitespace outside the literals only
+    parts = []
+    position = 0
+    for literal in LITERAL.finditer(query):
+        parts.append(WHITESPACE.sub(' ', query[position:literal.start()]))
+        parts.append(literal.group())
+        position = literal.end()
+    parts.append(WHITESPACE.sub(' ', query[position:]))
+    return ''.join(parts).strip()
+
+
+def is_negative(result):
+    if 'boolean' in result:
+        return not result['boolean']
+    return len(result.get('results', {}).get('bindings', [])) == 0
+
+
+class QueryCache:
+
+    def __init__(self, filename, ttl=None, negative_ttl=None,
+                 max_entries=None, offline=False, clock=time.time):
+        """
+        ttl and negative_ttl are lifetimes in seconds of positive and
+        negative results (None: never expire; negative_ttl defaults to ttl).
+        Once more than max_entries results are stored, the least recently
+        used ones are evicted, a tenth of max_entries at a time, so that a
+        put seldom has to evict. Expired entries are still replayed in
+        offline mode.
+
+        """
+        self.filename = filename
+        self.ttl = ttl
+        self.negative_ttl = ttl if negative_ttl is None else negative_ttl
+        self.max_entries = max_entries
+        self.offline = offline
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(filename, check_same_thread=False)
+        with self.connection:
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS queries (
+                    query TEXT PRIMARY KEY,
+                    result TEXT NOT NULL,
+                    negative INTEGER NOT NULL,
+                    created REAL NOT NULL,
+                    last_used REAL NOT NULL
+                )""")
+            self.connection.execute("""
+                CREATE INDEX IF NOT EXISTS queries_last_used
+                ON queries (last_used)""")
+        # The number of entries, kept up to date by put rather than counted
+        self.count = len(self)
+
+    def get(self, query):
+        """
+        Returns the cached result of a query, or None if there is no fresh
+        entry for it (raises CacheMiss instead in offline mode).
+
+        """
+        key = normalize_query(query)
+        now = self.clock()
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT result, negative, created FROM queries WHERE query = ?",
+                (key,)).fetchone()
+            if row is not None:
+                result, negative, created = row
+                ttl = self.negative_ttl if negative else self.ttl
+                if self.offline or ttl is None or now - created <= ttl:
+                    with self.connection:
+                        self.connection.execute(
+                            "UPDATE queries SET last_used = ? WHERE query = ?",
+                            (now, key))
+                    self.hits += 1
+                    return json.loads(result)
+            self.misses += 1
+        if self.offline:
+            raise CacheMiss('Query not in cache (offline mode): ' + key)
+        return None
+
+    def put(self, query, result):
+        key = normalize_query(query)
+        now = self.clock()
+        row = (json.dumps(result), int(is_negative(result)), now, now, key)
+        with self.lock, self.connection:
+            updated = self.connection.execute(
+                "UPDATE queries SET result = ?, negative = ?, created = ?, "
+                "last_used = ? WHERE query = ?", row).rowcount
+            if not updated:
+                self.connection.execute(
+                    "INSERT INTO queries (result, negative, created, last_used, "
+                    "query) VALUES (?, ?, ?, ?, ?)", row)
+                self.count += 1
+            if self.max_entries is not None and self.count > self.max_entries:
+                self.evict()
+
+    def evict(self):
+        # Removes the least recently used entries, down to max_entries less
+        # a tenth; the count is refreshed first, in case another process
+        # shares the file. Called with the lock held.
+        self.count = self.connection.execute(
+            "SELECT COUNT(*) FROM queries").fetchone()[0]
+        excess = self.count - (self.max_entries - self.max_entries // 10)
+        if self.count > self.max_entries and excess > 0:
+            self.count -= self.connection.execute("""
+                DELETE FROM queries WHERE query IN (
+                    SELECT query FROM queries ORDER BY last_used LIMIT ?)""",
+                (excess,)).rowcount
+
+    def __len__(self):
+        with self.lock:
+            return self.connection.execute(
+                "SELECT COUNT(*) FROM queries").fetchone()[0]
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,383 @@
+"""
+server.py
+
+A long-running puzzle-solving service: loads taxonomy backends once and
+answers requests over HTTP (on a TCP port or a Unix socket), so that each
+puzzle costs milliseconds instead of a full load of the graph.
+
+Endpoints (JSON in and out):
+    GET  /backends  the loaded backends, with their root and size
+    POST /solve     {"backend": NAME, "puzzles": [PUZZLE, ...]}
+                    -> {"results": [{"score", "reason", "answer"} or null]}
+    POST /rank      same request -> {"results": [[{"score", "reason",
+                    "choice"}, ...] or null]}
+    POST /lca       {"backend": NAME, "queries": [{"words": [...],
+                    "target": WORD}, ...]}
+                    -> {"results": [{"specificity", "category"}]}
+A PUZZLE is {"choices": [...]}, or {"wordset": [...], "oddone": WORD}, in
+which case its result also says whether the answer is correct. "backend"
+can be left out when only one backend is loaded.
+
+The event loop only parses requests: batches are solved by a pool of
+worker processes, forked once the backends are loaded so they share them
+copy-on-write, or with workers=0 by a single thread of the server process.
+
+e.g. python server.py --port=8000 --backend=wcg=../enwiki-20201020.wcg
+                      --backend=wordnet --workers=4
+"""
+
+import asyncio
+import json
+import multiprocessing
+import sys
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from taxonomy import lowest_common_ancestor
+from solver import TaxonomySimilarity, rank_puzzle_choices, solve_puzzle
+from puzzle import OddOneOutPuzzle
+
+
+MAX_BODY_SIZE = 16 << 20
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found',
+           405: 'Method Not Allowed', 413: 'Payload Too Large',
+           500: 'Internal Server Error'}
+
+
+class RequestError(Exception):
+    """
+    A request the server cannot answer; the message is sent to the client.
+    """
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def load_backend(spec):
+    """
+    Loads a backend from a command line spec, NAME or NAME=FILE:
+        wcg=SNAPSHOT, dbpedia-dump=SNAPSHOT, wordnet[=INDEX], dbpedia.
+    Returns (name, taxonomy).
+
+    """
+    name, _, filename = spec.partition('=')
+    if name == 'wcg':
+        from wikigraph import WCGTaxonomy
+        return name, WCGTaxonomy(snapshot_filename=filename)
+    if name == 'dbpedia-dump':
+        from dbpedia_dump import DBpediaDumpTaxonomy
+        return name, DBpediaDumpTaxonomy(snapshot_filename=filename)
+    if name == 'wordnet':
+        from wordnet import WordnetTaxonomy
+        return name, WordnetTaxonomy(index_filename=filename or None)
+    if name == 'dbpedia':
+        from dbpedia import DBpediaTaxonomy
+        return name, DBpediaTaxonomy()
+    raise ValueError('unknown backend: {}'.format(spec))
+
+
+def parse_word(item, key):
+    # A string field of a request item
+    word = item[key]
+    if not isinstance(word, str):
+        raise RequestError('"{}" must be a string'.format(key))
+    return word
+
+
+def parse_words(item, key):
+    # A non-empty list of strings field of a request item; a string is
+    # not taken for the list of its characters
+    words = item[key]
+    if (not isinstance(words, list) or not words
+            or not all(isinstance(word, str) for word in words)):
+        raise RequestError('"{}" must be a non-empty list of strings'.format(key))
+    return words
+
+
+def parse_puzzle(item):
+    if not isinstance(item, dict):
+        raise RequestError('a puzzle must be an object')
+    if 'choices' in item:
+        choices = parse_words(item, 'choices')
+        if len(choices) < 2:
+            raise RequestError('a puzzle needs at least two choices')
+        return OddOneOutPuzzle(choices[-1], choices[:-1], None)
+    if 'wordset' in item and 'oddone' in item:
+        return OddOneOutPuzzle(parse_word(item, 'oddone'),
+                               parse_words(item, 'wordset'),
+                               item.get('category', ''))
+    raise RequestError('a puzzle has "choices", or "wordset" and "oddone"')
+
+
+def parse_query(item):
+    if not isinstance(item, dict) or 'words' not in item or 'target' not in item:
+        raise RequestError('a query has "words" and "target"')
+    return parse_words(item, 'words'), parse_word(item, 'target')
+
+
+def parse_request_head(request_line, headers):
+    """
+    Returns (method, path, version, content length) of a request, or
+    raises RequestError if the request line or Content-Length is malformed.
+
+    """
+    parts = request_line.decode('latin-1').split()
+    if len(parts) != 3 or not parts[2].startswith('HTTP/'):
+        raise RequestError('malformed request line')
+    method, path, version = parts
+    try:
+        length = int(headers.get('content-length', 0))
+    except ValueError:
+        length = -1
+    if length < 0:
+        raise RequestError('malformed Content-Length')
+    return method, path, version, length
+
+
+def run_batch(similarity, operation, items):
+    """
+    Runs an operation ('solve', 'rank' or 'lca') on a batch of parsed
+    requests, with a per-word cache shared by the whole batch.
+    Returns the JSON results.
+
+    """
+    cache = dict()
+    results = []
+    for item in items:
+        if operation == 'lca':
+            words, target = item
+            spec, category = lowest_common_ancestor(similarity.taxonomy,
+                                                    words, target)
+            results.append({'specificity': spec, 'category': category})
+        elif operation == 'rank':
+            ranks = rank_puzzle_choices(item, similarity, cache)
+            results.append(None if ranks is None else
+                           [{'score': score, 'reason': reason, 'choice': choice}
+                            for (score, reason, choice) in ranks])
+        else:
+            solution = solve_puzzle(item, similarity, cache)
+            if solution is None:
+                results.append(None)
+                continue
+            score, reason, answer = solution
+            result = {'score': score, 'reason': reason, 'answer': answer}
+            if item.category is not None:
+                result['correct'] = answer == item.oddone
+            results.append(result)
+    return results
+
+
+# The similarities of a worker process, inherited from the server by fork
+_worker_similarities = None
+
+
+def _init_worker(similarities):
+    global _worker_similarities
+    _worker_similarities = similarities
+
+
+def _run_worker_batch(backend, operation, items):
+    return run_batch(_worker_similarities[backend], operation, items)
+
+
+class PuzzleServer:
+
+    def __init__(self, backends, workers=0, use_bitsets=False):
+        """
+        Serves the given {name: taxonomy} backends. With workers > 0,
+        batches are split across that many worker processes; otherwise
+        they are run, one at a time, by a thread of this process.
+
+        """
+        if not backends:
+            raise ValueError('no backends to serve')
+        self.backends = dict(backends)
+        self.similarities = {name: TaxonomySimilarity(taxonomy, use_bitsets)
+                             for name, taxonomy in self.backends.items()}
+        self.workers = workers
+        if workers > 0:
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context('fork' if 'fork' in methods
+                                                  else None)
+            self.executor = ProcessPoolExecutor(workers, context, _init_worker,
+                                                (self.similarities,))
+            # The pool forks its workers on the first submit: make it here,
+            # before an event loop and the pool's own threads are running,
+            # rather than from a multi-threaded process later
+            self.executor.submit(int).result()
+        else:
+            self.executor = ThreadPoolExecutor(1)
+        self.servers = []
+        # The tasks of the open connections
+        self.connections = set()
+
+    async def start(self, host='127.0.0.1', port=8000, unix_path=None):
+        """
+        Starts listening, on a Unix socket if unix_path is given, and
+        returns the asyncio Server.
+
+        """
+        if unix_path is not None:
+            server = await asyncio.start_unix_server(self.handle, unix_path)
+        else:
+            server = await asyncio.start_server(self.handle, host, port)
+        self.servers.append(server)
+        return server
+
+    async def serve_forever(self, host='127.0.0.1', port=8000, unix_path=None):
+        server = await self.start(host, port, unix_path)
+        async with server:
+            await server.serve_forever()
+
+    def close(self):
+        for server in self.servers:
+            server.close()
+        for connection in list(self.connections):
+            connection.cancel()
+        self.executor.shutdown(cancel_futures=True)
+
+    async def aclose(self):
+        """
+        Stops listening, and waits for the open connections to be closed.
+
+        """
+        connections = list(self.connections)
+        self.close()
+        for server in self.servers:
+            await server.wait_closed()
+        await asyncio.gather(*connections, return_exceptions=True)
+
+    async def run(self, backend, operation, items):
+        loop = asyncio.get_running_loop()
+        if self.workers == 0:
+            return await loop.run_in_executor(
+                self.executor, run_batch, self.similarities[backend],
+                operation, items)
+        # One chunk per worker, solved with its own per-word cache
+        size = max(1, -(-len(items) // self.workers))
+        chunks = [items[start:start + size] for start in range(0, len(items), size)]
+        results = await asyncio.gather(*[
+            loop.run_in_executor(self.executor, _run_worker_batch, backend,
+                                 operation, chunk)
+            for chunk in chunks])
+        return [result for chunk in results for result in chunk]
+
+    async def dispatch(self, method, path, body):
+        """
+        Answers a request. Returns (status, JSON payload).
+
+        """
+        if path == '/backends':
+            if method != 'GET':
+                raise RequestError('use GET', 405)
+            return 200, {'backends': {
+                name: {'root': taxonomy.get_root(),
+                       'num_instances': taxonomy.num_instances()}
+                for name, taxonomy in self.backends.items()}}
+        operation = {'/solve': 'solve', '/rank': 'rank', '/lca': 'lca'}.get(path)
+        if operation is None:
+            raise RequestError('no such endpoint: {}'.format(path), 404)
+        if method != 'POST':
+            raise RequestError('use POST', 405)
+        try:
+            request = json.loads(body)
+        except ValueError as error:
+            raise RequestError('invalid JSON: {}'.format(error))
+        if not isinstance(request, dict):
+            raise RequestError('the request must be an object')
+        backend = request.get('backend')
+        if backend is None and len(self.backends) == 1:
+            backend = next(iter(self.backends))
+        if backend not in self.backends:
+            raise RequestError('unknown backend: {}'.format(backend))
+        if operation == 'lca':
+            queries = request.get('queries')
+            if not isinstance(queries, list):
+                raise RequestError('"queries" must be a list')
+            items = [parse_query(query) for query in queries]
+        else:
+            puzzles = request.get('puzzles')
+            if not isinstance(puzzles, list):
+                raise RequestError('"puzzles" must be a list')
+            items = [parse_puzzle(item) for item in puzzles]
+        if not items:
+            return 200, {'results': []}
+        return 200, {'results': await self.run(backend, operation, items)}
+
+    async def handle(self, reader, writer):
+        # A minimal HTTP/1.1 connection loop, with keep-alive
+        task = asyncio.current_task()
+        self.connections.add(task)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                headers = dict()
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                try:
+                    method, path, version, length = parse_request_head(
+                        request_line, headers)
+                except RequestError as error:
+                    # The rest of the stream cannot be trusted: answer, and
+                    # close the connection
+                    status, payload = error.status, {'error': str(error)}
+                    keep_alive = False
+                else:
+                    keep_alive = (version == 'HTTP/1.1'
+                                  and headers.get('connection', '').lower() != 'close')
+                    if length > MAX_BODY_SIZE:
+                        status, payload = 413, {'error': 'request too large'}
+                        keep_alive = False
+                    else:
+                        body = await reader.readexactly(length) if length else b''
+                        try:
+                            status, payload = await self.dispatch(method, path, body)
+                        except RequestError as error:
+                            status, payload = error.status, {'error': str(error)}
+                        except Exception as error:
+                            status, payload = 500, {'error': '{}: {}'.format(
+                                type(error).__name__, error)}
+                data = json.dumps(payload).encode('utf-8')
+                writer.write('HTTP/1.1 {} {}\r\nContent-Type: application/json\r\n'
+                             'Content-Length: {}\r\nConnection: {}\r\n\r\n'.format(
+                                 status, REASONS[status], len(data),
+                                 'keep-alive' if keep_alive else 'close')
+                             .encode('latin-1') + data)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, ValueError, asyncio.IncompleteReadError,
+                asyncio.CancelledError):
+            # A broken connection, or cancelled by close(): end it quietly
+            pass
+        finally:
+            self.connections.discard(task)
+            writer.close()
+
+
+if __name__ == "__main__":
+    options = [arg[2:].split("=", 1) for arg in sys.argv[1:]
+               if arg.startswith("--") and "=" in arg]
+    specs = [value for (name, value) in options if name == 'backend']
+    settings = {name: value for (name, value) in options if name != 'backend'}
+    if not specs or len(options) != len(sys.argv) - 1 or \
+            set(settings) - {'host', 'port', 'unix', 'workers'}:
+        sys.exit("usage: python server.py --backend=NAME[=FILE] [--backend=...] "
+                 "[--host=127.0.0.1] [--port=8000 | --unix=PATH] [--workers=N]\n"
+                 "backends: wcg=SNAPSHOT, dbpedia-dump=SNAPSHOT, "
+                 "wordnet[=INDEX], dbpedia")
+    puzzle_server = PuzzleServer(dict(load_backend(spec) for spec in specs),
+                                 workers=int(settings.get('workers', 0)))
+    try:
+        asyncio.run(puzzle_server.serve_forever(settings.get('host', '127.0.0.1'),
+                                                int(settings.get('port', 8000)),
+                                                settings.get('unix')))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        puzzle_server.close()
@@ -0,0 +1,121 @@
+"""
+snapshot.py
+
+A small versioned binary container for precomputed arrays.
+
+A snapshot file holds a JSON header followed by named sections, each of
+which is a flat array of one C type. Loading a snapshot memory-maps the
+file and exposes every section as a memoryview, so start-up costs no
+parsing and several processes opening the same file share its pages.
+
+Layout:
+    magic (8 bytes) | header length (uint64, little endian) | header JSON |
+    padding to 8 bytes | section 0 | padding | section 1 | ...
+"""
+
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+
+MAGIC = b'OOOSNAP\x00'
+FORMAT_VERSION = 1
+ALIGNMENT = 8
+
+
+def _padding(position):
+    return -position % ALIGNMENT
+
+
+def write_snapshot(filename, kind, version, sections, meta=None):
+    """
+    Writes a snapshot. kind names what the snapshot holds (e.g. 'wcg') and
+    version is the version of that kind's layout; both are checked when the
+    snapshot is opened. sections maps names to arrays or bytes.
+
+    The file is written under a temporary name and renamed into place,
+    so an interrupted write never leaves a truncated snapshot behind.
+
+    """
+    entries = []
+    offset = 0
+    for name, data in sections.items():
+        if isinstance(data, array):
+            typecode, itemsize = data.typecode, data.itemsize
+        else:
+            typecode, itemsize = 'B', 1
+        entries.append({'name': name, 'typecode': typecode,
+                        'offset': offset, 'length': len(data)})
+        offset += len(data) * itemsize
+        offset += _padding(offset)
+    header = json.dumps({'format': FORMAT_VERSION,
+                         'byteorder': sys.byteorder,
+                         'kind': kind,
+                         'version': version,
+                         'meta': meta or {},
+                         'sections': entries}).encode('utf-8')
+    temporary = filename + '.tmp'
+    with open(temporary, 'wb') as writer:
+        writer.write(MAGIC)
+        writer.write(struct.pack('<Q', len(header)))
+        writer.write(header)
+        writer.write(bytes(_padding(len(MAGIC) + 8 + len(header))))
+        for data in sections.values():
+            if isinstance(data, array):
+                data.tofile(writer)
+            else:
+                writer.write(data)
+            writer.write(bytes(_padding(writer.tell())))
+    os.replace(temporary, filename)
+
+
+class Snapshot:
+    """
+    A memory-mapped snapshot file. Sections are returned as read-only
+    memoryviews into the mapping and stay valid while the Snapshot is open.
+
+    """
+
+    def __init__(self, filename, kind, version):
+        self.filename = filename
+        with open(filename, 'rb') as reader:
+            self.map = mmap.mmap(reader.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.map[:len(MAGIC)] != MAGIC:
+            raise ValueError('{} is not a snapshot file'.format(filename))
+        (header_length,) = struct.unpack_from('<Q', self.map, len(MAGIC))
+        header_start = len(MAGIC) + 8
+        header = json.loads(self.map[header_start:header_start + header_length])
+        if header['format'] != FORMAT_VERSION:
+            raise ValueError('{} has snapshot format {}, expected {}'.format(
+                filename, header['format'], FORMAT_VERSION))
+        if header['byteorder'] != sys.byteorder:
+            raise ValueError('{} was written on a machine with a different '
+                             'byte order'.format(filename))
+        if header['kind'] != kind or header['version'] != version:
+            raise ValueError('{} holds a {} snapshot version {}, expected {} '
+                             'version {}; recompile it'.format(
+                                 filename, header['kind'], header['version'],
+                                 kind, version))
+        self.meta = header['meta']
+        start = header_start + header_length
+        start += _padding(start)
+        view = memoryview(self.map)
+        self.sections = dict()
+        for entry in header['sections']:
+            itemsize = array(entry['typecode']).itemsize
+            begin = start + entry['offset']
+            raw = view[begin:begin + entry['length'] * itemsize]
+            self.sections[entry['name']] = raw.cast(entry['typecode'])
+
+    def __getitem__(self, name):
+        return self.sections[name]
+
+    def __contains__(self, name):
+        return name in self.sections
+
+
+def open_snapshot(filename, kind, version):
+    return Snapshot(filename, kind, version)
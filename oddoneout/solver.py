@@ -1,5 +1,8 @@
+import multiprocessing
+from itertools import islice
 from nltk.corpus import wordnet as wn
-from taxonomy import lowest_common_ancestor
+from taxonomy import lowest_common_ancestor, lowest_common_ancestor_from_ancestors
+from lca import BitsetLCA
 
 
 class SimilarityScore:
@@ -10,22 +13,84 @@ class SimilarityScore:
     def is_recognized(self, word):
         raise NotImplementedError('Cannot call this method on abstract class.')
 
+    def score_choices(self, choices, cache=None):
+        """
+        Scores every choice against the other choices and returns the
+        (score, reason) pairs in the order of the choices. Subclasses can
+        use cache, a dict shared by the caller across puzzles, to keep
+        per-word work between calls.
+
+        """
+        return [self(choice, set(choices) - {choice}) for choice in choices]
+
+    def prefetch(self, words):
+        """
+        Called by solve_puzzles with the words of each chunk of puzzles
+        before they are solved.
+
+        """
+        pass
+
 
 class TaxonomySimilarity(SimilarityScore):
 
-    def __init__(self, taxonomy):
+    def __init__(self, taxonomy, use_bitsets=False):
+        """
+        With use_bitsets=True, lowest common ancestors are computed by a
+        BitsetLCA engine, which ranks the ancestor categories of the words
+        as they are looked up.
+
+        """
         super().__init__()
         self.taxonomy = taxonomy
+        self.lca = BitsetLCA(taxonomy) if use_bitsets else None
 
     def __call__(self, word, other_words):
-        spec, reason = lowest_common_ancestor(self.taxonomy,
-                                              list(other_words),
-                                              word)
+        if self.lca is not None:
+            spec, reason = self.lca.lowest_common_ancestor(list(other_words),
+                                                           word)
+        else:
+            spec, reason = lowest_common_ancestor(self.taxonomy,
+                                                  list(other_words),
+                                                  word)
         return 1.0/spec, reason
 
+    def score_choices(self, choices, cache=None):
+        # Looks up the ancestors of each word once, rather than once for
+        # every choice it is compared against
+        if cache is None:
+            cache = dict()
+        words = list(dict.fromkeys(choices))
+        if self.lca is not None:
+            get_ancestors = self.lca.get_ancestor_mask
+            from_ancestors = self.lca.lowest_common_ancestor_from_masks
+        else:
+            get_ancestors = self.taxonomy.get_ancestor_categories
+            from_ancestors = lambda word_ancestors, target_ancestors: \
+                lowest_common_ancestor_from_ancestors(self.taxonomy,
+                                                      word_ancestors,
+                                                      target_ancestors)
+        try:
+            for word in words:
+                if word not in cache:
+                    cache[word] = get_ancestors(word)
+        except KeyError:
+            # The bitset engine cannot represent this word's ancestors
+            return super().score_choices(choices)
+        scores = []
+        for choice in choices:
+            spec, reason = from_ancestors([cache[word] for word in words
+                                           if word != choice],
+                                          cache[choice])
+            scores.append((1.0/spec, reason))
+        return scores
+
     def is_recognized(self, word):
         return self.taxonomy.is_instance(word)
 
+    def prefetch(self, words):
+        self.taxonomy.prefetch(words)
+
 
 def is_solvable(puzzle, similarity):
     options = puzzle.wordset + [puzzle.oddone]
@@ -35,22 +100,23 @@ def is_solvable(puzzle, similarity):
     return True
 
 
-def rank_puzzle_choices(puzzle, sim):
-    def score_choice(choice):
-        others = set(choices) - {choice}
-        return sim(choice, others)
+def rank_puzzle_choices(puzzle, sim, cache=None):
     if not is_solvable(puzzle, sim):
         return None
     else:
         choices = puzzle.wordset + [puzzle.oddone]
-        scores = [score_choice(choice) for choice in choices]
+        if hasattr(sim, 'score_choices'):
+            scores = sim.score_choices(choices, cache)
+        else:
+            # A model that only scores one choice at a time
+            scores = [sim(choice, set(choices) - {choice}) for choice in choices]
         result = sorted([(score, reason, choice)
                          for ((score, reason), choice) in zip(scores, choices)])
         return list(reversed(result))
 
 
-def solve_puzzle(puzzle, similarity):
-    ranks = rank_puzzle_choices(puzzle, similarity)
+def solve_puzzle(puzzle, similarity, cache=None):
+    ranks = rank_puzzle_choices(puzzle, similarity, cache)
     if ranks is None or ranks[0][0] == ranks[1][0]:
         return None
     else:
@@ -65,12 +131,99 @@ def silent_logger(s):
     pass
 
 
-def solve_puzzles(puzzles, model, logger=verbose_logger):
+# The number of puzzles whose words are prefetched together, and the
+# number of puzzles given to each process pool of solve_puzzles
+PREFETCH_CHUNK_SIZE = 1000
+POOL_WINDOW_SIZE = 100000
+
+# State of a pool worker of solve_puzzles(..., workers=N)
+_worker_model = None
+_worker_puzzles = None
+_worker_cache = None
+
+
+def _init_worker(model, puzzles):
+    global _worker_model, _worker_puzzles, _worker_cache
+    _worker_model = model
+    _worker_puzzles = puzzles
+    _worker_cache = dict()
+
+
+def _solve_worker_puzzle(index):
+    return solve_puzzle(_worker_puzzles[index], _worker_model, _worker_cache)
+
+
+def _chunks(puzzles, size):
+    puzzles = iter(puzzles)
+    while True:
+        chunk = list(islice(puzzles, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _prefetch(model, puzzles):
+    # Only for the models that define prefetch (e.g. TaxonomySimilarity)
+    prefetch = getattr(model, 'prefetch', None)
+    if prefetch is None:
+        return
+    for chunk in _chunks(puzzles, PREFETCH_CHUNK_SIZE):
+        prefetch([word for puzzle in chunk
+                  for word in puzzle.wordset + [puzzle.oddone]])
+
+
+def _solve_serially(puzzles, model):
+    # Per-word lookups shared by every puzzle of the set; a stream of
+    # puzzles is read, and prefetched, one chunk at a time
+    cache = dict()
+    for chunk in _chunks(puzzles, PREFETCH_CHUNK_SIZE):
+        _prefetch(model, chunk)
+        for puzzle in chunk:
+            yield puzzle, solve_puzzle(puzzle, model, cache)
+
+
+def _solve_in_pool(puzzles, model, workers):
+    """
+    Solves the puzzles in a pool of worker processes and yields the
+    solutions in puzzle order.
+
+    The puzzles are read POOL_WINDOW_SIZE at a time, and each window is
+    prefetched and then solved by a pool of its own. Where the platform
+    can fork, the workers inherit the model, with what was prefetched, and
+    the puzzles copy-on-write and only puzzle indices are sent to them.
+    Otherwise the model is pickled once per worker (a WCGTaxonomy loaded
+    from a snapshot pickles as its filename, so workers map the same file).
+
+    """
+    if 'fork' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('fork')
+    else:
+        context = multiprocessing.get_context()
+    for window in _chunks(puzzles, POOL_WINDOW_SIZE):
+        _prefetch(model, window)
+        chunksize = max(1, len(window) // (4 * workers))
+        with context.Pool(workers, _init_worker, (model, window)) as pool:
+            solutions = pool.imap(_solve_worker_puzzle, range(len(window)),
+                                  chunksize)
+            for puzzle, solution in zip(window, solutions):
+                yield puzzle, solution
+
+
+def solve_puzzles(puzzles, model, logger=verbose_logger, workers=1):
+    """
+    Solves every puzzle and returns (correct, incorrect, unattempted).
+    With workers > 1 the puzzles are solved by a process pool; the results
+    are logged in puzzle order, exactly as in a serial run.
+
+    """
     correct = 0
     incorrect = 0
     unattempted = 0
-    for puzzle in puzzles:
-        solution = solve_puzzle(puzzle, model)
+    if workers > 1:
+        solved = _solve_in_pool(puzzles, model, workers)
+    else:
+        solved = _solve_serially(puzzles, model)
+    for puzzle, solution in solved:
         if solution is None:
             logger('*ABSTAIN*: {}'.format(puzzle))
             unattempted += 1
@@ -0,0 +1,166 @@
+"""
+sparqlclient.py
+
+HTTP client for a SPARQL endpoint, shared by blocking and asyncio callers.
+
+Requests go through a pool of persistent HTTP connections, at most
+max_in_flight of them at a time, and are paced by a token bucket so that
+a public endpoint sees at most `rate` requests per second on average.
+Connection errors and "try again later" responses (429 and 5xx) are
+retried with exponential backoff, honouring Retry-After.
+
+The asyncio interface (aquery, aquery_many, query_many) runs the
+requests in worker threads, so many lookups can be in flight at once
+while the limits above still hold across every caller.
+"""
+
+import asyncio
+import http.client
+import json
+import queue
+import threading
+import time
+from urllib.parse import urlencode, urlsplit
+
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class SparqlError(Exception):
+    pass
+
+
+class TokenBucket:
+    """
+    Allows `rate` acquisitions per second on average, with bursts of up
+    to `burst`. Thread-safe; acquire() blocks until a token is available.
+
+    """
+
+    def __init__(self, rate, burst=1, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self.sleep = sleep
+        self.tokens = burst
+        self.updated = clock()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = self.clock()
+                self.tokens = min(self.burst,
+                                  self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            self.sleep(wait)
+
+
+class SparqlClient:
+
+    def __init__(self, endpoint, max_in_flight=4, rate=5.0, burst=None,
+                 retries=3, backoff=0.5, timeout=60):
+        self.endpoint = endpoint
+        parts = urlsplit(endpoint)
+        self.https = parts.scheme == 'https'
+        self.host = parts.hostname
+        self.port = parts.port
+        self.path = parts.path or '/'
+        self.max_in_flight = max_in_flight
+        self.bucket = TokenBucket(rate, burst or max_in_flight)
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.in_flight = threading.BoundedSemaphore(max_in_flight)
+        self.connections = queue.LifoQueue()
+        self.stats_lock = threading.Lock()
+        self.num_requests = 0
+        self.num_retries = 0
+
+    def _connect(self):
+        try:
+            return self.connections.get_nowait()
+        except queue.Empty:
+            if self.https:
+                return http.client.HTTPSConnection(self.host, self.port,
+                                                   timeout=self.timeout)
+            return http.client.HTTPConnection(self.host, self.port,
+                                              timeout=self.timeout)
+
+    def _request(self, query):
+        """
+        Sends one request. Returns (status, retry_after, body).
+
+        """
+        body = urlencode({'query': query})
+        headers = {'Content-Type': 'application/x-www-form-urlencoded',
+                   'Accept': 'application/sparql-results+json'}
+        connection = self._connect()
+        try:
+            connection.request('POST', self.path, body, headers)
+            response = connection.getresponse()
+            data = response.read()
+        except (OSError, http.client.HTTPException):
+            connection.close()
+            raise
+        if response.will_close:
+            connection.close()
+        else:
+            self.connections.put(connection)
+        return response.status, response.getheader('Retry-After'), data
+
+    def query(self, query):
+        """
+        Runs a query and returns its decoded JSON results.
+        Raises SparqlError once the retries are exhausted.
+
+        """
+        for attempt in range(self.retries + 1):
+            delay = self.backoff * 2 ** attempt
+            self.bucket.acquire()
+            with self.in_flight:
+                with self.stats_lock:
+                    self.num_requests += 1
+                try:
+                    status, retry_after, data = self._request(query)
+                except (OSError, http.client.HTTPException) as error:
+                    failure = '{}: {}'.format(type(error).__name__, error)
+                else:
+                    if status == 200:
+                        return json.loads(data)
+                    failure = 'HTTP {}: {}'.format(status, data[:200])
+                    if status not in RETRY_STATUSES:
+                        raise SparqlError(failure)
+                    if retry_after is not None and retry_after.isdigit():
+                        delay = max(delay, int(retry_after))
+            if attempt < self.retries:
+                with self.stats_lock:
+                    self.num_retries += 1
+                time.sleep(delay)
+        raise SparqlError('Query failed after {} attempts ({})'.format(
+            self.retries + 1, failure))
+
+    async def aquery(self, query):
+        return await asyncio.to_thread(self.query, query)
+
+    async def aquery_many(self, queries, return_exceptions=False):
+        return await asyncio.gather(*[self.aquery(query) for query in queries],
+                                    return_exceptions=return_exceptions)
+
+    def query_many(self, queries, return_exceptions=False):
+        """
+        Runs several queries concurrently and returns their results in order.
+
+        """
+        return asyncio.run(self.aquery_many(queries, return_exceptions))
+
+    def close(self):
+        while True:
+            try:
+                self.connections.get_nowait().close()
+            except queue.Empty:
+                return
@@ -3,8 +3,10 @@ import nltk
 nltk.download('wordnet')
 """
 
+import threading
 from nltk.corpus import wordnet as wn
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
+from descendantcounts import descendant_instance_counts
 
 
 class Taxonomy:
@@ -27,27 +29,182 @@ class Taxonomy:
     def get_descendant_instances(self, node):
         raise NotImplementedError('Cannot call this method on abstract class.')
 
+    def get_categories(self):
+        raise NotImplementedError('Cannot call this method on abstract class.')
 
-class Specificity:
-    def __init__(self):
-        self.cache = dict()
+    def num_descendant_instances(self, node):
+        """
+        Subclasses with a precomputed index of descendant counts override
+        this to avoid materializing the descendant set.
+
+        """
+        return len(self.get_descendant_instances(node))
+
+    def prefetch(self, words):
+        """
+        Hint that these words are about to be looked up. Taxonomies backed
+        by a remote service override this to fetch them concurrently.
+
+        """
+        pass
+
+
+class LRUCache:
+    """
+    A dict-like cache holding at most maxsize entries (unbounded if maxsize
+    is None). When full, the least recently used entry is evicted.
+    Keeps hit and miss counts.
+
+    """
+
+    def __init__(self, maxsize=None):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        if key not in self.data:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self.data.move_to_end(key)
+        return self.data[key]
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def __setitem__(self, key, value):
+        self.data[key] = value
+        self.data.move_to_end(key)
+        if self.maxsize is not None and len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+
+    def __len__(self):
+        return len(self.data)
 
-    def __call__(self, taxonomy, category):
-        if category not in self.cache:
-            spec = len(taxonomy.get_descendant_instances(category))
-            self.cache[category] = spec
-        return self.cache[category]
+    def clear(self):
+        self.data.clear()
 
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses,
+                'size': len(self.data), 'maxsize': self.maxsize}
 
-specificity = Specificity()
+
+class Specificity:
+    """
+    Caches the specificity (number of descendant instances) of the
+    categories of the taxonomy it is created for, in an LRU cache of at
+    most maxsize entries (unbounded if maxsize is None).
+
+    """
+
+    def __init__(self, taxonomy, maxsize=100000, filename=None):
+        """
+        With filename, the cache is warm-started from a file written by
+        save, of which the first maxsize entries are loaded; the file must
+        have been saved from the same taxonomy.
+
+        """
+        self.taxonomy = taxonomy
+        self.cache = LRUCache(maxsize)
+        self.lock = threading.Lock()
+        if filename is not None:
+            self.load(filename)
+
+    def __call__(self, category):
+        with self.lock:
+            spec = self.cache.get(category)
+        if spec is None:
+            spec = self.taxonomy.num_descendant_instances(category)
+            with self.lock:
+                self.cache[category] = spec
+        return spec
+
+    def stats(self):
+        with self.lock:
+            return self.cache.stats()
+
+    def __getstate__(self):
+        # Locks cannot be pickled (for solve_puzzles worker processes)
+        return {'taxonomy': self.taxonomy, 'cache': self.cache}
+
+    def __setstate__(self, state):
+        self.taxonomy = state['taxonomy']
+        self.cache = state['cache']
+        self.lock = threading.Lock()
+
+    def header(self):
+        # Identifies the taxonomy in saved files: its class, root and
+        # number of instances
+        return '# {}\t{}\t{}\n'.format(type(self.taxonomy).__name__,
+                                        self.taxonomy.get_root(),
+                                        self.taxonomy.num_instances())
+
+    def load(self, filename):
+        """
+        Adds the entries of a file written by save. Raises ValueError if the
+        file was saved from another taxonomy.
+
+        """
+        with open(filename, 'r', encoding='utf-8') as reader:
+            header = reader.readline()
+            if header != self.header():
+                raise ValueError('{} holds the specificities of {!r}, not {!r}'
+                                 .format(filename, header.strip(),
+                                         self.header().strip()))
+            with self.lock:
+                for line in reader:
+                    if (self.cache.maxsize is not None
+                            and len(self.cache) >= self.cache.maxsize):
+                        break
+                    category, spec = line.rstrip('\n').rsplit('\t', 1)
+                    self.cache[category] = int(spec)
+
+    def save(self, filename):
+        """
+        Writes a header identifying the taxonomy, then the cached entries as
+        category<TAB>specificity lines, most recently used first, for load.
+
+        """
+        with self.lock:
+            entries = list(reversed(self.cache.data.items()))
+        with open(filename, 'w', encoding='utf-8') as writer:
+            writer.write(self.header())
+            for category, spec in entries:
+                writer.write('{}\t{}\n'.format(category, spec))
+
+
+def specificity(taxonomy, category):
+    """
+    Returns the specificity of a category, cached by the taxonomy's own
+    Specificity (taxonomy.specificity), which is created on first use for
+    taxonomies that do not set one up.
+
+    """
+    cache = getattr(taxonomy, 'specificity', None)
+    if cache is None:
+        cache = taxonomy.specificity = Specificity(taxonomy)
+    return cache(category)
 
 
 def lowest_common_ancestor(taxonomy, words, target):
     target_ancestors = taxonomy.get_ancestor_categories(target)
-    common_ancestors = taxonomy.get_ancestor_categories(words[0])
-    for word in words[1:]:
-        word_ancestors = taxonomy.get_ancestor_categories(word)
-        common_ancestors = common_ancestors & word_ancestors
+    word_ancestors = [taxonomy.get_ancestor_categories(word) for word in words]
+    return lowest_common_ancestor_from_ancestors(taxonomy, word_ancestors,
+                                                 target_ancestors)
+
+
+def lowest_common_ancestor_from_ancestors(taxonomy, word_ancestors,
+                                          target_ancestors):
+    """
+    Same as lowest_common_ancestor, given the ancestor sets of the words
+    and of the target, so that callers can reuse them across calls.
+
+    """
+    common_ancestors = word_ancestors[0]
+    for ancestors in word_ancestors[1:]:
+        common_ancestors = common_ancestors & ancestors
     common_ancestors = common_ancestors - target_ancestors
     if len(common_ancestors) == 0:
         return taxonomy.num_instances(), taxonomy.get_root()
@@ -57,9 +214,74 @@ def lowest_common_ancestor(taxonomy, words, target):
     return sorted_ancestors[0]
 
 
-class GraphTaxonomy:
+def closure(node, next_nodes, own, cache):
+    """
+    Returns the frozenset union of own(n) over every n reachable from node
+    (node included) by repeatedly following next_nodes.
+
+    The traversal is iterative and post-order, so the closure of every node
+    it completes is stored in the given cache and reused by later calls.
+    If the walk runs into a cycle, closures completed after that point may
+    be partial, so they are not cached and the requested closure is
+    recomputed with a plain graph search.
 
-    def __init__(self, root, parents):
+    """
+    result = cache.get(node)
+    if result is not None:
+        return result
+    closures = dict()
+    in_progress = {node}
+    cyclic = False
+    stack = [(node, iter(next_nodes(node)))]
+    while stack:
+        current, remaining = stack[-1]
+        for next_node in remaining:
+            if next_node in closures:
+                continue
+            cached = cache.get(next_node)
+            if cached is not None:
+                closures[next_node] = cached
+            elif next_node in in_progress:
+                cyclic = True
+            else:
+                in_progress.add(next_node)
+                stack.append((next_node, iter(next_nodes(next_node))))
+                break
+        else:
+            stack.pop()
+            in_progress.discard(current)
+            result = set(own(current))
+            for next_node in next_nodes(current):
+                result |= closures.get(next_node, frozenset())
+            closures[current] = frozenset(result)
+            if not cyclic:
+                cache[current] = closures[current]
+    if not cyclic:
+        return closures[node]
+    result = set()
+    visited = {node}
+    stack = [node]
+    while stack:
+        current = stack.pop()
+        result.update(own(current))
+        for next_node in next_nodes(current):
+            if next_node not in visited:
+                visited.add(next_node)
+                stack.append(next_node)
+    return frozenset(result)
+
+
+class GraphTaxonomy(Taxonomy):
+
+    def __init__(self, root, parents, cache_size=100000,
+                 specificity_cache_size=100000, specificity_filename=None):
+        """
+        The ancestor and descendant closures of the last cache_size nodes
+        are kept in LRU caches, and the specificities of
+        specificity_cache_size categories in a Specificity, warm-started
+        from specificity_filename if given.
+
+        """
         self.root = root
         self.parents = parents
         self.children = defaultdict(list)
@@ -67,6 +289,11 @@ class GraphTaxonomy:
             for parent in self.parents[node]:
                 self.children[parent].append(node)
         self.children = dict(self.children)
+        self.descendant_counts = None
+        self.ancestor_cache = LRUCache(cache_size)
+        self.descendant_cache = LRUCache(cache_size)
+        self.specificity = Specificity(self, specificity_cache_size,
+                                       specificity_filename)
 
     def is_instance(self, node):
         return node in self.parents and node not in self.children
@@ -80,6 +307,9 @@ class GraphTaxonomy:
     def get_root(self):
         return self.root
 
+    def get_categories(self):
+        return list(self.children)
+
     def get_children(self, node):
         if node not in self.children:
             return []
@@ -93,25 +323,37 @@ class GraphTaxonomy:
             return self.parents[node]
 
     def get_ancestor_categories(self, node):
-        result = set()
-        if self.is_category(node):
-            result.add(node)
-        for parent in self.get_parents(node):
-            result |= set(self.get_ancestor_categories(parent))
-        return result
+        return closure(node, self.get_parents,
+                       lambda n: {n} if self.is_category(n) else (),
+                       self.ancestor_cache)
 
-    def get_descendant_instances(self, node):
-        """TODO: optimize!"""
-        if self.is_instance(node):
-            return {node}
-        else:
-            result = set()
-            for child in self.get_children(node):
-                result |= self.get_descendant_instances(child)
-            return result
+    def num_descendant_instances(self, node):
+        if self.descendant_counts is None:
+            self.descendant_counts = self.count_descendant_instances()
+        return self.descendant_counts.get(node, 0)
 
+    def count_descendant_instances(self, approximate=False):
+        """
+        Returns a dict mapping every node to its number of descendant
+        instances, computed in one bottom-up pass over the graph.
 
+        """
+        nodes = list(dict.fromkeys(list(self.parents) + list(self.children)))
+        index = {node: i for (i, node) in enumerate(nodes)}
 
+        def children_of(i):
+            if self.is_instance(nodes[i]):
+                return []
+            return [index[child] for child in self.get_children(nodes[i])]
 
+        def instances_of(i):
+            return [i] if self.is_instance(nodes[i]) else []
 
+        counts = descendant_instance_counts(len(nodes), children_of,
+                                            instances_of, approximate)
+        return dict(zip(nodes, counts))
 
+    def get_descendant_instances(self, node):
+        return closure(node, self.get_children,
+                       lambda n: {n} if self.is_instance(n) else (),
+                       self.descendant_cache)
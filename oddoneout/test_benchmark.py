@@ -0,0 +1,64 @@
+"""
+Tests the synthetic graphs and the report of benchmark.py.
+"""
+
+import json
+import unittest
+from benchmark import synthetic_taxonomy, synthetic_puzzles, latency_summary, \
+    run_benchmarks
+from taxonomy import GraphTaxonomy
+
+
+class TestBenchmark(unittest.TestCase):
+
+    def test_synthetic_taxonomy(self):
+        root, parents = synthetic_taxonomy(1000, seed=1)
+        assert len(parents) == 1000
+        assert (root, parents) == synthetic_taxonomy(1000, seed=1)
+        taxonomy = GraphTaxonomy(root, parents)
+        assert len(taxonomy.get_categories()) <= 125
+        # Every node reaches the root
+        for node in parents:
+            if node != root:
+                assert root in taxonomy.get_ancestor_categories(node)
+
+    def test_synthetic_puzzles(self):
+        root, parents = synthetic_taxonomy(1000)
+        taxonomy = GraphTaxonomy(root, parents)
+        puzzles = synthetic_puzzles(root, parents, 20)
+        assert len(puzzles) == 20
+        for puzzle in puzzles:
+            for word in puzzle.wordset:
+                assert puzzle.category in taxonomy.get_ancestor_categories(word)
+            assert puzzle.category not in \
+                taxonomy.get_ancestor_categories(puzzle.oddone)
+
+    def test_synthetic_puzzles_small(self):
+        # Every instance is under the root, the only category: no puzzles
+        root, parents = synthetic_taxonomy(10)
+        assert synthetic_puzzles(root, parents, 5) == []
+
+    def test_latency_summary(self):
+        summary = latency_summary([0.001 * i for i in range(1, 101)])
+        assert summary['count'] == 100
+        assert abs(summary['p50_ms'] - 50) < 1e-6
+        assert abs(summary['p99_ms'] - 99) < 1e-6
+        assert abs(summary['max_ms'] - 100) < 1e-6
+        assert latency_summary([]) == {'count': 0}
+
+    def test_run_benchmarks(self):
+        report = run_benchmarks(backends=('graph', 'wcg'), sizes=(500,),
+                                num_samples=20)
+        json.dumps(report)
+        assert [(run['backend'], run['nodes']) for run in report['runs']] == \
+            [('graph', 500), ('wcg', 500)]
+        for run in report['runs']:
+            assert run['peak_rss_kb'] > 0
+            assert run['operations']['get_ancestor_categories']['count'] == 20
+            assert run['solve_puzzles']['correct'] == 20
+        with self.assertRaises(ValueError):
+            run_benchmarks(backends=('graph', 'unknown'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import os
+import tempfile
+import unittest
+from categorygraph import StringTable, CategoryGraphBuilder, csr
+from categorygraph import load_category_graph
+from categorygraph import SUBCAT
+
+
+class TestCategoryGraph(unittest.TestCase):
+
+    def setUp(self):
+        builder = CategoryGraphBuilder()
+        builder.add_page("7", "0", "'Cake'")
+        builder.add_page("2", "14", "'Recipes'")
+        builder.add_page("3", "14", "'Dessert_recipes'")
+        builder.add_page("9", "0", "'Recipes'")
+        builder.add_link("3", "'Recipes'", "'subcat'")
+        builder.add_link("7", "'Dessert_recipes'", "'page'")
+        builder.add_link("7", "'Baking'", "'page'")
+        builder.add_link("8", "'Recipes'", "'file'")
+        self.graph = builder.build()
+
+    def test_string_table(self):
+        table = StringTable.from_strings(['pear', 'apple', 'fig', 'apple'])
+        assert len(table) == 3
+        assert [table[i] for i in range(3)] == ['apple', 'fig', 'pear']
+        assert table.index('fig') == 1
+        assert table.index('kiwi') is None
+
+    def test_csr(self):
+        offsets, values = csr(3, [2, 0, 2, 0], [10, 11, 12, 13])
+        assert list(offsets) == [0, 2, 2, 4]
+        assert list(values) == [11, 13, 10, 12]
+
+    def test_pages(self):
+        graph = self.graph
+        assert graph.num_pages() == 4
+        assert list(graph.page_ids) == [2, 3, 7, 9]
+        assert graph.page_index(7) == 2
+        assert graph.page_index(8) is None
+        recipes = graph.title_id("'Recipes'")
+        assert [graph.page_ids[p] for p in graph.pages_with_title(recipes)] == [2, 9]
+
+    def test_links(self):
+        graph = self.graph
+        cake = graph.page_index(7)
+        assert sorted(graph.title(c) for c in graph.parents(cake)) == \
+            ["'Baking'", "'Dessert_recipes'"]
+        recipes = graph.title_id("'Recipes'")
+        assert [(graph.title(graph.page_title(p)), t)
+                for p, t in graph.members(recipes)] == [("'Dessert_recipes'", SUBCAT)]
+        assert graph.is_category_label(recipes)
+        assert graph.is_category_label(graph.title_id("'Baking'"))
+        assert not graph.is_category_label(graph.title_id("'Cake'"))
+
+    def test_relabel(self):
+        builder = CategoryGraphBuilder()
+        builder.add_page("1", "0", "<a>")
+        builder.add_page("2", "14", "<b>")
+        builder.add_page("3", "14", "<c>")
+        builder.add_link("1", "<b>", "'page'")
+        builder.add_link("1", "<c>", "'page'")
+        # <b> and <c> get the same label, and become one title
+        builder.relabel({'<a>': 'Apple', '<b>': 'Fruits', '<c>': 'Fruits'}.get)
+        graph = builder.build()
+        assert graph.num_titles() == 2
+        fruits = graph.title_id('Fruits')
+        assert [graph.page_ids[p] for p in graph.pages_with_title(fruits)] == [2, 3]
+        assert [graph.title(c) for c in graph.parents(graph.page_index(1))] == \
+            ['Fruits', 'Fruits']
+
+    def test_save_and_load(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, "graph.wcg")
+            self.graph.save(filename, {'num_instances': 1})
+            graph = load_category_graph(filename)
+            assert graph.meta['num_instances'] == 1
+            assert graph.meta['num_pages'] == 4
+            assert graph.num_titles() == self.graph.num_titles()
+            assert list(graph.page_ids) == list(self.graph.page_ids)
+            assert graph.page_index(7) == 2
+            recipes = graph.title_id("'Recipes'")
+            assert graph.title(recipes) == "'Recipes'"
+            assert list(graph.members(recipes)) == \
+                list(self.graph.members(recipes))
+            del graph
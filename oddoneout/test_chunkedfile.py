@@ -0,0 +1,48 @@
+"""
+Tests chunkedfile.py, which splits files into line-aligned byte ranges.
+"""
+
+import os
+import tempfile
+import unittest
+from chunkedfile import line_chunks, read_lines
+
+
+class TestChunkedFile(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.tmpdir.name, "lines.txt")
+        self.lines = ['{}\tcafé {}'.format(i, 'x' * (i % 7))
+                      for i in range(200)]
+        with open(self.filename, 'w', encoding='utf-8') as writer:
+            writer.write('\n'.join(self.lines) + '\n')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def read_chunks(self, chunks):
+        return [line for (start, end) in chunks
+                for line in read_lines(self.filename, start, end)]
+
+    def test_chunks_cover_file(self):
+        size = os.path.getsize(self.filename)
+        for num_chunks in (1, 2, 3, 7, 64, 5000):
+            chunks = line_chunks(self.filename, num_chunks)
+            assert chunks[0][0] == 0 and chunks[-1][1] == size
+            assert all(a[1] == b[0] for a, b in zip(chunks, chunks[1:]))
+            assert self.read_chunks(chunks) == self.lines
+
+    def test_chunk_size(self):
+        chunks = line_chunks(self.filename, chunk_size=100)
+        assert len(chunks) > 20
+        assert self.read_chunks(chunks) == self.lines
+
+    def test_no_final_newline(self):
+        with open(self.filename, 'w', encoding='utf-8') as writer:
+            writer.write('\n'.join(self.lines))
+        assert self.read_chunks(line_chunks(self.filename, 9)) == self.lines
+
+
+if __name__ == '__main__':
+    unittest.main()
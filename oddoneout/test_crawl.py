@@ -0,0 +1,123 @@
+"""
+Tests crawl.py, the resumable crawl of DBpedia descendant instances.
+"""
+
+import os
+import tempfile
+import unittest
+from crawl import DescendantCrawl, crawl_descendant_instances
+from sparqlclient import SparqlError
+
+
+SUBCATEGORIES = {'Contents': ['Foods', 'Dogs'],
+                 'Foods': ['Fruits', 'Edible_fruits'],
+                 'Fruits': ['Pome_fruits'],
+                 'Edible_fruits': ['Pome_fruits'],
+                 'Pome_fruits': [],
+                 'Dogs': ['Water_dogs', 'Contents'],
+                 'Water_dogs': []}
+INSTANCES = {'Pome_fruits': ['Pear', 'Apple'],
+             'Edible_fruits': ['Pear', 'Banana'],
+             'Water_dogs': ['Poodle'],
+             'Dogs': ['Dog']}
+
+
+class FakeTaxonomy:
+    """
+    Answers the category queries of DBpediaTaxonomy from the maps above.
+    Raises KeyboardInterrupt once `interrupt_after` categories have been
+    expanded, and SparqlError for the categories in `failing`.
+
+    """
+
+    def __init__(self, interrupt_after=None, failing=()):
+        self.interrupt_after = interrupt_after
+        self.failing = set(failing)
+        self.expanded = []
+        self.num_queries = 0
+
+    def get_category_instances(self, category):
+        self.num_queries += 1
+        if category in self.failing:
+            raise SparqlError('HTTP 503')
+        if self.interrupt_after is not None and \
+                len(self.expanded) == self.interrupt_after:
+            raise KeyboardInterrupt
+        self.expanded.append(category)
+        return INSTANCES.get(category, [])
+
+    def get_subcategories(self, category):
+        self.num_queries += 1
+        return SUBCATEGORIES[category]
+
+
+class TestDescendantCrawl(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.directory = os.path.join(self.tmpdir.name, 'crawl')
+        self.messages = []
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def make_crawl(self, taxonomy, **kwargs):
+        return DescendantCrawl(taxonomy, 'Contents', self.directory,
+                               logger=self.messages.append, **kwargs)
+
+    def test_crawl(self):
+        taxonomy = FakeTaxonomy()
+        result = crawl_descendant_instances(taxonomy, 'Contents', self.directory,
+                                            logger=self.messages.append)
+        assert result == {'Pear', 'Apple', 'Banana', 'Poodle', 'Dog'}
+        assert sorted(taxonomy.expanded) == sorted(SUBCATEGORIES)
+        assert 'categories/s' in self.messages[-1]
+        assert 'queries/s' in self.messages[-1]
+
+    def test_resume(self):
+        for interrupt_after in range(len(SUBCATEGORIES)):
+            with self.subTest(interrupt_after=interrupt_after):
+                first = FakeTaxonomy(interrupt_after=interrupt_after)
+                crawl = self.make_crawl(first, checkpoint_every=2)
+                with self.assertRaises(KeyboardInterrupt):
+                    crawl.run()
+                second = FakeTaxonomy()
+                crawl = self.make_crawl(second, checkpoint_every=2)
+                assert crawl.run()
+                assert crawl.descendants() == \
+                    {'Pear', 'Apple', 'Banana', 'Poodle', 'Dog'}
+                # Nothing is lost or expanded twice
+                assert sorted(first.expanded + second.expanded) == \
+                    sorted(SUBCATEGORIES)
+                self.tmpdir.cleanup()
+                self.tmpdir = tempfile.TemporaryDirectory()
+                self.directory = os.path.join(self.tmpdir.name, 'crawl')
+
+    def test_partial_line(self):
+        crawl = self.make_crawl(FakeTaxonomy())
+        crawl.run(max_categories=3)
+        with open(crawl.visited_filename, 'a') as log:
+            log.write('Fruits\tPome_f')
+        crawl = self.make_crawl(FakeTaxonomy())
+        assert 'Fruits' not in crawl.visited
+        assert crawl.run()
+        assert crawl.descendants() == {'Pear', 'Apple', 'Banana', 'Poodle', 'Dog'}
+
+    def test_failures_are_retried(self):
+        crawl = self.make_crawl(FakeTaxonomy(failing=['Fruits']))
+        assert not crawl.run()
+        assert crawl.failed == ['Fruits']
+        assert crawl.descendants() == {'Pear', 'Apple', 'Banana', 'Poodle', 'Dog'}
+        taxonomy = FakeTaxonomy()
+        crawl = self.make_crawl(taxonomy)
+        assert crawl.run()
+        assert taxonomy.expanded == ['Fruits']
+
+    def test_other_root(self):
+        self.make_crawl(FakeTaxonomy()).run(max_categories=1)
+        with self.assertRaises(ValueError):
+            DescendantCrawl(FakeTaxonomy(), 'Dogs', self.directory)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,8 +2,14 @@
 Tests dbpedia.py, which creates a taxonomy based on the online DBpedia resource.
 """
 
+import asyncio
+import os
+import re
+import tempfile
 import unittest
 from dbpedia import DBpediaTaxonomy
+from querycache import QueryCache
+from sparqlclient import SparqlError
 from taxonomy import lowest_common_ancestor
 from solver import solve_puzzle, TaxonomySimilarity, solve_puzzles, silent_logger
 from puzzle import OddOneOutPuzzle, common2_puzzles
@@ -149,3 +155,159 @@ class TestDBpedia(unittest.TestCase):
         result = solve_puzzles(common2_puzzles, similarity, logger=silent_logger)
         assert result == (38, 14, 50)
 
+
+class FakeClient:
+    """
+    Stands in for SparqlClient: answers every ASK query with the given
+    boolean and counts the queries it receives.
+
+    """
+
+    def __init__(self, answer):
+        self.answer = answer
+        self.num_queries = 0
+
+    def query(self, query):
+        self.num_queries += 1
+        if self.answer is None:
+            raise SparqlError('endpoint unavailable')
+        return {'head': {}, 'boolean': self.answer}
+
+
+class FakeEndpoint:
+    """
+    Answers the ASK and batched SELECT queries of DBpediaTaxonomy over a
+    small in-memory graph, given as label -> parent labels maps.
+
+    """
+
+    def __init__(self, subjects, broader):
+        self.subjects = subjects
+        self.broader = broader
+        self.queries = []
+
+    def query(self, query):
+        self.queries.append(query)
+        if 'ASK' in query:
+            label, kind = re.search(r'rdfs:label "(.*?)"@en;\s*(rdf:type|dct:subject)',
+                                    query).groups()
+            if kind == 'rdf:type':
+                return {'head': {}, 'boolean': label in self.broader}
+            return {'head': {}, 'boolean': label in self.subjects}
+        values = re.search(r'VALUES \?child \{ (.*?) \}', query).group(1)
+        children = re.findall(r'"((?:[^"\\]|\\.)*)"@en', values)
+        links = self.broader if 'skos:broader' in query else self.subjects
+        rows = sorted((child, parent) for child in children
+                      for parent in links.get(child, []))
+        limit = int(re.search(r'LIMIT (\d+)', query).group(1))
+        offset = int(re.search(r'OFFSET (\d+)', query).group(1))
+        return {'head': {'vars': ['child', 'label']},
+                'results': {'bindings': [
+                    {'child': {'type': 'literal', 'value': child},
+                     'label': {'type': 'literal', 'value': parent}}
+                    for (child, parent) in rows[offset:offset + limit]]}}
+
+
+FAKE_SUBJECTS = {'Pear': ['Pome fruits', 'Edible fruits'],
+                 'Poodle': ['Water dogs']}
+FAKE_BROADER = {'Pome fruits': ['Edible fruits'],
+                'Edible fruits': ['Foods', 'Fruits'],
+                'Fruits': ['Foods'],
+                'Foods': ['Contents'],
+                'Water dogs': ['Dogs'],
+                'Dogs': ['Contents'],
+                'Contents': ['Meta']}
+
+
+class TestDBpediaCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.tmpdir.name, "dbpedia.sqlite")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_replay(self):
+        taxonomy = DBpediaTaxonomy(cache=QueryCache(self.filename))
+        taxonomy.client = FakeClient(True)
+        assert taxonomy.is_instance("Pear")
+        assert taxonomy.is_instance("Pear")
+        assert taxonomy.client.num_queries == 1
+        assert (taxonomy.num_queries, taxonomy.num_cache_hits) == (1, 1)
+
+        offline = DBpediaTaxonomy(cache=QueryCache(self.filename, offline=True))
+        offline.client = FakeClient(None)
+        assert offline.is_instance("Pear")
+        assert offline.is_instance("Rambutan") is None
+        assert offline.client.num_queries == 0
+        # Answered by the SQLite cache, not by the endpoint
+        assert (offline.num_queries, offline.num_cache_hits) == (0, 1)
+
+
+class TestDBpediaBatchedAncestors(unittest.TestCase):
+
+    def make_taxonomy(self, **kwargs):
+        self.endpoint = FakeEndpoint(FAKE_SUBJECTS, FAKE_BROADER)
+        return DBpediaTaxonomy(client=self.endpoint, **kwargs)
+
+    def test_ancestor_categories(self):
+        taxonomy = self.make_taxonomy()
+        expected = ['Contents', 'Edible fruits', 'Foods', 'Fruits', 'Pome fruits']
+        assert sorted(taxonomy.get_ancestor_categories("Pear")) == expected
+        # ASK, the instance's subjects, then one query for each of the two
+        # levels of categories below the root
+        assert len(self.endpoint.queries) == 4
+        assert sorted(taxonomy.get_ancestor_categories("Pear")) == expected
+        assert len(self.endpoint.queries) == 4
+        assert sorted(taxonomy.get_ancestor_categories("Fruits")) == \
+            ['Contents', 'Foods']
+        assert taxonomy.get_ancestor_categories("Contents") == set()
+
+    def test_small_batches_and_pages(self):
+        taxonomy = self.make_taxonomy(batch_size=1, page_size=1)
+        assert sorted(taxonomy.get_ancestor_categories("Pear")) == \
+            ['Contents', 'Edible fruits', 'Foods', 'Fruits', 'Pome fruits']
+        assert sorted(taxonomy.get_ancestor_categories("Poodle")) == \
+            ['Contents', 'Dogs', 'Water dogs']
+
+    def test_unknown_children(self):
+        # Rows for a child that was not asked about are ignored
+        class NormalizingEndpoint(FakeEndpoint):
+            def query(self, query):
+                result = super().query(query)
+                for row in result.get('results', {}).get('bindings', []):
+                    if row['child']['value'] == 'Pome fruits':
+                        row['child']['value'] = 'Pome Fruits'
+                return result
+
+        self.endpoint = NormalizingEndpoint(FAKE_SUBJECTS, FAKE_BROADER)
+        taxonomy = DBpediaTaxonomy(client=self.endpoint)
+        assert sorted(taxonomy.get_ancestor_categories("Pear")) == \
+            ['Contents', 'Edible fruits', 'Foods', 'Fruits', 'Pome fruits']
+        assert taxonomy.get_parent_categories(["Pome fruits"], "skos:broader") == \
+            {"Pome fruits": set()}
+
+    def test_prefetch(self):
+        taxonomy = self.make_taxonomy()
+        taxonomy.prefetch(["Pear", "Poodle", "Pear"])
+        num_queries = len(self.endpoint.queries)
+        assert taxonomy.is_instance("Poodle")
+        assert sorted(taxonomy.get_ancestor_categories("Poodle")) == \
+            ['Contents', 'Dogs', 'Water dogs']
+        assert sorted(taxonomy.get_ancestor_categories("Pear")) == \
+            ['Contents', 'Edible fruits', 'Foods', 'Fruits', 'Pome fruits']
+        assert len(self.endpoint.queries) == num_queries
+
+    def test_prefetch_in_event_loop(self):
+        taxonomy = self.make_taxonomy()
+
+        async def caller():
+            taxonomy.prefetch(["Pear", "Poodle"])
+
+        asyncio.run(caller())
+        num_queries = len(self.endpoint.queries)
+        assert num_queries > 0
+        assert sorted(taxonomy.get_ancestor_categories("Poodle")) == \
+            ['Contents', 'Dogs', 'Water dogs']
+        assert len(self.endpoint.queries) == num_queries
@@ -0,0 +1,134 @@
+"""
+Tests dbpedia_dump.py, which creates a taxonomy from local DBpedia dump files.
+"""
+
+import gzip
+import os
+import tempfile
+import unittest
+from dbpedia_dump import DBpediaDumpTaxonomy, compileSnapshot, read_triples, \
+    label_from_iri, RDFS_LABEL
+from taxonomy import lowest_common_ancestor
+from test_dbpedia import FAKE_SUBJECTS, FAKE_BROADER
+
+
+RESOURCE = 'http://dbpedia.org/resource/'
+SUBJECT = '<http://purl.org/dc/terms/subject>'
+BROADER = '<http://www.w3.org/2004/02/skos/core#broader>'
+LABEL = '<http://www.w3.org/2000/01/rdf-schema#label>'
+
+
+def iri(label, category=False):
+    prefix = 'Category:' if category else ''
+    return '<' + RESOURCE + prefix + label.replace(' ', '_') + '>'
+
+
+def write_small_dumps(directory):
+    """
+    Writes the graph of FAKE_SUBJECTS and FAKE_BROADER as three dumps, in
+    the layout of DBpedia's article_categories, skos_categories and labels
+    files. Returns their filenames.
+
+    """
+    articles = os.path.join(directory, 'article_categories_en.ttl')
+    with open(articles, 'w', encoding='utf-8') as dump:
+        dump.write('# started 2021-02-25\n')
+        for article, categories in FAKE_SUBJECTS.items():
+            for category in categories:
+                dump.write('{} {} {} .\n'.format(iri(article), SUBJECT,
+                                                 iri(category, True)))
+    categories = os.path.join(directory, 'skos_categories_en.ttl.gz')
+    with gzip.open(categories, 'wt', encoding='utf-8') as dump:
+        for category, parents in FAKE_BROADER.items():
+            dump.write('{} <http://www.w3.org/1999/02/22-rdf-syntax-ns#type> '
+                       '<http://www.w3.org/2004/02/skos/core#Concept> .\n'
+                       .format(iri(category, True)))
+            for parent in parents:
+                dump.write('{} {} {} .\n'.format(iri(category, True), BROADER,
+                                                 iri(parent, True)))
+    labels = os.path.join(directory, 'labels_en.ttl')
+    with open(labels, 'w', encoding='utf-8') as dump:
+        for article in FAKE_SUBJECTS:
+            dump.write('{} {} "{}"@en .\n'.format(iri(article), LABEL, article))
+        dump.write('{} {} "Poire"@fr .\n'.format(iri('Pear'), LABEL))
+    return [articles, categories, labels]
+
+
+class TestDBpediaDump(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.filenames = write_small_dumps(self.tmpdir.name)
+        self.taxonomy = DBpediaDumpTaxonomy(self.filenames)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_read_triples(self):
+        filename = os.path.join(self.tmpdir.name, 'escaped.nt')
+        with open(filename, 'w', encoding='utf-8') as dump:
+            dump.write('{} {} "Cr\\u00E8me \\"br\\u00FBl\\u00E9e\\""@en .\n'
+                       .format(iri('Creme_brulee'), LABEL))
+        assert list(read_triples(filename, (RDFS_LABEL,))) == \
+            [(RESOURCE + 'Creme_brulee', RDFS_LABEL, 'Crème "brûlée"')]
+
+    def test_label_from_iri(self):
+        assert label_from_iri(RESOURCE + 'Category:Pome_fruits') == 'Pome fruits'
+        assert label_from_iri(RESOURCE + 'Caf%C3%A9') == 'Café'
+
+    def test_num_instances(self):
+        assert self.taxonomy.num_instances() == 2
+
+    def test_is_instance(self):
+        assert self.taxonomy.is_instance("Pear")
+        assert not self.taxonomy.is_instance("Fruits")
+        assert not self.taxonomy.is_instance("Poire")
+        assert not self.taxonomy.is_instance("Rambutan")
+
+    def test_is_category(self):
+        assert self.taxonomy.is_category("Fruits")
+        assert self.taxonomy.is_category("Contents")
+        assert not self.taxonomy.is_category("Pear")
+
+    def test_ancestor_categories(self):
+        # The same answers as DBpediaTaxonomy gives over the same graph
+        assert sorted(self.taxonomy.get_ancestor_categories("Pear")) == \
+            ['Contents', 'Edible fruits', 'Foods', 'Fruits', 'Pome fruits']
+        assert sorted(self.taxonomy.get_ancestor_categories("Poodle")) == \
+            ['Contents', 'Dogs', 'Water dogs']
+        assert sorted(self.taxonomy.get_ancestor_categories("Fruits")) == \
+            ['Contents', 'Foods']
+        assert self.taxonomy.get_ancestor_categories("Contents") == set()
+        assert self.taxonomy.get_ancestor_categories("Rambutan") == set()
+
+    def test_labels_first(self):
+        # The labels can come before the links that name their resources
+        taxonomy = DBpediaDumpTaxonomy(self.filenames[::-1])
+        assert sorted(taxonomy.get_ancestor_categories("Pear")) == \
+            ['Contents', 'Edible fruits', 'Foods', 'Fruits', 'Pome fruits']
+        assert taxonomy.num_instances() == self.taxonomy.num_instances()
+
+    def test_descendant_instances(self):
+        assert self.taxonomy.get_descendant_instances("Foods") == {"Pear"}
+        assert self.taxonomy.get_descendant_instances("Contents") == \
+            {"Pear", "Poodle"}
+        assert self.taxonomy.num_descendant_instances("Contents") == 2
+        assert self.taxonomy.num_descendant_instances("Water dogs") == 1
+        assert self.taxonomy.num_descendant_instances("Pear") == 0
+
+    def test_lowest_common_ancestor(self):
+        assert lowest_common_ancestor(self.taxonomy, ["Pear"], "Poodle") == \
+            (1, "Edible fruits")
+
+    def test_snapshot(self):
+        snapshot = os.path.join(self.tmpdir.name, 'dbpedia.wcg')
+        compileSnapshot(self.filenames, snapshot)
+        loaded = DBpediaDumpTaxonomy(snapshot_filename=snapshot)
+        assert loaded.num_instances() == 2
+        assert loaded.get_ancestor_categories("Pear") == \
+            self.taxonomy.get_ancestor_categories("Pear")
+        assert loaded.num_descendant_instances("Foods") == 1
+
+
+if __name__ == '__main__':
+    unittest.main()
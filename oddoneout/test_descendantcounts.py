@@ -0,0 +1,67 @@
+import random
+import unittest
+from descendantcounts import strongly_connected_components, HyperLogLog
+from descendantcounts import descendant_instance_counts
+
+
+def brute_force_counts(children, instances):
+    counts = []
+    for start in range(len(children)):
+        seen = {start}
+        stack = [start]
+        found = set()
+        while stack:
+            node = stack.pop()
+            found.update(instances[node])
+            for child in children[node]:
+                if child not in seen:
+                    seen.add(child)
+                    stack.append(child)
+        counts.append(len(found))
+    return counts
+
+
+class TestDescendantCounts(unittest.TestCase):
+
+    def test_strongly_connected_components(self):
+        # 0 -> 1 -> 2 -> 1, 2 -> 3
+        children = [[1], [2], [1, 3], []]
+        component, num_components = strongly_connected_components(
+            4, children.__getitem__)
+        assert num_components == 3
+        assert component[1] == component[2]
+        assert component[3] < component[1] < component[0]
+
+    def test_exact_counts_with_cycles(self):
+        rng = random.Random(7)
+        num_nodes = 60
+        children = [rng.sample(range(num_nodes), rng.randint(0, 3))
+                    for _ in range(num_nodes)]
+        instances = [rng.sample(range(100), rng.randint(0, 4))
+                     for _ in range(num_nodes)]
+        counts = descendant_instance_counts(num_nodes, children.__getitem__,
+                                            instances.__getitem__)
+        assert list(counts) == brute_force_counts(children, instances)
+
+    def test_approximate_counts(self):
+        # A chain whose top holds 20000 instances: small counts stay exact
+        num_nodes = 5
+        children = [[1], [2], [3], [4], []]
+        instances = [list(range(10000, 20000)), list(range(5000, 10000)),
+                     list(range(100, 5000)), list(range(100)), [3]]
+        counts = descendant_instance_counts(num_nodes, children.__getitem__,
+                                            instances.__getitem__,
+                                            approximate=True, precision=12)
+        assert counts[4] == 1
+        assert counts[3] == 100
+        assert abs(counts[0] - 20000) < 0.05 * 20000
+
+    def test_hyperloglog(self):
+        sketch = HyperLogLog(precision=10)
+        for i in range(50000):
+            sketch.add(i)
+        other = HyperLogLog(precision=10)
+        for i in range(25000, 100000):
+            other.add(i)
+        sketch.update(other)
+        assert abs(len(sketch) - 100000) < 0.1 * 100000
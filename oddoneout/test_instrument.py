@@ -0,0 +1,105 @@
+"""
+Tests the instrumentation layer of instrument.py.
+"""
+
+import os
+import pstats
+import tempfile
+import unittest
+import instrument
+import solver
+import taxonomy
+from taxonomy import GraphTaxonomy, Specificity
+from solver import TaxonomySimilarity, solve_puzzles, silent_logger
+from puzzle import OddOneOutPuzzle
+
+
+class TestInstrument(unittest.TestCase):
+
+    def setUp(self):
+        self.taxonomy = GraphTaxonomy(
+            'entity',
+            {'apple': ['fruit'],
+             'lemon': ['citrus'],
+             'orange': ['citrus', 'color'],
+             'peach': ['fruit', 'color'],
+             'red': ['color'],
+             'yellow': ['color'],
+             'citrus': ['fruit'],
+             'fruit': ['entity'],
+             'color': ['entity'],
+             'entity': []})
+        self.puzzles = [
+            OddOneOutPuzzle('apple', ['orange', 'red', 'peach', 'yellow'], 'color'),
+            OddOneOutPuzzle('red', ['orange', 'lemon', 'apple'], 'fruit')]
+
+    def tearDown(self):
+        instrument.disable()
+
+    def test_disabled_leaves_originals(self):
+        get_ancestors = GraphTaxonomy.get_ancestor_categories
+        lca = solver.lowest_common_ancestor_from_ancestors
+        instrument.enable()
+        assert instrument.enabled()
+        assert GraphTaxonomy.get_ancestor_categories is not get_ancestors
+        assert solver.lowest_common_ancestor_from_ancestors is not lca
+        assert taxonomy.lowest_common_ancestor_from_ancestors is \
+            solver.lowest_common_ancestor_from_ancestors
+        instrument.disable()
+        assert not instrument.enabled()
+        assert GraphTaxonomy.get_ancestor_categories is get_ancestors
+        assert solver.lowest_common_ancestor_from_ancestors is lca
+        assert instrument.disable() is None
+
+    def test_counts(self):
+        with instrument.recording() as recorder:
+            assert solve_puzzles(self.puzzles, TaxonomySimilarity(self.taxonomy),
+                                 silent_logger) == (2, 0, 0)
+        assert recorder.calls('solve_puzzle') == 2
+        # The ancestors of each distinct word are looked up once per set
+        assert recorder.calls('GraphTaxonomy.get_ancestor_categories') == 6
+        assert recorder.calls('lowest_common_ancestor_from_ancestors') == 9
+        entries = recorder.as_dict()
+        spec = entries['Specificity.__call__']
+        assert spec['hits'] + spec['misses'] == spec['calls']
+        lru = entries['LRUCache.get']
+        assert lru['misses'] > 0
+        for entry in entries.values():
+            assert entry['self_seconds'] <= entry['total_seconds'] + 1e-9
+        report = recorder.report()
+        assert 'GraphTaxonomy.get_ancestor_categories' in report
+        assert report.splitlines()[1].split()[:2] == ['calls', 'per']
+
+    def test_specificity_hits(self):
+        specificity = Specificity(self.taxonomy)
+        with instrument.recording() as recorder:
+            specificity('fruit')
+            specificity('fruit')
+            specificity('color')
+        entry = recorder.as_dict()['Specificity.__call__']
+        assert (entry['hits'], entry['misses']) == (1, 2)
+
+    def test_output_files(self):
+        with tempfile.TemporaryDirectory() as directory:
+            report_filename = os.path.join(directory, 'run.txt')
+            stats_filename = os.path.join(directory, 'run.prof')
+            with instrument.recording(report_filename, stats_filename):
+                solve_puzzles(self.puzzles, TaxonomySimilarity(self.taxonomy),
+                              silent_logger)
+            with open(report_filename) as reader:
+                assert 'solve_puzzle' in reader.read()
+            stats = pstats.Stats(stats_filename)
+            functions = {name: value for (_, _, name), value in stats.stats.items()}
+            calls, _, _, _, callers = functions['GraphTaxonomy.get_ancestor_categories']
+            assert calls == 6
+            assert {name for (_, _, name) in callers} == \
+                {'TaxonomySimilarity.score_choices'}
+
+    def test_enable_twice(self):
+        instrument.enable()
+        with self.assertRaises(RuntimeError):
+            instrument.enable()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import itertools
+import unittest
+from lca import BitsetLCA
+from taxonomy import GraphTaxonomy, lowest_common_ancestor
+
+
+class TestBitsetLCA(unittest.TestCase):
+
+    def setUp(self):
+        self.example = GraphTaxonomy(
+            'entity',
+            {'apple': ['fruit'],
+             'lemon': ['citrus'],
+             'orange': ['citrus', 'color'],
+             'peach': ['fruit', 'color'],
+             'red': ['color'],
+             'yellow': ['color'],
+             'citrus': ['fruit'],
+             'fruit': ['entity'],
+             'color': ['entity'],
+             'entity': []}
+        )
+        self.engine = BitsetLCA(self.example)
+
+    def test_ranking(self):
+        engine = BitsetLCA(self.example, self.example.get_categories())
+        assert engine.categories == ['citrus', 'color', 'fruit', 'entity']
+        assert engine.specificities == [2, 4, 4, 6]
+
+    def test_lazy_ranking(self):
+        # Only the ancestors of the words looked up are ranked
+        assert self.engine.categories == []
+        self.engine.get_ancestor_mask('red')
+        assert sorted(self.engine.categories) == ['color', 'entity']
+        self.engine.lowest_common_ancestor(['orange', 'lemon'], 'apple')
+        assert sorted(self.engine.categories) == ['citrus', 'color', 'entity', 'fruit']
+
+    def test_lowest_common_ancestor(self):
+        assert self.engine.lowest_common_ancestor(['orange', 'lemon'],
+                                                  'apple') == (2, 'citrus')
+        assert self.engine.lowest_common_ancestor(['orange', 'lemon', 'peach'],
+                                                  'apple') == (6, 'entity')
+        assert self.engine.lowest_common_ancestor(['orange', 'peach'],
+                                                  'lemon') == (4, 'color')
+        assert self.engine.lowest_common_ancestor(['orange', 'peach'],
+                                                  'red') == (4, 'fruit')
+
+    def test_matches_set_version(self):
+        instances = ['apple', 'lemon', 'orange', 'peach', 'red', 'yellow']
+        for target in instances:
+            others = [word for word in instances if word != target]
+            for size in (2, 3):
+                for words in itertools.combinations(others, size):
+                    expected = lowest_common_ancestor(self.example,
+                                                      list(words), target)
+                    assert self.engine.lowest_common_ancestor(
+                        list(words), target) == expected
+
+    def test_unranked_category(self):
+        engine = BitsetLCA(self.example, categories=['fruit', 'entity'])
+        result = engine.lowest_common_ancestor(['orange', 'lemon'], 'apple')
+        assert result == (2, 'citrus')
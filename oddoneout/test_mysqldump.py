@@ -0,0 +1,112 @@
+"""
+Tests mysqldump.py, the streaming reader of the Wikipedia .sql.gz dumps.
+"""
+
+import gzip
+import os
+import tempfile
+import unittest
+from mysqldump import read_rows
+from wikigraph import buildCategoryGraph
+from categorygraph import SNAPSHOT_SECTIONS
+from test_wcg import SMALL_PAGES, SMALL_CATLINKS, write_small_dump
+
+
+PAGE_TABLE = """CREATE TABLE `page` (
+  `page_id` int(8) unsigned NOT NULL AUTO_INCREMENT,
+  `page_namespace` int(11) NOT NULL DEFAULT 0,
+  `page_title` varbinary(255) NOT NULL DEFAULT '',
+  `page_restrictions` tinyblob NOT NULL,
+  `page_is_redirect` tinyint(1) unsigned NOT NULL DEFAULT 0,
+  `page_len` int(8) unsigned NOT NULL DEFAULT 0,
+  PRIMARY KEY (`page_id`),
+  UNIQUE KEY `name_title` (`page_namespace`,`page_title`)
+) ENGINE=InnoDB DEFAULT CHARSET=binary;
+"""
+
+CATLINKS_TABLE = """CREATE TABLE `categorylinks` (
+  `cl_from` int(8) unsigned NOT NULL DEFAULT 0,
+  `cl_to` varbinary(255) NOT NULL DEFAULT '',
+  `cl_sortkey` varbinary(230) NOT NULL DEFAULT '',
+  `cl_timestamp` timestamp NOT NULL DEFAULT current_timestamp(),
+  `cl_type` enum('page','subcat','file') NOT NULL DEFAULT 'page',
+  PRIMARY KEY (`cl_from`,`cl_to`)
+) ENGINE=InnoDB DEFAULT CHARSET=binary;
+"""
+
+
+def write_sql_dump(filename, table, create_table, rows, rows_per_insert=2):
+    """
+    Writes rows (tuples of SQL literals) as a gzip'd mysqldump of a table.
+
+    """
+    with gzip.open(filename, 'wt', encoding='utf-8') as dump:
+        dump.write('-- MySQL dump 10.19\n')
+        dump.write('DROP TABLE IF EXISTS `{}`;\n'.format(table))
+        dump.write(create_table)
+        dump.write('LOCK TABLES `{}` WRITE;\n'.format(table))
+        for start in range(0, len(rows), rows_per_insert):
+            dump.write('INSERT INTO `{}` VALUES {};\n'.format(
+                table, ','.join('(' + ','.join(row) + ')'
+                                for row in rows[start:start + rows_per_insert])))
+        dump.write('UNLOCK TABLES;\n')
+
+
+def write_small_sql_dumps(directory):
+    """
+    The graph of test_wcg's small text dump, as .sql.gz dumps.
+    Returns their filenames.
+
+    """
+    catlinks_filename = os.path.join(directory, "small-categorylinks.sql.gz")
+    pages_filename = os.path.join(directory, "small-page.sql.gz")
+    write_sql_dump(pages_filename, 'page', PAGE_TABLE,
+                   [(page_id, namespace, title, "''", "0", "100")
+                    for (page_id, namespace, title) in SMALL_PAGES])
+    write_sql_dump(catlinks_filename, 'categorylinks', CATLINKS_TABLE,
+                   [(page_id, label, "'SORT,KEY'", "'2020-10-20 00:00:00'",
+                     link_type)
+                    for (page_id, label, link_type) in SMALL_CATLINKS], 3)
+    return catlinks_filename, pages_filename
+
+
+class TestMysqlDump(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_read_rows(self):
+        filename = os.path.join(self.tmpdir.name, "page.sql.gz")
+        write_sql_dump(filename, 'page', PAGE_TABLE,
+                       [("1", "0", "'O\\'Brien'", "''", "0", "10"),
+                        ("2", "0", "'Pasta_(food),_dried'", "NULL", "1", "20"),
+                        ("3", "14", "'Café'", "''", "0", "30")])
+        assert list(read_rows(filename, ('page_title', 'page_id'))) == \
+            [("'O\\'Brien'", "1"), ("'Pasta_(food),_dried'", "2"),
+             ("'Café'", "3")]
+        with self.assertRaises(ValueError):
+            list(read_rows(filename, ('page_id', 'page_lang')))
+
+    def test_graph_from_sql_dumps(self):
+        graph = buildCategoryGraph(*write_small_sql_dumps(self.tmpdir.name))
+        expected = buildCategoryGraph(*write_small_dump(self.tmpdir.name))
+        assert bytes(graph.titles.blob) == bytes(expected.titles.blob)
+        for name in SNAPSHOT_SECTIONS:
+            assert list(getattr(graph, name)) == list(getattr(expected, name))
+
+    def test_mixed_inputs(self):
+        sql_catlinks, sql_pages = write_small_sql_dumps(self.tmpdir.name)
+        text_catlinks, text_pages = write_small_dump(self.tmpdir.name)
+        with self.assertRaises(ValueError):
+            buildCategoryGraph(sql_catlinks, text_pages)
+        with self.assertRaises(ValueError):
+            buildCategoryGraph(text_catlinks, sql_pages)
+        with self.assertRaises(ValueError):
+            buildCategoryGraph(sql_catlinks, sql_pages, workers=2)
+
+
+if __name__ == '__main__':
+    unittest.main()
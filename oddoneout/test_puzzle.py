@@ -0,0 +1,125 @@
+import os
+import random
+import subprocess
+import sys
+import unittest
+import puzzle
+from puzzle import (OddOneOutPuzzle, PuzzleGenerator, generate_puzzle,
+                    generate_puzzles, iter_puzzle_set)
+
+
+CATEGORY_MAP = {'red': ['cherry', 'ruby', 'tomato', 'lips', 'fire truck'],
+                'green': ['grass', 'lime', 'emerald', 'frog', 'shamrock'],
+                'blue': ['sky', 'ocean', 'sapphire', 'bluebird'],
+                'white': ['snow', 'milk', 'cloud', 'ghost', 'pearl', 'salt']}
+
+
+class TestPuzzleSets(unittest.TestCase):
+
+    def test_iter_puzzle_set(self):
+        puzzles = iter_puzzle_set('common2')
+        first = next(puzzles)
+        assert isinstance(first, OddOneOutPuzzle)
+        assert first.category == 'halloween costume'
+        assert first.oddone == 'entrepreneur'
+        assert first.wordset == ['ghost', 'witch', 'mummy', 'zombie']
+        assert len(list(puzzles)) == 101
+
+    def test_lazy_attribute(self):
+        puzzles = puzzle.common2_puzzles
+        assert len(puzzles) == 102
+        assert puzzle.common2_puzzles is puzzles
+        assert [str(p) for p in puzzles] == \
+            [str(p) for p in iter_puzzle_set('common2')]
+        with self.assertRaises(AttributeError):
+            puzzle.common3_puzzles
+        with self.assertRaises(AttributeError):
+            puzzle.crowdsourced_puzzles
+        with self.assertRaises(ValueError):
+            iter_puzzle_set('common3')
+
+    def test_import_elsewhere(self):
+        # Importing does no I/O, and the sets are found from any directory
+        directory = os.path.dirname(os.path.abspath(__file__))
+        code = ("import sys; sys.path.insert(0, {!r}); import puzzle; "
+                "assert 'common2_puzzles' not in vars(puzzle); "
+                "print(len(puzzle.proper1_puzzles))").format(directory)
+        output = subprocess.check_output([sys.executable, '-c', code],
+                                         cwd=os.path.dirname(directory))
+        assert output.strip() == b'100'
+
+
+class TestPuzzleGenerator(unittest.TestCase):
+
+    def test_generate(self):
+        generator = PuzzleGenerator(CATEGORY_MAP, seed=3)
+        for category in CATEGORY_MAP:
+            for _ in range(20):
+                theme, oddman, *examples = generator.generate(category)
+                assert theme == category
+                assert len(examples) == 4
+                assert len(set(examples)) == 4
+                assert set(examples) <= set(CATEGORY_MAP[category])
+                assert oddman not in CATEGORY_MAP[category]
+
+    def test_leaves_lists_alone(self):
+        category_map = {category: list(examples)
+                        for category, examples in CATEGORY_MAP.items()}
+        generate_puzzles(category_map, 5, seed=0)
+        generate_puzzle(category_map, 'red', seed=0)
+        assert category_map == CATEGORY_MAP
+
+    def test_seeded(self):
+        assert generate_puzzles(CATEGORY_MAP, 5, seed=7) == \
+            generate_puzzles(CATEGORY_MAP, 5, seed=7)
+        assert generate_puzzles(CATEGORY_MAP, 5, seed=7) != \
+            generate_puzzles(CATEGORY_MAP, 5, seed=8)
+        assert generate_puzzle(CATEGORY_MAP, 'blue', seed=1) == \
+            generate_puzzle(CATEGORY_MAP, 'blue', seed=1)
+
+    def test_random_seed(self):
+        # Without a seed, random.seed makes the puzzles reproducible
+        random.seed(11)
+        puzzles = generate_puzzles(CATEGORY_MAP, 5)
+        single = generate_puzzle(CATEGORY_MAP, 'green')
+        random.seed(11)
+        assert generate_puzzles(CATEGORY_MAP, 5) == puzzles
+        assert generate_puzzle(CATEGORY_MAP, 'green') == single
+
+    def test_generate_puzzle(self):
+        # The same puzzle as a PuzzleGenerator's, for the same seed
+        for seed in range(20):
+            for category in CATEGORY_MAP:
+                assert generate_puzzle(CATEGORY_MAP, category, seed=seed) == \
+                    PuzzleGenerator(CATEGORY_MAP, seed=seed).generate(category)
+        with self.assertRaises(ValueError):
+            generate_puzzle({'red': ['cherry']}, 'red')
+        # Or from a generator, which keeps its own state
+        generator = PuzzleGenerator(CATEGORY_MAP, seed=4)
+        reference = PuzzleGenerator(CATEGORY_MAP, seed=4)
+        assert [generate_puzzle(generator, 'red') for _ in range(3)] == \
+            [reference.generate('red') for _ in range(3)]
+
+    def test_puzzles(self):
+        puzzles = generate_puzzles(CATEGORY_MAP, 3, seed=0)
+        assert len(puzzles) == 12
+        assert [p[0] for p in puzzles] == list(CATEGORY_MAP) * 3
+        # Without a number of rounds, the stream does not end
+        stream = PuzzleGenerator(CATEGORY_MAP, seed=0).puzzles()
+        assert [next(stream) for _ in range(12)] == puzzles
+        assert len(next(stream)) == 6
+        # The odd men are drawn from every other category
+        oddmen = {p[1] for p in PuzzleGenerator(CATEGORY_MAP, seed=0).puzzles(200)
+                  if p[0] == 'red'}
+        others = set(CATEGORY_MAP['green'] + CATEGORY_MAP['blue'] + CATEGORY_MAP['white'])
+        assert oddmen <= others
+        assert oddmen & set(CATEGORY_MAP['green']) and \
+            oddmen & set(CATEGORY_MAP['blue']) and oddmen & set(CATEGORY_MAP['white'])
+
+    def test_one_category(self):
+        with self.assertRaises(ValueError):
+            PuzzleGenerator({'red': ['cherry']}).generate('red')
+
+
+if __name__ == "__main__":
+    unittest.main()
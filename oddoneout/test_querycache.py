@@ -0,0 +1,108 @@
+import os
+import tempfile
+import unittest
+from querycache import QueryCache, CacheMiss, normalize_query
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+ASK_TRUE = {'head': {}, 'boolean': True}
+ASK_FALSE = {'head': {}, 'boolean': False}
+SELECT = {'head': {'vars': ['label']},
+          'results': {'bindings': [{'label': {'type': 'literal',
+                                              'value': 'Fruit'}}]}}
+
+
+class TestQueryCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.tmpdir.name, "queries.sqlite")
+        self.clock = FakeClock()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_normalize_query(self):
+        assert normalize_query("  ASK {\n   ?s ?p ?o\n}  ") == "ASK { ?s ?p ?o }"
+        # Whitespace inside literals is part of the query
+        query = 'ASK {\n  ?s rdfs:label %s@en\n}'
+        assert normalize_query(query % '"A  B"') == 'ASK { ?s rdfs:label "A  B"@en }'
+        assert normalize_query(query % '"A B"') == 'ASK { ?s rdfs:label "A B"@en }'
+        assert normalize_query(query % "'A\\'\tB'") == "ASK { ?s rdfs:label 'A\\'\tB'@en }"
+        assert normalize_query(query % '"""A\n B"""') == \
+            'ASK { ?s rdfs:label """A\n B"""@en }'
+
+    def test_literal_whitespace(self):
+        # Labels that differ only in their whitespace do not share a result
+        cache = QueryCache(self.filename)
+        query = 'SELECT ?s WHERE {\n  ?s rdfs:label %s@en\n}'
+        cache.put(query % '"A  B"', SELECT)
+        assert cache.get(query % '"A B"') is None
+        assert cache.get(query % '"A\tB"') is None
+        assert cache.get('  ' + query % '"A  B"') == SELECT
+
+    def test_persistence(self):
+        cache = QueryCache(self.filename)
+        assert cache.get("ASK { ?s ?p ?o }") is None
+        cache.put("ASK { ?s ?p ?o }", ASK_TRUE)
+        cache.close()
+        cache = QueryCache(self.filename)
+        assert cache.get("ASK {\n  ?s ?p ?o\n}") == ASK_TRUE
+        assert (cache.hits, cache.misses) == (1, 0)
+
+    def test_ttl(self):
+        cache = QueryCache(self.filename, ttl=60, negative_ttl=10,
+                           clock=self.clock)
+        cache.put("positive", SELECT)
+        cache.put("negative", ASK_FALSE)
+        self.clock.now += 30
+        assert cache.get("positive") == SELECT
+        assert cache.get("negative") is None
+        self.clock.now += 60
+        assert cache.get("positive") is None
+
+    def test_max_entries(self):
+        cache = QueryCache(self.filename, max_entries=2, clock=self.clock)
+        for query in ["a", "b", "c"]:
+            self.clock.now += 1
+            cache.put(query, ASK_TRUE)
+            if query == "b":
+                self.clock.now += 1
+                cache.get("a")
+        assert len(cache) == 2
+        assert cache.get("a") == ASK_TRUE
+        assert cache.get("b") is None
+
+    def test_evict_in_batches(self):
+        cache = QueryCache(self.filename, max_entries=20, clock=self.clock)
+        for i in range(20):
+            self.clock.now += 1
+            cache.put(str(i), ASK_TRUE)
+        cache.put("0", ASK_FALSE)   # Replaced, not added
+        assert len(cache) == 20
+        self.clock.now += 1
+        cache.put("new", ASK_TRUE)
+        # The oldest entries go, a tenth of max_entries beyond the excess
+        assert len(cache) == cache.count == 18
+        assert cache.get("1") is None and cache.get("3") is None
+        assert cache.get("0") == ASK_FALSE and cache.get("new") == ASK_TRUE
+        cache.close()
+        assert QueryCache(self.filename, max_entries=20).count == 18
+
+    def test_offline(self):
+        cache = QueryCache(self.filename, ttl=1, clock=self.clock)
+        cache.put("known", SELECT)
+        cache.close()
+        self.clock.now += 100
+        cache = QueryCache(self.filename, ttl=1, offline=True, clock=self.clock)
+        assert cache.get("known") == SELECT
+        with self.assertRaises(CacheMiss):
+            cache.get("unknown")
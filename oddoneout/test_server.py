@@ -0,0 +1,212 @@
+"""
+Tests server.py, the puzzle-solving service, over HTTP on localhost.
+"""
+
+import asyncio
+import http.client
+import json
+import multiprocessing
+import os
+import socket
+import tempfile
+import threading
+import unittest
+from server import PuzzleServer
+from taxonomy import GraphTaxonomy
+
+
+def fruit_taxonomy():
+    return GraphTaxonomy(
+        'entity',
+        {'apple': ['fruit'],
+         'lemon': ['citrus'],
+         'orange': ['citrus', 'color'],
+         'peach': ['fruit', 'color'],
+         'red': ['color'],
+         'yellow': ['color'],
+         'citrus': ['fruit'],
+         'fruit': ['entity'],
+         'color': ['entity'],
+         'entity': []})
+
+
+def animal_taxonomy():
+    return GraphTaxonomy(
+        'animal',
+        {'dog': ['mammal'], 'cat': ['mammal'], 'cow': ['mammal'],
+         'eagle': ['bird'], 'mammal': ['animal'], 'bird': ['animal'],
+         'animal': []})
+
+
+class UnixConnection(http.client.HTTPConnection):
+
+    def __init__(self, path):
+        super().__init__('localhost')
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.path)
+
+
+class TestServer(unittest.TestCase):
+
+    workers = 0
+
+    def setUp(self):
+        self.server = PuzzleServer({'fruit': fruit_taxonomy(),
+                                    'animal': animal_taxonomy()},
+                                   workers=self.workers)
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever)
+        self.thread.start()
+        listener = asyncio.run_coroutine_threadsafe(
+            self.server.start('127.0.0.1', 0), self.loop).result()
+        self.port = listener.sockets[0].getsockname()[1]
+        self.connection = http.client.HTTPConnection('127.0.0.1', self.port)
+
+    def tearDown(self):
+        self.connection.close()
+        asyncio.run_coroutine_threadsafe(self.server.aclose(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+    def request(self, method, path, payload=None, connection=None):
+        connection = connection or self.connection
+        body = None if payload is None else json.dumps(payload)
+        connection.request(method, path, body)
+        response = connection.getresponse()
+        return response.status, json.loads(response.read())
+
+    def test_backends(self):
+        status, payload = self.request('GET', '/backends')
+        assert status == 200
+        assert payload['backends']['fruit'] == {'root': 'entity', 'num_instances': 6}
+
+    def test_solve(self):
+        status, payload = self.request('POST', '/solve', {
+            'backend': 'fruit',
+            'puzzles': [{'choices': ['orange', 'red', 'peach', 'yellow', 'apple']},
+                        {'wordset': ['orange', 'lemon'], 'oddone': 'apple'},
+                        {'choices': ['orange', 'green']}]})
+        assert status == 200
+        assert payload['results'][0] == {'score': 0.25, 'reason': 'color',
+                                         'answer': 'apple'}
+        assert payload['results'][1]['correct'] is True
+        assert payload['results'][2] is None
+        # The same connection is kept alive for the next request
+        status, payload = self.request('POST', '/solve', {
+            'backend': 'animal',
+            'puzzles': [{'wordset': ['dog', 'cat', 'cow'], 'oddone': 'eagle'}]})
+        assert payload['results'][0]['answer'] == 'eagle'
+        assert payload['results'][0]['correct'] is True
+
+    def test_rank(self):
+        status, payload = self.request('POST', '/rank', {
+            'backend': 'fruit',
+            'puzzles': [{'choices': ['orange', 'lemon', 'apple']}]})
+        assert status == 200
+        assert [rank['choice'] for rank in payload['results'][0]] == \
+            ['apple', 'orange', 'lemon']
+
+    def test_lca(self):
+        status, payload = self.request('POST', '/lca', {
+            'backend': 'fruit',
+            'queries': [{'words': ['orange', 'lemon'], 'target': 'apple'},
+                        {'words': ['red', 'yellow'], 'target': 'apple'}]})
+        assert status == 200
+        assert payload['results'] == [{'specificity': 2, 'category': 'citrus'},
+                                      {'specificity': 4, 'category': 'color'}]
+
+    def test_batch(self):
+        puzzles = [{'wordset': ['dog', 'cat', 'cow'], 'oddone': 'eagle'}] * 25
+        status, payload = self.request('POST', '/solve', {'backend': 'animal',
+                                                          'puzzles': puzzles})
+        assert status == 200
+        assert len(payload['results']) == 25
+        assert all(result['correct'] for result in payload['results'])
+
+    def test_errors(self):
+        assert self.request('POST', '/solve', {'backend': 'nope', 'puzzles': []})[0] == 400
+        assert self.request('POST', '/solve', {'backend': 'fruit'})[0] == 400
+        assert self.request('POST', '/solve', {'backend': 'fruit',
+                                               'puzzles': [{'choices': ['a']}]})[0] == 400
+        assert self.request('POST', '/lca', {'backend': 'fruit',
+                                             'queries': [{'words': []}]})[0] == 400
+        # Two backends are loaded, so the backend must be named
+        assert self.request('POST', '/rank', {'puzzles': []})[0] == 400
+        assert self.request('GET', '/solve')[0] == 405
+        # Words are checked before anything is solved
+        bad_requests = [
+            ('/lca', {'queries': [{'words': [], 'target': 'apple'}]}),
+            ('/lca', {'queries': [{'words': 'orange', 'target': 'apple'}]}),
+            ('/lca', {'queries': [{'words': [['orange'], 'lemon'], 'target': 'apple'}]}),
+            ('/lca', {'queries': [{'words': ['orange', 'lemon'], 'target': 3}]}),
+            ('/lca', {'queries': ['orange']}),
+            ('/solve', {'puzzles': [{'choices': 'orange'}]}),
+            ('/solve', {'puzzles': [{'choices': ['orange', {'a': 1}]}]}),
+            ('/solve', {'puzzles': [{'wordset': 'dog', 'oddone': 'eagle'}]}),
+            ('/solve', {'puzzles': [{'wordset': ['dog', 'cat'], 'oddone': ['eagle']}]}),
+            ('/rank', {'puzzles': [{'choices': ['orange', None]}]})]
+        for path, request in bad_requests:
+            request['backend'] = 'fruit'
+            status, payload = self.request('POST', path, request)
+            assert status == 400, (path, request, payload)
+        assert self.request('GET', '/missing')[0] == 404
+        self.connection.request('POST', '/solve', 'not json')
+        response = self.connection.getresponse()
+        assert response.status == 400
+        assert 'invalid JSON' in json.loads(response.read())['error']
+
+    def raw_request(self, data):
+        with socket.create_connection(('127.0.0.1', self.port)) as sock:
+            sock.sendall(data)
+            response = b''
+            while True:
+                chunk = sock.recv(4096)
+                if not chunk:
+                    break
+                response += chunk
+        return response
+
+    def test_malformed_requests(self):
+        response = self.raw_request(b'GARBAGE\r\n\r\n')
+        assert response.startswith(b'HTTP/1.1 400 ')
+        assert b'malformed request line' in response
+        response = self.raw_request(b'POST /solve HTTP/1.1\r\n'
+                                    b'Content-Length: many\r\n\r\n')
+        assert response.startswith(b'HTTP/1.1 400 ')
+        assert b'malformed Content-Length' in response
+
+    def test_unix_socket(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'server.sock')
+            asyncio.run_coroutine_threadsafe(
+                self.server.start(unix_path=path), self.loop).result()
+            connection = UnixConnection(path)
+            try:
+                status, payload = self.request('GET', '/backends',
+                                               connection=connection)
+            finally:
+                connection.close()
+        assert status == 200 and set(payload['backends']) == {'fruit', 'animal'}
+
+
+class TestServerWorkers(TestServer):
+
+    workers = 2
+
+    def test_workers_started(self):
+        # The workers are forked when the server is made, not on the first
+        # request, from within the event loop
+        children = set(multiprocessing.active_children())
+        server = PuzzleServer({'fruit': fruit_taxonomy()}, workers=2)
+        try:
+            assert len(set(multiprocessing.active_children()) - children) == 2
+        finally:
+            server.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,10 +1,45 @@
 import unittest
+import solver
 from solver import TaxonomySimilarity, is_solvable, rank_puzzle_choices
 from solver import solve_puzzle, solve_puzzles, silent_logger
 from taxonomy import GraphTaxonomy
 from puzzle import OddOneOutPuzzle
 
 
+class CountingTaxonomy(GraphTaxonomy):
+
+    def __init__(self, root, parents):
+        super().__init__(root, parents)
+        self.lookups = []
+
+    def get_ancestor_categories(self, node):
+        self.lookups.append(node)
+        return super().get_ancestor_categories(node)
+
+
+class RecordingSimilarity(TaxonomySimilarity):
+
+    def __init__(self, taxonomy):
+        super().__init__(taxonomy)
+        self.prefetched = []
+
+    def prefetch(self, words):
+        self.prefetched.append(list(words))
+
+
+class DuckSimilarity:
+    # A model that does not subclass SimilarityScore
+
+    def __init__(self, taxonomy):
+        self.similarity = TaxonomySimilarity(taxonomy)
+
+    def __call__(self, word, other_words):
+        return self.similarity(word, other_words)
+
+    def is_recognized(self, word):
+        return self.similarity.is_recognized(word)
+
+
 class TestSolver(unittest.TestCase):
 
     def setUp(self):
@@ -118,6 +153,73 @@ class TestSolver(unittest.TestCase):
         result = solve_puzzles(puzzles, similarity, logger=silent_logger)
         assert result == (1, 1, 2)
 
-
-
-
+    def test_solve_puzzles_with_bitsets(self):
+        similarity = TaxonomySimilarity(self.example)
+        bitset_similarity = TaxonomySimilarity(self.example, use_bitsets=True)
+        puzzle = OddOneOutPuzzle("red",
+                                 ['orange', 'lemon'],
+                                 "citrus")
+        assert rank_puzzle_choices(puzzle, bitset_similarity) == \
+            rank_puzzle_choices(puzzle, similarity)
+        assert bitset_similarity('apple', ['orange', 'red', 'peach', 'yellow']) == \
+            (0.25, 'color')
+
+    def test_score_choices_shares_lookups(self):
+        taxonomy = CountingTaxonomy(self.example.root, self.example.parents)
+        similarity = TaxonomySimilarity(taxonomy)
+        choices = ['orange', 'red', 'peach', 'yellow', 'apple']
+        scores = similarity.score_choices(choices)
+        assert sorted(taxonomy.lookups) == sorted(choices)
+        assert scores == [similarity(choice, set(choices) - {choice})
+                          for choice in choices]
+
+    def test_solve_puzzles_shares_lookups(self):
+        taxonomy = CountingTaxonomy(self.example.root, self.example.parents)
+        similarity = TaxonomySimilarity(taxonomy)
+        puzzle1 = OddOneOutPuzzle("red",
+                                  ['orange', 'lemon'],
+                                  "citrus")
+        puzzle2 = OddOneOutPuzzle("orange",
+                                  ['red', 'lemon'],
+                                  "citrus")
+        solve_puzzles([puzzle1, puzzle2], similarity, logger=silent_logger)
+        assert sorted(taxonomy.lookups) == ['lemon', 'orange', 'red']
+
+    def test_solve_puzzles_duck_typed(self):
+        puzzles = [OddOneOutPuzzle("red", ['orange', 'lemon'], "citrus"),
+                   OddOneOutPuzzle("apple", ['orange', 'peach', 'red'], "color")]
+        assert solve_puzzles(puzzles, DuckSimilarity(self.example),
+                             logger=silent_logger) == (1, 0, 1)
+        assert solve_puzzles(puzzles, DuckSimilarity(self.example),
+                             logger=silent_logger, workers=2) == (1, 0, 1)
+
+    def test_solve_puzzles_prefetches_in_chunks(self):
+        similarity = RecordingSimilarity(self.example)
+        puzzles = [OddOneOutPuzzle("red", ['orange', 'lemon'], "citrus"),
+                   OddOneOutPuzzle("apple", ['orange', 'peach', 'red'], "color"),
+                   OddOneOutPuzzle("red", ['orange', 'lime'], "citrus")]
+        chunk_size = solver.PREFETCH_CHUNK_SIZE
+        solver.PREFETCH_CHUNK_SIZE = 2
+        try:
+            # A stream of puzzles is read one chunk at a time
+            result = solve_puzzles(iter(puzzles), similarity, logger=silent_logger)
+        finally:
+            solver.PREFETCH_CHUNK_SIZE = chunk_size
+        assert result == (1, 0, 2)
+        assert similarity.prefetched == [['orange', 'lemon', 'red',
+                                          'orange', 'peach', 'red', 'apple'],
+                                         ['orange', 'lime', 'red']]
+
+    def test_solve_puzzles_in_parallel(self):
+        similarity = TaxonomySimilarity(self.example)
+        puzzles = [OddOneOutPuzzle("red", ['orange', 'lemon'], "citrus"),
+                   OddOneOutPuzzle("apple", ['orange', 'peach', 'red'], "color"),
+                   OddOneOutPuzzle("red", ['orange', 'lime'], "citrus"),
+                   OddOneOutPuzzle("orange", ['red', 'lemon'], "citrus")] * 5
+        serial_log = []
+        parallel_log = []
+        expected = solve_puzzles(puzzles, similarity, logger=serial_log.append)
+        result = solve_puzzles(puzzles, similarity,
+                               logger=parallel_log.append, workers=2)
+        assert result == expected == (5, 5, 10)
+        assert parallel_log == serial_log
@@ -0,0 +1,152 @@
+"""
+Tests sparqlclient.py against a stub SPARQL server on localhost.
+"""
+
+import json
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+from sparqlclient import SparqlClient, SparqlError, TokenBucket
+
+
+class StubSparqlHandler(BaseHTTPRequestHandler):
+    """
+    Answers ASK queries with true, and unbalanced ones with 400. The
+    server's `failures` list holds the statuses to answer the next requests
+    with, before answering normally.
+
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        server = self.server
+        length = int(self.headers['Content-Length'])
+        query = parse_qs(self.rfile.read(length).decode('utf-8'))['query'][0]
+        with server.lock:
+            server.queries.append(query)
+            server.connections.add(self.client_address)
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+            status = server.failures.pop(0) if server.failures else 200
+        if query.count('{') != query.count('}'):
+            status = 400
+        time.sleep(server.delay)
+        if status == 200:
+            body = json.dumps({'head': {}, 'boolean': True,
+                               'query': query}).encode('utf-8')
+        else:
+            body = b'try again'
+        with server.lock:
+            server.active -= 1
+        self.send_response(status)
+        if status == 503:
+            self.send_header('Retry-After', '0')
+        self.send_header('Content-Type', 'application/sparql-results+json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestSparqlClient(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubSparqlHandler)
+        self.server.lock = threading.Lock()
+        self.server.queries = []
+        self.server.connections = set()
+        self.server.failures = []
+        self.server.active = 0
+        self.server.max_active = 0
+        self.server.delay = 0
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+        host, port = self.server.server_address
+        self.endpoint = 'http://{}:{}/sparql'.format(host, port)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def make_client(self, **kwargs):
+        options = dict(rate=1000.0, backoff=0.001)
+        options.update(kwargs)
+        client = SparqlClient(self.endpoint, **options)
+        self.addCleanup(client.close)
+        return client
+
+    def test_query(self):
+        client = self.make_client()
+        assert client.query('ASK { ?s ?p ?o }')['boolean']
+        assert self.server.queries == ['ASK { ?s ?p ?o }']
+
+    def test_reuses_connections(self):
+        client = self.make_client()
+        for i in range(5):
+            client.query('ASK {}')
+        assert len(self.server.queries) == 5
+        assert len(self.server.connections) == 1
+
+    def test_retries(self):
+        self.server.failures = [503, 500]
+        client = self.make_client()
+        assert client.query('ASK {}')['boolean']
+        assert client.num_requests == 3
+        assert client.num_retries == 2
+
+    def test_gives_up(self):
+        self.server.failures = [503] * 3
+        client = self.make_client(retries=2)
+        with self.assertRaises(SparqlError):
+            client.query('ASK {}')
+        assert client.num_requests == 3
+
+    def test_client_error_is_not_retried(self):
+        client = self.make_client()
+        with self.assertRaises(SparqlError):
+            client.query('ASK {')
+        assert client.num_requests == 1
+
+    def test_query_many(self):
+        self.server.delay = 0.05
+        client = self.make_client(max_in_flight=3)
+        queries = ['ASK { <%d> ?p ?o }' % i for i in range(12)]
+        results = client.query_many(queries)
+        assert [result['query'] for result in results] == queries
+        assert 1 < self.server.max_active <= 3
+
+    def test_query_many_exceptions(self):
+        client = self.make_client()
+        results = client.query_many(['ASK {', 'ASK {}'],
+                                    return_exceptions=True)
+        assert isinstance(results[0], SparqlError)
+        assert results[1]['boolean']
+
+
+class TestTokenBucket(unittest.TestCase):
+
+    def test_rate(self):
+        now = [0.0]
+        sleeps = []
+
+        def sleep(seconds):
+            sleeps.append(seconds)
+            now[0] += seconds
+
+        bucket = TokenBucket(rate=2.0, burst=2, clock=lambda: now[0],
+                             sleep=sleep)
+        for i in range(6):
+            bucket.acquire()
+        # Two tokens up front, then one every half second
+        assert sleeps == [0.5, 0.5, 0.5, 0.5]
+        assert now[0] == 2.0
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,9 @@
+import os
+import pickle
+import tempfile
 import unittest
-from taxonomy import GraphTaxonomy, lowest_common_ancestor
+from taxonomy import GraphTaxonomy, LRUCache, lowest_common_ancestor, Specificity, \
+    specificity
 
 
 class TestTaxonomy(unittest.TestCase):
@@ -54,6 +58,11 @@ class TestTaxonomy(unittest.TestCase):
         result = self.example.get_descendant_instances('fruit')
         assert result == {'lemon', 'orange', 'apple', 'peach'}
 
+    def test_num_descendant_instances(self):
+        for node in ['apple', 'citrus', 'color', 'fruit', 'entity', 'green']:
+            expected = len(self.example.get_descendant_instances(node))
+            assert self.example.num_descendant_instances(node) == expected
+
     def test_get_ancestor_categories(self):
         result = self.example.get_ancestor_categories('lemon')
         assert result == {'citrus', 'fruit', 'entity'}
@@ -89,3 +98,110 @@ class TestTaxonomy(unittest.TestCase):
                                         ['orange', 'peach'],
                                         'red')
         assert result == (4, 'fruit')
+
+    def test_ancestor_cache(self):
+        self.example.get_ancestor_categories('lemon')
+        misses = self.example.ancestor_cache.misses
+        result = self.example.get_ancestor_categories('orange')
+        assert result == {'citrus', 'fruit', 'color', 'entity'}
+        # 'citrus' and everything above it were cached by the first call
+        assert self.example.ancestor_cache.misses == misses + 2
+        assert self.example.get_ancestor_categories('orange') == result
+        assert self.example.ancestor_cache.misses == misses + 2
+
+    def test_deep_hierarchy(self):
+        depth = 2000
+        parents = {'node{}'.format(i): ['node{}'.format(i + 1)]
+                   for i in range(depth)}
+        parents['node{}'.format(depth)] = []
+        taxonomy = GraphTaxonomy('node{}'.format(depth), parents)
+        assert len(taxonomy.get_ancestor_categories('node0')) == depth
+        assert taxonomy.get_descendant_instances('node{}'.format(depth)) == {'node0'}
+
+    def test_cycle(self):
+        taxonomy = GraphTaxonomy('top', {'a': ['b'], 'b': ['c'], 'c': ['b', 'top'],
+                                         'top': []})
+        assert taxonomy.get_ancestor_categories('a') == {'b', 'c', 'top'}
+        assert taxonomy.get_ancestor_categories('b') == {'b', 'c', 'top'}
+        assert taxonomy.get_descendant_instances('top') == {'a'}
+
+
+class TestLRUCache(unittest.TestCase):
+
+    def test_eviction(self):
+        cache = LRUCache(maxsize=2)
+        cache['a'] = 1
+        cache['b'] = 2
+        assert cache.get('a') == 1
+        cache['c'] = 3
+        assert 'a' in cache and 'c' in cache and 'b' not in cache
+        assert cache.get('b') is None
+        assert cache.stats() == {'hits': 1, 'misses': 1, 'size': 2, 'maxsize': 2}
+
+
+class CountingTaxonomy(GraphTaxonomy):
+
+    def __init__(self, root, parents, **kwargs):
+        self.counted = []
+        super().__init__(root, parents, **kwargs)
+
+    def num_descendant_instances(self, node):
+        self.counted.append(node)
+        return super().num_descendant_instances(node)
+
+
+class TestSpecificity(unittest.TestCase):
+
+    def setUp(self):
+        self.fruits = CountingTaxonomy('top', {'apple': ['fruit'], 'pear': ['fruit'],
+                                               'fruit': ['top'], 'top': []})
+        self.colors = CountingTaxonomy('top', {'red': ['top'], 'top': []})
+
+    def test_per_taxonomy(self):
+        # The same category name in two taxonomies does not collide
+        assert specificity(self.fruits, 'top') == 2
+        assert specificity(self.colors, 'top') == 1
+        assert specificity(self.fruits, 'top') == 2
+        assert self.fruits.counted == ['top']
+        assert self.fruits.specificity is not self.colors.specificity
+
+    def test_bounded(self):
+        spec = Specificity(self.fruits, maxsize=1)
+        assert spec('fruit') == 2
+        assert spec('top') == 2
+        assert spec('fruit') == 2
+        assert self.fruits.counted == ['fruit', 'top', 'fruit']
+        assert spec.stats() == {'hits': 0, 'misses': 3, 'size': 1, 'maxsize': 1}
+        fruits = GraphTaxonomy('top', self.fruits.parents, specificity_cache_size=1)
+        assert fruits.specificity.stats()['maxsize'] == 1
+
+    def test_warm_start(self):
+        spec = Specificity(self.fruits)
+        spec('fruit')
+        spec('top')
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'specificity.tsv')
+            spec.save(filename)
+            fruits = CountingTaxonomy('top', self.fruits.parents,
+                                      specificity_filename=filename)
+            assert Specificity(fruits, maxsize=1, filename=filename).stats()['size'] == 1
+            # A file saved from another taxonomy is rejected
+            with self.assertRaises(ValueError):
+                Specificity(self.colors, filename=filename)
+            with self.assertRaises(ValueError):
+                CountingTaxonomy('fruit', self.fruits.parents,
+                                 specificity_filename=filename)
+        assert specificity(fruits, 'top') == 2
+        assert specificity(fruits, 'fruit') == 2
+        assert fruits.counted == []
+
+    def test_pickle(self):
+        spec = Specificity(self.fruits)
+        spec('fruit')
+        copy = pickle.loads(pickle.dumps(spec))
+        assert copy('fruit') == 2
+        assert copy.stats()['size'] == 1
+        # The copy keeps a copy of its taxonomy
+        assert copy('top') == 2
+        assert copy.taxonomy.counted == ['fruit', 'top']
+        assert self.fruits.counted == ['fruit']
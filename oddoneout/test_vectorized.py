@@ -0,0 +1,111 @@
+"""
+Tests that vectorized.py solves puzzle sets as solve_puzzles does.
+"""
+
+import random
+import unittest
+from taxonomy import GraphTaxonomy
+from solver import TaxonomySimilarity, solve_puzzle, solve_puzzles, silent_logger
+from puzzle import OddOneOutPuzzle
+from benchmark import synthetic_taxonomy, synthetic_puzzles
+
+try:
+    import numpy
+    from vectorized import evaluate_puzzles, solve_puzzles_vectorized, \
+        lowest_common_ranks, MAX_CHOICES
+except ImportError:
+    numpy = None
+
+
+@unittest.skipIf(numpy is None, 'NumPy is not installed')
+class TestVectorized(unittest.TestCase):
+
+    def setUp(self):
+        self.example = GraphTaxonomy(
+            'entity',
+            {'apple': ['fruit'],
+             'lemon': ['citrus'],
+             'orange': ['citrus', 'color'],
+             'peach': ['fruit', 'color'],
+             'red': ['color'],
+             'yellow': ['color'],
+             'citrus': ['fruit'],
+             'fruit': ['entity'],
+             'color': ['entity'],
+             'entity': []})
+
+    def assert_same_as_solver(self, puzzles, taxonomy):
+        evaluation = evaluate_puzzles(puzzles, taxonomy)
+        similarity = TaxonomySimilarity(taxonomy)
+        for i, puzzle in enumerate(puzzles):
+            solution = solve_puzzle(puzzle, similarity)
+            assert evaluation.hypotheses[i] == \
+                (None if solution is None else solution[2])
+            if solution is not None:
+                choices = puzzle.wordset + [puzzle.oddone]
+                scores = similarity.score_choices(choices)
+                assert list(evaluation.scores[i, :len(choices)]) == \
+                    [score for (score, _) in scores]
+                assert list(evaluation.reasons[i, :len(choices)]) == \
+                    [reason for (_, reason) in scores]
+        assert evaluation.counts() == \
+            solve_puzzles(puzzles, TaxonomySimilarity(taxonomy), silent_logger)
+
+    def test_example(self):
+        puzzles = [
+            OddOneOutPuzzle('apple', ['orange', 'red', 'peach', 'yellow'], 'color'),
+            OddOneOutPuzzle('apple', ['orange', 'lemon'], 'citrus'),
+            OddOneOutPuzzle('red', ['orange', 'peach'], 'fruit'),
+            OddOneOutPuzzle('green', ['red', 'yellow'], 'color'),
+            OddOneOutPuzzle('lemon', ['lemon', 'orange'], 'citrus'),
+            OddOneOutPuzzle('red', ['yellow'], 'color')]
+        self.assert_same_as_solver(puzzles, self.example)
+        evaluation = evaluate_puzzles(puzzles, self.example)
+        assert evaluation.hypotheses[1] == 'apple'
+        assert list(evaluation.specificities[1, :3]) == [6, 6, 2]
+        assert evaluation.answers[3] == -1
+
+    def test_generated_lists(self):
+        # [category, oddone, examples...], as generate_puzzles makes them
+        assert solve_puzzles_vectorized([['citrus', 'red', 'orange', 'lemon']],
+                                        self.example) == (1, 0, 0)
+
+    def test_synthetic(self):
+        root, parents = synthetic_taxonomy(5000, seed=3)
+        taxonomy = GraphTaxonomy(root, parents)
+        puzzles = synthetic_puzzles(root, parents, 200, seed=3)
+        rng = random.Random(3)
+        instances = [node for node in parents if node.startswith('I')]
+        # Random puzzles of various sizes, with ties and abstentions
+        for size in (2, 3, 4, 6):
+            for _ in range(50):
+                words = rng.sample(instances, size)
+                puzzles.append(OddOneOutPuzzle(words[0], words[1:], None))
+        self.assert_same_as_solver(puzzles, taxonomy)
+
+    def test_lowest_common_ranks(self):
+        # Ancestor ranks: word 0 has {0, 2}, word 1 {0, 1}, word 2 {1, 3}
+        offsets = numpy.array([0, 2, 4, 6])
+        ranks = numpy.array([0, 2, 1, 0, 3, 1])
+        matrix = numpy.array([[0, 1, 2], [0, 0, 1]])
+        assert lowest_common_ranks(matrix, offsets, ranks, 4).tolist() == \
+            [[1, 4, 0], [1, 1, 2]]
+
+    def test_too_many_choices(self):
+        # The choice positions would overflow the int64 masks
+        root, parents = synthetic_taxonomy(1000, seed=3)
+        taxonomy = GraphTaxonomy(root, parents)
+        instances = [node for node in parents if node.startswith('I')]
+        words = instances[:MAX_CHOICES]
+        self.assert_same_as_solver([OddOneOutPuzzle(words[0], words[1:], None)],
+                                   taxonomy)
+        words = instances[:MAX_CHOICES + 1]
+        with self.assertRaises(ValueError):
+            evaluate_puzzles([OddOneOutPuzzle(words[0], words[1:], None)], taxonomy)
+        with self.assertRaises(ValueError):
+            lowest_common_ranks(numpy.zeros((1, MAX_CHOICES + 1), dtype=numpy.int64),
+                                numpy.array([0, 0]), numpy.array([], dtype=numpy.int64), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
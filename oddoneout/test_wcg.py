@@ -1,15 +1,32 @@
+import os
+import pickle
+import tempfile
 import unittest
-from wikigraph import WCGTaxonomy
+from wikigraph import WCGTaxonomy, compileSnapshot, buildCategoryGraph
+from categorygraph import SNAPSHOT_SECTIONS, load_category_graph
 from taxonomy import lowest_common_ancestor
+from lca import BitsetLCA
 from solver import solve_puzzle, TaxonomySimilarity, solve_puzzles, silent_logger
 from puzzle import OddOneOutPuzzle, common2_puzzles
 
 
+SNAPSHOT = "../enwiki-20201020.wcg"
+
+
 class TestWCG(unittest.TestCase):
 
+    @classmethod
+    def setUpClass(cls):
+        # Parse the dump files once; every test then maps the snapshot.
+        # A snapshot of an older version (or none) is compiled again
+        try:
+            load_category_graph(SNAPSHOT)
+        except (OSError, ValueError):
+            compileSnapshot("../enwiki-20201020-categorylinks",
+                            "../enwiki-20201020-page", SNAPSHOT)
+
     def setUp(self):
-        self.taxonomy = WCGTaxonomy("../enwiki-20201020-categorylinks",
-                                    "../enwiki-20201020-page")
+        self.taxonomy = WCGTaxonomy(snapshot_filename=SNAPSHOT)
 
     def test_is_instance(self):
         assert self.taxonomy.is_instance("'Easy_Peach_Cobbler'")
@@ -219,3 +236,154 @@ class TestWCG(unittest.TestCase):
         result = solve_puzzles(common2_puzzles, similarity, logger=silent_logger)
         assert result == (38, 14, 50)
 
+
+SMALL_PAGES = [
+    ("1", "14", "'Contents'"),
+    ("2", "14", "'Recipes'"),
+    ("3", "14", "'Vegan_recipes'"),
+    ("4", "14", "'Dessert_recipes'"),
+    ("5", "0", "'Tofu'"),
+    ("6", "0", "'Sorbet'"),
+    ("7", "0", "'Cake'"),
+    ("8", "1", "'Tofu'"),
+    ("9", "6", "'Tofu.jpg'"),
+]
+
+SMALL_CATLINKS = [
+    ("2", "'Contents'", "'subcat'"),
+    ("3", "'Recipes'", "'subcat'"),
+    ("4", "'Recipes'", "'subcat'"),
+    ("5", "'Vegan_recipes'", "'page'"),
+    ("6", "'Vegan_recipes'", "'page'"),
+    ("6", "'Dessert_recipes'", "'page'"),
+    ("7", "'Dessert_recipes'", "'page'"),
+    ("9", "'Vegan_recipes'", "'file'"),
+    ("8", "'Recipes'", "'page'"),
+]
+
+
+def write_small_dump(directory):
+    """
+    Writes a tiny categorylinks/page file pair in the format produced
+    by download.py, and returns their filenames.
+
+    """
+    catlinks_filename = os.path.join(directory, "small-categorylinks")
+    pages_filename = os.path.join(directory, "small-page")
+    with open(pages_filename, 'w') as writer:
+        for page_id, namespace, title in SMALL_PAGES:
+            writer.write('\t'.join([page_id, namespace, title, "0", "100",
+                                    "'wikitext'", "NULL"]) + '\n')
+    with open(catlinks_filename, 'w') as writer:
+        for row in SMALL_CATLINKS:
+            writer.write('\t'.join(row) + '\n')
+    return catlinks_filename, pages_filename
+
+
+class TestSmallWCG(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        catlinks_filename, pages_filename = write_small_dump(self.tmpdir.name)
+        self.taxonomy = WCGTaxonomy(catlinks_filename, pages_filename)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_num_instances(self):
+        assert self.taxonomy.num_instances() == 3
+
+    def test_is_instance(self):
+        assert self.taxonomy.is_instance("'Tofu'")
+        assert self.taxonomy.is_instance("'Cake'")
+        assert not self.taxonomy.is_instance("'Recipes'")
+        assert not self.taxonomy.is_instance("'Tofu.jpg'")
+
+    def test_is_category(self):
+        assert self.taxonomy.is_category("'Recipes'")
+        assert self.taxonomy.is_category("'Vegan_recipes'")
+        assert not self.taxonomy.is_category("'Sorbet'")
+        assert not self.taxonomy.is_category("'Missing'")
+
+    def test_ancestor_categories(self):
+        result = self.taxonomy.get_ancestor_categories("'Sorbet'")
+        assert sorted(result) == ["'Contents'", "'Dessert_recipes'",
+                                  "'Recipes'", "'Vegan_recipes'"]
+        assert self.taxonomy.get_ancestor_categories("'Missing'") == set()
+
+    def test_descendant_instances(self):
+        result = self.taxonomy.get_descendant_instances("'Recipes'")
+        assert result == {"'Tofu'", "'Sorbet'", "'Cake'"}
+        result = self.taxonomy.get_descendant_instances("'Vegan_recipes'")
+        assert result == {"'Tofu'", "'Sorbet'"}
+        assert self.taxonomy.get_descendant_instances("'Tofu'") == set()
+
+    def test_num_descendant_instances(self):
+        for category in ["'Contents'", "'Recipes'", "'Vegan_recipes'",
+                         "'Dessert_recipes'", "'Tofu'", "'Missing'"]:
+            expected = len(self.taxonomy.get_descendant_instances(category))
+            assert self.taxonomy.num_descendant_instances(category) == expected
+
+    def test_page_and_catlinks_dicts(self):
+        pages = self.taxonomy.get_page_dict()
+        catlinks = self.taxonomy.get_catlinks_dict()
+        assert pages["'Tofu'"] == [('5', '0')]
+        assert pages["5"] == [("'Tofu'", '0')]
+        # Metadata pages (a talk page, a file) are not in the graph
+        assert "8" not in pages and "9" not in pages
+        assert "'Missing'" not in pages
+        assert sorted(catlinks["'Vegan_recipes'"]) == \
+            [('5', "'page'"), ('6', "'page'")]
+        assert sorted(catlinks["6"]) == [("'Dessert_recipes'", "'page'"),
+                                         ("'Vegan_recipes'", "'page'")]
+        assert catlinks["3"] == [("'Recipes'", "'subcat'")]
+        assert "'Sorbet'" not in catlinks
+        assert len(pages) == len(list(pages)) == 14
+        assert len(catlinks) == len(list(catlinks)) == 10
+
+    def test_lookups_do_not_modify_graph(self):
+        pages = self.taxonomy.get_page_dict()
+        catlinks = self.taxonomy.get_catlinks_dict()
+        num_pages = len(pages)
+        num_catlinks = len(catlinks)
+        self.taxonomy.get_ancestor_categories("'Missing'")
+        self.taxonomy.get_descendant_instances("'Missing'")
+        self.taxonomy.get_ancestor_categories("'Sorbet'")
+        pages["'Sorbet'"].append(('10', '0'))
+        assert len(pages) == num_pages
+        assert len(catlinks) == num_catlinks
+        assert len(pages["'Sorbet'"]) == 1
+        with self.assertRaises(TypeError):
+            pages["'Pie'"] = [('10', '0')]
+
+    def test_lowest_common_ancestor(self):
+        result = lowest_common_ancestor(self.taxonomy,
+                                        ["'Tofu'", "'Sorbet'"],
+                                        "'Cake'")
+        assert result == (2, "'Vegan_recipes'")
+        engine = BitsetLCA(self.taxonomy)
+        assert engine.lowest_common_ancestor(["'Tofu'", "'Sorbet'"],
+                                             "'Cake'") == result
+
+    def test_snapshot(self):
+        snapshot_filename = os.path.join(self.tmpdir.name, "small.wcg")
+        catlinks_filename, pages_filename = write_small_dump(self.tmpdir.name)
+        compileSnapshot(catlinks_filename, pages_filename, snapshot_filename)
+        taxonomy = WCGTaxonomy(snapshot_filename=snapshot_filename)
+        assert taxonomy.num_instances() == 3
+        assert taxonomy.get_ancestor_categories("'Sorbet'") == \
+            self.taxonomy.get_ancestor_categories("'Sorbet'")
+        assert taxonomy.get_descendant_instances("'Recipes'") == \
+            {"'Tofu'", "'Sorbet'", "'Cake'"}
+        graph = pickle.loads(pickle.dumps(taxonomy.graph))
+        assert graph.snapshot_filename == snapshot_filename
+        assert graph.num_pages() == taxonomy.graph.num_pages()
+
+    def test_parallel_load(self):
+        catlinks_filename, pages_filename = write_small_dump(self.tmpdir.name)
+        serial = buildCategoryGraph(catlinks_filename, pages_filename)
+        parallel = buildCategoryGraph(catlinks_filename, pages_filename,
+                                      workers=3)
+        assert bytes(parallel.titles.blob) == bytes(serial.titles.blob)
+        for name in SNAPSHOT_SECTIONS:
+            assert list(getattr(parallel, name)) == list(getattr(serial, name))
@@ -0,0 +1,66 @@
+"""
+Tests the categorylinks and page file readers of wiki_demo.py.
+"""
+
+import tempfile
+import unittest
+from wiki_demo import findPagesInCategory, findPagesById, \
+    findPagesInCategories, findPagesByIds, resolveCategories, findSubcategories
+from test_wcg import write_small_dump
+
+
+class TestWikiDemo(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.catlinks_filename, self.pages_filename = \
+            write_small_dump(self.tmpdir.name)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_find_pages_by_id(self):
+        id_list = ["6", "5", "42"]
+        assert findPagesById(self.pages_filename, id_list) == \
+            {"'Tofu'": ["5", "0"], "'Sorbet'": ["6", "0"]}
+        # The ids that were not found are left in the list
+        assert id_list == ["42"]
+
+    def test_find_pages_in_categories(self):
+        found = findPagesInCategories(self.catlinks_filename,
+                                      ["'Vegan_recipes'", "'Recipes'",
+                                       "'Missing'"])
+        for category, lists in found.items():
+            assert lists == findPagesInCategory(self.catlinks_filename, category)
+        assert found["'Vegan_recipes'"] == (["5", "6"], [], ["9"])
+
+    def test_find_pages_by_ids(self):
+        found = findPagesByIds(self.pages_filename,
+                               {'a': ["5", "6"], 'b': ["6", "7"], 'c': []})
+        assert found == {'a': {"'Tofu'": ["5", "0"], "'Sorbet'": ["6", "0"]},
+                         'b': {"'Sorbet'": ["6", "0"], "'Cake'": ["7", "0"]},
+                         'c': {}}
+
+    def test_resolve_categories(self):
+        resolved = resolveCategories(self.catlinks_filename, self.pages_filename,
+                                     ["'Recipes'", "'Vegan_recipes'"])
+        pages, subcats, files = resolved["'Recipes'"]
+        assert pages == {"'Tofu'": ["8", "1"]}
+        assert list(subcats) == ["'Vegan_recipes'", "'Dessert_recipes'"]
+        assert files == {}
+        pages, subcats, files = resolved["'Vegan_recipes'"]
+        assert list(pages) == ["'Tofu'", "'Sorbet'"]
+        assert files == {"'Tofu.jpg'": ["9", "6"]}
+
+    def test_find_subcategories(self):
+        assert findSubcategories(self.catlinks_filename, self.pages_filename,
+                                 "'Contents'") == \
+            {"'Contents'": 0, "'Recipes'": 1, "'Vegan_recipes'": 2,
+             "'Dessert_recipes'": 2}
+        assert findSubcategories(self.catlinks_filename, self.pages_filename,
+                                 "'Contents'", max_depth=1) == \
+            {"'Contents'": 0, "'Recipes'": 1}
+
+
+if __name__ == '__main__':
+    unittest.main()
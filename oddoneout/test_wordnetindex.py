@@ -0,0 +1,255 @@
+"""
+Tests wordnetindex.py on a small stand-in for the NLTK WordNet corpus reader.
+"""
+
+import os
+import pickle
+import tempfile
+import unittest
+from wordnetindex import build_wordnet_index, load_wordnet_index
+import wordnet
+from wordnet import WordnetTaxonomy
+from taxonomy import lowest_common_ancestor
+
+
+# name: (lemma names, hypernyms)
+FAKE_SYNSETS = {'entity.n.01': (['entity'], []),
+                'organism.n.01': (['organism', 'being'], ['entity.n.01']),
+                'food.n.01': (['food', 'nutrient'], ['entity.n.01']),
+                'fruit.n.01': (['fruit'], ['organism.n.01']),
+                'edible_fruit.n.01': (['edible_fruit'],
+                                      ['food.n.01', 'fruit.n.01']),
+                'apple.n.01': (['apple'], ['edible_fruit.n.01']),
+                'pear.n.01': (['pear'], ['edible_fruit.n.01']),
+                'dog.n.01': (['dog', 'domestic_dog'], ['organism.n.01']),
+                'poodle.n.01': (['poodle', 'poodle_dog'], ['dog.n.01']),
+                'toy_poodle.n.01': (['toy_poodle'], ['poodle.n.01']),
+                'dog.v.01': (['dog', 'chase'], []),
+                'lassie.n.01': (['Lassie'], [])}
+
+# name: instance hypernyms
+FAKE_INSTANCE_HYPERNYMS = {'lassie.n.01': ['dog.n.01']}
+
+
+class FakeLemma:
+
+    def __init__(self, name):
+        self._name = name
+
+    def name(self):
+        return self._name
+
+
+class FakeSynset:
+
+    def __init__(self, corpus, name):
+        self.corpus = corpus
+        self._name = name
+
+    def __eq__(self, other):
+        return isinstance(other, FakeSynset) and self._name == other._name
+
+    def __hash__(self):
+        return hash(self._name)
+
+    def name(self):
+        return self._name
+
+    def lemmas(self):
+        return [FakeLemma(name) for name in FAKE_SYNSETS[self._name][0]]
+
+    def hypernyms(self):
+        return [self.corpus.synset(name) for name in FAKE_SYNSETS[self._name][1]]
+
+    def hyponyms(self):
+        return [self.corpus.synset(name) for name in FAKE_SYNSETS
+                if self._name in FAKE_SYNSETS[name][1]]
+
+    def instance_hypernyms(self):
+        return [self.corpus.synset(name)
+                for name in FAKE_INSTANCE_HYPERNYMS.get(self._name, [])]
+
+    def instance_hyponyms(self):
+        return [self.corpus.synset(name) for name in FAKE_INSTANCE_HYPERNYMS
+                if self._name in FAKE_INSTANCE_HYPERNYMS[name]]
+
+
+class FakeWordnet:
+    """
+    The parts of nltk.corpus.wordnet that build_wordnet_index uses.
+
+    """
+
+    def synset(self, name):
+        return FakeSynset(self, name)
+
+    def all_synsets(self):
+        return [self.synset(name) for name in FAKE_SYNSETS]
+
+    def all_lemma_names(self):
+        return {lemma.lower() for (lemmas, _) in FAKE_SYNSETS.values()
+                for lemma in lemmas}
+
+    def synsets(self, word):
+        return [self.synset(name) for name in FAKE_SYNSETS
+                if word in [lemma.lower() for lemma in FAKE_SYNSETS[name][0]]]
+
+    def get_version(self):
+        return 'fake'
+
+
+class TestWordnetIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.index = build_wordnet_index(FakeWordnet())
+
+    def synsets(self, word):
+        return [self.index.synset_name(s) for s in self.index.synsets(word)]
+
+    def test_synsets(self):
+        assert self.synsets('dog') == ['dog.n.01', 'dog.v.01']
+        assert self.synsets('domestic_dog') == ['dog.n.01']
+        assert self.index.synsets('dogs') is None
+        assert self.index.synset_id('dog.n.01') is not None
+        assert self.index.synset_id('dog.n.02') is None
+
+    def test_relations(self):
+        synset_id = self.index.synset_id('edible_fruit.n.01')
+        assert [self.index.synset_name(s) for s in
+                self.index.synset_hypernyms(synset_id)] == \
+            ['food.n.01', 'fruit.n.01']
+        assert sorted(self.index.synset_name(s) for s in
+                      self.index.synset_hyponyms(synset_id)) == \
+            ['apple.n.01', 'pear.n.01']
+        assert self.index.synset_lemmas(self.index.synset_id('poodle.n.01')) == \
+            ['poodle', 'poodle_dog']
+        assert [self.index.synset_name(s) for s in
+                self.index.synset_instance_hypernyms(
+                    self.index.synset_id('lassie.n.01'))] == ['dog.n.01']
+
+    def test_descendant_counts(self):
+        counts = {name: self.index.descendant_counts[self.index.synset_id(name)]
+                  for name in FAKE_SYNSETS}
+        assert counts['toy_poodle.n.01'] == 0
+        assert counts['poodle.n.01'] == 1
+        assert counts['dog.n.01'] == 3
+        assert counts['fruit.n.01'] == 3
+        assert counts['organism.n.01'] == 9
+        # 'dog' of dog.v.01 is not below entity.n.01, nor is the instance
+        # Lassie; all the other lemmas are
+        assert counts['entity.n.01'] == 13
+        all_counts = {name: self.index.all_descendant_counts[
+            self.index.synset_id(name)] for name in FAKE_SYNSETS}
+        assert all_counts['dog.n.01'] == 4
+        assert all_counts['entity.n.01'] == 14
+
+    def test_save_and_load(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, 'wordnet.idx')
+            self.index.save(filename)
+            loaded = load_wordnet_index(filename)
+            assert loaded.meta['wordnet_version'] == 'fake'
+            assert [loaded.synset_name(s) for s in loaded.synsets('dog')] == \
+                ['dog.n.01', 'dog.v.01']
+            assert list(loaded.descendant_counts) == \
+                list(self.index.descendant_counts)
+            copy = pickle.loads(pickle.dumps(loaded))
+            assert copy.snapshot_filename == filename
+            assert list(copy.synsets('dog')) == list(loaded.synsets('dog'))
+
+
+class TestIndexedWordnetTaxonomy(unittest.TestCase):
+    """
+    WordnetTaxonomy over a prebuilt index answers without the corpus reader.
+
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        filename = os.path.join(self.tmpdir.name, 'wordnet.idx')
+        build_wordnet_index(FakeWordnet()).save(filename)
+        self.taxonomy = WordnetTaxonomy(index_filename=filename)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_num_instances(self):
+        assert self.taxonomy.num_instances() == 13
+
+    def test_is_instance(self):
+        assert self.taxonomy.is_instance('poodle')
+        assert self.taxonomy.is_category('poodle.n.01')
+
+    def test_ancestor_categories(self):
+        # Only the first hypernym of each synset is followed
+        assert sorted(self.taxonomy.get_ancestor_categories('apple')) == \
+            ['apple.n.01', 'edible_fruit.n.01', 'entity.n.01', 'food.n.01']
+        assert sorted(self.taxonomy.get_ancestor_categories('dog')) == \
+            ['dog.n.01', 'dog.v.01', 'entity.n.01', 'organism.n.01']
+        assert sorted(self.taxonomy.get_ancestor_categories('dog.n.01')) == \
+            ['dog.n.01', 'entity.n.01', 'organism.n.01']
+
+    def test_descendant_instances(self):
+        assert sorted(self.taxonomy.get_descendant_instances('dog.n.01')) == \
+            ['poodle', 'poodle_dog', 'toy_poodle']
+        assert self.taxonomy.num_descendant_instances('edible_fruit.n.01') == 2
+
+    def test_lowest_common_ancestor(self):
+        assert lowest_common_ancestor(self.taxonomy, ['apple', 'pear'],
+                                      'poodle') == (2, 'edible_fruit.n.01')
+
+
+class TestAllHypernyms(unittest.TestCase):
+    """
+    WordnetTaxonomy(all_hypernyms=True), with and without an index, gives
+    the same answers.
+
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        filename = os.path.join(self.tmpdir.name, 'wordnet.idx')
+        build_wordnet_index(FakeWordnet()).save(filename)
+        self.corpus = wordnet.wn
+        wordnet.wn = FakeWordnet()
+        self.taxonomies = [WordnetTaxonomy(all_hypernyms=True),
+                           WordnetTaxonomy(index_filename=filename,
+                                           all_hypernyms=True)]
+
+    def tearDown(self):
+        wordnet.wn = self.corpus
+        self.tmpdir.cleanup()
+
+    def test_num_instances(self):
+        for taxonomy in self.taxonomies:
+            assert taxonomy.num_instances() == 14
+
+    def test_ancestor_categories(self):
+        for taxonomy in self.taxonomies:
+            assert sorted(taxonomy.get_ancestor_categories('apple')) == \
+                ['apple.n.01', 'edible_fruit.n.01', 'entity.n.01',
+                 'food.n.01', 'fruit.n.01', 'organism.n.01']
+            assert sorted(taxonomy.get_ancestor_categories('lassie')) == \
+                ['dog.n.01', 'entity.n.01', 'lassie.n.01', 'organism.n.01']
+            # Cached closures give the same answer
+            assert sorted(taxonomy.get_ancestor_categories('apple')) == \
+                ['apple.n.01', 'edible_fruit.n.01', 'entity.n.01',
+                 'food.n.01', 'fruit.n.01', 'organism.n.01']
+
+    def test_descendant_instances(self):
+        for taxonomy in self.taxonomies:
+            assert sorted(taxonomy.get_descendant_instances('dog.n.01')) == \
+                ['Lassie', 'poodle', 'poodle_dog', 'toy_poodle']
+            assert sorted(taxonomy.get_descendant_instances('fruit.n.01')) == \
+                ['apple', 'edible_fruit', 'pear']
+            assert taxonomy.num_descendant_instances('dog.n.01') == 4
+
+    def test_first_hypernym(self):
+        taxonomy = WordnetTaxonomy()
+        assert sorted(taxonomy.get_ancestor_categories('apple')) == \
+            ['apple.n.01', 'edible_fruit.n.01', 'entity.n.01', 'food.n.01']
+        assert taxonomy.num_instances() == 13
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,224 @@
+"""
+vectorized.py
+
+Evaluates a whole puzzle set with NumPy array operations, for the large
+sets generate_puzzles makes, where the per-choice Python loops of
+solve_puzzles dominate.
+
+As in lca.py, the candidate ancestors get ranks in ascending order of
+(specificity, name); only the categories that are ancestors of some word
+of the set are ranked. The ancestors of every word are kept as one flat
+array of ranks, with offsets, rather than as bitmaps over all the ranked
+categories, which would be mostly zeros on the large graphs. Each group
+of puzzles with the same number of choices is an int matrix of word ids;
+its (puzzle, rank) pairs are sorted once, with the bitmask of the choice
+positions that have the rank as an ancestor, and for every position the
+first pair whose mask covers the other choices but not the choice itself
+is the lowest common ancestor. Scores, answers and abstentions then
+follow from row-wise maxima.
+
+The results are the same as those of solve_puzzles with a
+TaxonomySimilarity of the same taxonomy.
+"""
+
+from itertools import chain
+import numpy as np
+from taxonomy import specificity
+from puzzle import OddOneOutPuzzle
+
+# The choice positions of a puzzle are bits of an int64 mask
+MAX_CHOICES = 63
+
+
+class PuzzleSetEvaluation:
+    """
+    The result of evaluate_puzzles, for n puzzles of at most c choices:
+        scores      float array (n, c) of the score of each choice, in the
+                    order of puzzle.wordset + [puzzle.oddone]; NaN for
+                    missing choices and for the puzzles not attempted
+        specificities, reasons
+                    the specificity and lowest common ancestor behind each
+                    score, as an int array (n, c) (-1 where there is no
+                    score) and an object array (n, c) (None there)
+        answers     int array (n,) of the position of the chosen answer,
+                    or -1 where the solver abstains
+        hypotheses  list of the chosen answers, or None
+
+    """
+
+    def __init__(self, puzzles, scores, specificities, reasons, answers):
+        self.puzzles = puzzles
+        self.scores = scores
+        self.specificities = specificities
+        self.reasons = reasons
+        self.answers = answers
+        self.hypotheses = [None if answer < 0
+                           else (puzzle.wordset + [puzzle.oddone])[answer]
+                           for puzzle, answer in zip(puzzles, answers)]
+
+    def counts(self):
+        """
+        Returns (correct, incorrect, unattempted), as solve_puzzles does.
+
+        """
+        correct = sum(1 for puzzle, hypothesis in zip(self.puzzles, self.hypotheses)
+                      if hypothesis is not None and hypothesis == puzzle.oddone)
+        unattempted = int(np.count_nonzero(self.answers < 0))
+        return correct, len(self.puzzles) - correct - unattempted, unattempted
+
+
+def as_puzzle(puzzle):
+    # generate_puzzles makes lists: [category, oddone, example, ...]
+    if isinstance(puzzle, OddOneOutPuzzle):
+        return puzzle
+    return OddOneOutPuzzle(puzzle[1], list(puzzle[2:]), puzzle[0])
+
+
+def ancestor_ranks(taxonomy, words):
+    """
+    Ranks the ancestor categories of the words by (specificity, name).
+    Returns (offsets, ranks, specificities, categories): the ranks of the
+    ancestors of word i are ranks[offsets[i]:offsets[i + 1]], and
+    specificities and categories are in rank order.
+
+    """
+    ancestors = [taxonomy.get_ancestor_categories(word) for word in words]
+    ranked = sorted((specificity(taxonomy, category), category)
+                    for category in set().union(*ancestors))
+    rank_of = {category: rank for (rank, (_, category)) in enumerate(ranked)}
+    offsets = np.zeros(len(words) + 1, dtype=np.int64)
+    np.cumsum([len(a) for a in ancestors], out=offsets[1:])
+    ranks = np.fromiter(map(rank_of.__getitem__, chain.from_iterable(ancestors)),
+                        dtype=np.int64, count=offsets[-1])
+    return (offsets, ranks, np.array([spec for (spec, _) in ranked], dtype=np.int64),
+            [category for (_, category) in ranked])
+
+
+def lowest_common_ranks(matrix, offsets, ranks, num_ranks):
+    """
+    For a matrix of word ids (one row of choices per puzzle), returns the
+    matrix of the lowest ranked common ancestor of the other choices of
+    each choice that is not an ancestor of the choice itself, or num_ranks
+    if there is none.
+
+    """
+    num_puzzles, size = matrix.shape
+    if size > MAX_CHOICES:
+        raise ValueError('puzzles of more than {} choices are not supported: {}'
+                         .format(MAX_CHOICES, size))
+    # One (puzzle, rank, choice position) triple per ancestor of a choice
+    lengths = (offsets[matrix + 1] - offsets[matrix]).ravel()
+    total = int(lengths.sum())
+    result = np.full((num_puzzles, size), num_ranks, dtype=np.int64)
+    if total == 0:
+        return result
+    puzzle_of = np.repeat(np.arange(num_puzzles * size) // size, lengths)
+    position_of = np.repeat(np.tile(np.arange(size), num_puzzles), lengths)
+    segment_starts = np.cumsum(lengths) - lengths
+    rank_of = ranks[np.repeat(offsets[matrix].ravel() - segment_starts, lengths)
+                    + np.arange(total)]
+    # Group by (puzzle, rank), in ascending rank order within each puzzle,
+    # with the bitmask of the positions that have the rank as an ancestor
+    keys = puzzle_of * (num_ranks + 1) + rank_of
+    order = np.argsort(keys, kind='stable')
+    keys = keys[order]
+    firsts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    positions = np.bitwise_or.reduceat(np.left_shift(1, position_of[order]), firsts)
+    group_puzzles = keys[firsts] // (num_ranks + 1)
+    group_ranks = keys[firsts] % (num_ranks + 1)
+    for j in range(size):
+        # The positions of the other choices; copies of the choice itself
+        # are left out, as in TaxonomySimilarity.score_choices
+        others = np.zeros(num_puzzles, dtype=np.int64)
+        for k in range(size):
+            others |= (matrix[:, k] != matrix[:, j]).astype(np.int64) << k
+        need = others[group_puzzles]
+        common = ((positions & need) == need) & ((positions >> j) & 1 == 0)
+        found_puzzles = group_puzzles[common]
+        found_ranks = group_ranks[common]
+        # The first match of each puzzle has the lowest rank
+        first = np.ones(len(found_puzzles), dtype=bool)
+        first[1:] = found_puzzles[1:] != found_puzzles[:-1]
+        result[found_puzzles[first], j] = found_ranks[first]
+    return result
+
+
+def evaluate_puzzles(puzzles, taxonomy):
+    """
+    Solves every puzzle (OddOneOutPuzzles, or lists as made by
+    generate_puzzles) with the lowest common ancestor similarity of the
+    taxonomy, and returns a PuzzleSetEvaluation. Raises ValueError if a
+    puzzle has more than MAX_CHOICES choices.
+
+    """
+    puzzles = [as_puzzle(puzzle) for puzzle in puzzles]
+    choices = [puzzle.wordset + [puzzle.oddone] for puzzle in puzzles]
+    words = list(dict.fromkeys(chain.from_iterable(choices)))
+    word_ids = dict(zip(words, range(len(words))))
+    recognized = np.array([taxonomy.is_instance(word) for word in words],
+                          dtype=bool)
+    width = max(map(len, choices), default=0)
+    if width > MAX_CHOICES:
+        raise ValueError('puzzles of more than {} choices are not supported: {}'
+                         .format(MAX_CHOICES, width))
+    scores = np.full((len(puzzles), width), np.nan)
+    specs = np.full((len(puzzles), width), -1, dtype=np.int64)
+    reasons = np.full((len(puzzles), width), None, dtype=object)
+    answers = np.full(len(puzzles), -1, dtype=np.int64)
+
+    # The puzzles, grouped by number of choices, as matrices of word ids;
+    # puzzles with an unrecognized word are not attempted
+    groups = dict()
+    for i, c in enumerate(choices):
+        groups.setdefault(len(c), []).append(i)
+    matrices = []
+    for size, indices in groups.items():
+        if size < 2:
+            continue
+        matrix = np.fromiter(
+            map(word_ids.__getitem__,
+                chain.from_iterable(choices[i] for i in indices)),
+            dtype=np.int64, count=len(indices) * size).reshape(len(indices), size)
+        solvable = recognized[matrix].all(axis=1)
+        if solvable.any():
+            matrices.append((np.array(indices)[solvable], matrix[solvable]))
+    if not matrices:
+        return PuzzleSetEvaluation(puzzles, scores, specs, reasons, answers)
+
+    # Only the words of the attempted puzzles have their ancestors looked up
+    used = np.unique(np.concatenate([matrix.ravel() for (_, matrix) in matrices]))
+    used_offsets, ranks, specificities, categories = ancestor_ranks(
+        taxonomy, [words[w] for w in used])
+    lengths = np.zeros(len(words), dtype=np.int64)
+    lengths[used] = np.diff(used_offsets)
+    offsets = np.zeros(len(words) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    # With no common ancestor, the score is that of the root, which is
+    # given the rank one past the ranked categories
+    spec_table = np.append(specificities, taxonomy.num_instances())
+    names = np.array(categories + [taxonomy.get_root()], dtype=object)
+
+    for indices, matrix in matrices:
+        size = matrix.shape[1]
+        group_ranks = lowest_common_ranks(matrix, offsets, ranks, len(categories))
+        group_specs = spec_table[group_ranks]
+        with np.errstate(divide='ignore'):
+            group_scores = 1.0 / group_specs
+        scores[indices, :size] = group_scores
+        specs[indices, :size] = group_specs
+        reasons[indices, :size] = names[group_ranks]
+        # rank_puzzle_choices sorts (score, reason, choice) in descending
+        # order; the solver abstains when the two best scores are equal
+        best = group_scores.max(axis=1)
+        ties = (group_scores == best[:, None]).sum(axis=1) >= 2
+        answers[indices[~ties]] = group_scores[~ties].argmax(axis=1)
+    return PuzzleSetEvaluation(puzzles, scores, specs, reasons, answers)
+
+
+def solve_puzzles_vectorized(puzzles, taxonomy):
+    """
+    Same as solve_puzzles(puzzles, TaxonomySimilarity(taxonomy)), without
+    the logging: returns (correct, incorrect, unattempted).
+
+    """
+    return evaluate_puzzles(puzzles, taxonomy).counts()
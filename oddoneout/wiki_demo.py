@@ -7,6 +7,9 @@ puts the titles of all pages linked to by a certain category into a list,
 then returns the list.
 """
 
+from collections import defaultdict, deque
+
+
 def findPagesInCategory(catlinks_filename, desired_category):
     catlinks_file = open(catlinks_filename, 'r')
     
@@ -33,16 +36,112 @@ def findPagesById(page_filename, id_list):
     page_file = open(page_filename, 'r')
     pages_in_category = dict()
     
+    # Set membership instead of a linear search through the list;
+    # as before, only the first page with each id is kept
+    remaining = set(id_list)
     for page in page_file:
-        page_id, page_namespace, page_title, page_is_redirect, page_len, page_content_model, page_lang = page.split('\t')
+        page_id, page_namespace, page_title, _ = page.split('\t', 3)
         
-        if page_id in id_list:
+        if page_id in remaining:
             pages_in_category[page_title] = [page_id, page_namespace]
-            id_list.remove(page_id)
+            remaining.discard(page_id)
     
     page_file.close()
+    id_list[:] = [page_id for page_id in id_list if page_id in remaining]
     return pages_in_category
 
+def findPagesInCategories(catlinks_filename, desired_categories):
+    """
+    Same as findPagesInCategory for many categories, in one pass over the
+    categorylinks file. Returns a dict mapping each category to its
+    (page_ids, subcat_ids, file_ids).
+    
+    """
+    found = {category: ([], [], []) for category in desired_categories}
+    link_types = {"'page'": 0, "'subcat'": 1, "'file'": 2}
+    with open(catlinks_filename, 'r') as catlinks_file:
+        for category in catlinks_file:
+            page_id, cat_label, page_type = category.strip('\n').split('\t')
+            lists = found.get(cat_label)
+            if lists is not None and page_type in link_types:
+                lists[link_types[page_type]].append(page_id)
+    return found
+
+def findPagesByIds(page_filename, id_lists):
+    """
+    Same as findPagesById for many lists of ids, in one pass over the page
+    file. id_lists maps names to iterables of page ids; returns a dict
+    mapping the same names to {page_title: [page_id, page_namespace]}.
+    
+    """
+    wanted = dict()
+    for name, ids in id_lists.items():
+        for page_id in ids:
+            wanted.setdefault(page_id, []).append(name)
+    found = {name: dict() for name in id_lists}
+    with open(page_filename, 'r') as page_file:
+        for page in page_file:
+            page_id, page_namespace, page_title, _ = page.split('\t', 3)
+            names = wanted.pop(page_id, None)
+            if names is not None:
+                for name in names:
+                    found[name][page_title] = [page_id, page_namespace]
+    return found
+
+def resolveCategories(catlinks_filename, page_filename, desired_categories):
+    """
+    Returns a dict mapping each category to its (pages, subcats, files),
+    as main() computes them for one category, with one pass over each file.
+    
+    """
+    found = findPagesInCategories(catlinks_filename, desired_categories)
+    id_lists = dict()
+    for category, lists in found.items():
+        for kind, ids in enumerate(lists):
+            id_lists[(category, kind)] = ids
+    titles = findPagesByIds(page_filename, id_lists)
+    return {category: tuple(titles[(category, kind)] for kind in range(3))
+            for category in found}
+
+def findSubcategories(catlinks_filename, page_filename, root, max_depth=None):
+    """
+    Breadth-first walk of the subcategories below root, up to max_depth
+    levels. Returns a dict mapping every category reached (root included)
+    to its depth, in BFS order.
+    
+    The subcategory links are read in one pass over the categorylinks file
+    and the titles of the subcategory pages in one pass over the page file,
+    so the walk takes two passes however deep the tree is.
+    
+    """
+    subcat_ids = defaultdict(list)
+    with open(catlinks_filename, 'r') as catlinks_file:
+        for category in catlinks_file:
+            page_id, cat_label, page_type = category.strip('\n').split('\t')
+            if page_type == "'subcat'":
+                subcat_ids[cat_label].append(page_id)
+    wanted = {page_id for ids in subcat_ids.values() for page_id in ids}
+    titles = dict()
+    with open(page_filename, 'r') as page_file:
+        for page in page_file:
+            page_id, _, page_title, _ = page.split('\t', 3)
+            if page_id in wanted:
+                titles[page_id] = page_title
+                wanted.discard(page_id)
+    
+    depths = {root: 0}
+    frontier = deque([root])
+    while frontier:
+        category = frontier.popleft()
+        if max_depth is not None and depths[category] >= max_depth:
+            continue
+        for page_id in subcat_ids.get(category, ()):
+            subcat = titles.get(page_id)
+            if subcat is not None and subcat not in depths:
+                depths[subcat] = depths[category] + 1
+                frontier.append(subcat)
+    return depths
+
 def main():
     
     # Initialize variables for current search
@@ -64,11 +163,9 @@ def main():
     catlinks_filename = wiki + "-" + my_dump_date + "-categorylinks"
     pages_filename = wiki + "-" + my_dump_date + "-page"
     
-    # Collect data from txt files
-    page_ids, subcat_ids, file_ids = findPagesInCategory(catlinks_filename, desired_category)
-    pages = findPagesById(pages_filename, page_ids)
-    subcats = findPagesById(pages_filename, subcat_ids)
-    files = findPagesById(pages_filename, file_ids)
+    # Collect data from txt files, with one pass over each
+    pages, subcats, files = resolveCategories(
+        catlinks_filename, pages_filename, [desired_category])[desired_category]
     
     # Print results for debugging and clarity
     print ("Pages in category", desired_category, ":")
@@ -81,19 +178,16 @@ def main():
     for f in files:
         print(f)
     
+    # Prints terminal children by subcategory, for the whole tree below
+    # the desired category, in four passes over the files
     """
-    # Prints terminal children by subcategory
-    while(subcats):
-        sub = list(subcats.keys())[0]
-        page_ids, subcat_ids, file_ids = findPagesInCategory(catlinks_filename, sub)
-        pages = findPagesById(pages_filename, page_ids)
-        subs = findPagesById(pages_filename, subcat_ids)
-        subcats.update(subs)
+    tree = findSubcategories(catlinks_filename, pages_filename, desired_category)
+    resolved = resolveCategories(catlinks_filename, pages_filename, list(tree)[1:])
+    for sub, (pages, subs, files) in resolved.items():
         print()
         print("Kids of", sub, ":")
         for p in pages:
             print(p)
-        subcats.pop(sub)
     """
     
     return 0
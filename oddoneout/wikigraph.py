@@ -8,25 +8,108 @@ derived from the enwiki categorylinks and pages files,
 so it can be ordered into an ontology.
 """
 
-import copy
+import multiprocessing
+from array import array
 from taxonomy import Taxonomy, Specificity
+from categorygraph import CategoryGraphBuilder, load_category_graph, PAGE, SUBCAT, \
+    LINK_TYPES, PagesView, CatlinksView
+from chunkedfile import line_chunks, read_lines
+from mysqldump import read_rows
+from descendantcounts import descendant_instance_counts
 from wiki_demo import findPagesInCategory, findPagesById
 from collections import defaultdict
 
 
-class WCGTaxonomy(Taxonomy):
+class CategoryGraphTaxonomy(Taxonomy):
+    """
+    The lookups shared by the taxonomies stored as a CategoryGraph in
+    self.graph, with its descendant counts (WCGTaxonomy, and
+    DBpediaDumpTaxonomy in dbpedia_dump.py).
+    
+    """
+    
+    def get_categories(self):
+        graph = self.graph
+        return [graph.title(title_id) for title_id in range(graph.num_titles())
+                if graph.is_category_label(title_id)]
+    
+    def num_descendant_instances(self, node):
+        title_id = self.graph.title_id(node)
+        if title_id is None:
+            return 0
+        return self.graph.descendant_counts[title_id]
+    
+    def get_descendant_instances(self, node):
+        # Given a category label, returns a set of its descendant page labels
+        graph = self.graph
+        title_id = graph.title_id(node)
+        if title_id is None or not graph.is_category_label(title_id):
+            return set()
+        
+        descendants = set()
+        visited_categories = {title_id}
+        
+        categories = [title_id]
+        while len(categories) != 0:
+            category = categories.pop()
+            for page, page_type in graph.members(category):
+                member = graph.page_title(page)
+                    
+                if page_type == PAGE:
+                    descendants.add(member)
+                elif page_type == SUBCAT:
+                    if member not in visited_categories and graph.is_category_label(member):
+                        categories.append(member)
+                        visited_categories.add(member)
+        
+        return {graph.title(member) for member in descendants}
+
+
+class WCGTaxonomy(CategoryGraphTaxonomy):
     
-    def __init__(self, categorylinks_filename, pages_filename):
-        self.specificity = Specificity()
-        self.catlinks = getAllCategories(categorylinks_filename)
-        self.pages = getAllPages(pages_filename)
-        self.num_insts = len(self.get_descendant_instances(self.get_root()))
+    def __init__(self, categorylinks_filename=None, pages_filename=None,
+                 snapshot_filename=None, approximate_counts=False, workers=1,
+                 specificity_cache_size=100000, specificity_filename=None):
+        """
+        Loads the graph either from the categorylinks and page text files,
+        or from a snapshot written by compileSnapshot, which is memory-mapped
+        instead of parsed.
+        
+        The number of descendant instances of every category is computed
+        once, when the text files are loaded, and stored in the snapshot.
+        With approximate_counts=True the counts of large categories are
+        HyperLogLog estimates (see descendantcounts.py), which keeps the
+        computation feasible on the full enwiki graph.
+        
+        With workers > 1, the text files are parsed by a process pool.
+        
+        The specificities of specificity_cache_size categories are cached
+        in a Specificity, warm-started from specificity_filename if given.
+        
+        """
+        if snapshot_filename is not None:
+            self.graph = load_category_graph(snapshot_filename)
+        else:
+            self.graph = buildCategoryGraph(categorylinks_filename,
+                                            pages_filename, workers)
+        if self.graph.descendant_counts is None:
+            self.graph.descendant_counts = countDescendantInstances(
+                self.graph, approximate_counts)
+        self.num_insts = self.num_descendant_instances(self.get_root())
+        self.specificity = Specificity(self, specificity_cache_size,
+                                       specificity_filename)
         
     def is_instance(self, node):
-        return node in self.pages and self.specificity(self, node) == 0
+        title_id = self.graph.title_id(node)
+        return (title_id is not None
+                and len(self.graph.pages_with_title(title_id)) > 0
+                and self.specificity(node) == 0)
     
     def is_category(self, node):
-        return node in self.catlinks and self.specificity(self, node) > 0
+        title_id = self.graph.title_id(node)
+        return (title_id is not None
+                and self.graph.is_category_label(title_id)
+                and self.specificity(node) > 0)
     
     def num_instances(self):
         return self.num_insts
@@ -38,60 +121,41 @@ class WCGTaxonomy(Taxonomy):
     
     def get_ancestor_categories(self, node):
         # Given a page label, returns a set of its ancestor category labels
-        pages = self.get_page_dict()
-        catlinks = self.get_catlinks_dict()
-        p_ids = pages[node]
-        visited_pages = p_ids.copy()
+        graph = self.graph
+        title_id = graph.title_id(node)
+        if title_id is None:
+            return set()
+        root = graph.title_id(self.get_root())
+        p_ids = list(graph.pages_with_title(title_id))
+        visited_pages = set()
         
         categories = set()
-        while len(p_ids) != 0 and self.get_root() not in categories:
+        while len(p_ids) != 0 and root not in categories:
             
-            page_id, page_namespace = p_ids.pop()
-            if page_id in catlinks:
-                for cat_name, page_type in catlinks[page_id]:
-                    
-                    cat_id = pages[cat_name][0]
-                    
-                    if cat_id[0] not in visited_pages:
-                        categories.add(cat_name)
-                        visited_pages.append(cat_id[0])
-                        p_ids.append(cat_id)
+            page = p_ids.pop()
+            for category in graph.parents(page):
+                
+                cat_pages = graph.pages_with_title(category)
+                if len(cat_pages) == 0:
+                    # Category without a page of its own: nothing to climb
+                    categories.add(category)
+                    continue
+                cat_page = cat_pages[0]
+                
+                if cat_page not in visited_pages:
+                    categories.add(category)
+                    visited_pages.add(cat_page)
+                    p_ids.append(cat_page)
         
-        return categories
+        return {graph.title(category) for category in categories}
     
-    def get_descendant_instances(self, node):
-        # Given a category label, returns a set of its descendant page labels
-        
-        pages = self.get_page_dict()
-        catlinks = self.get_catlinks_dict()
-        
-        if node not in catlinks:
-            return set()
-        
-        descendants = set()
-        visited_categories = [node]
-        
-        categories = [node]
-        while len(categories) != 0:
-            category_name = categories.pop()
-            for page_id, page_type in catlinks[category_name]:
-                if page_id in pages:
-                    for page_name, page_namespace in pages[page_id]:
-                        
-                        if page_type == "'page'":
-                            descendants.add(page_name)
-                        elif page_type == "'subcat'":
-                            if page_name not in visited_categories and page_name in self.catlinks:
-                                categories.append(page_name)
-                                visited_categories.append(page_name)
-        
-        return descendants
-        
     def get_page_dict(self):
-        return copy.deepcopy(self.pages)
+        # A read-only view, in the layout of getAllPages
+        return PagesView(self.graph)
     
     def get_catlinks_dict(self):
-        return copy.deepcopy(self.catlinks)
+        # A read-only view, in the layout of getAllCategories
+        return CatlinksView(self.graph)
 
 def isMetaData(page_namespace):
     """
@@ -102,6 +166,168 @@ def isMetaData(page_namespace):
     pn = int(page_namespace)
     return pn == 15 or (pn >= 1 and pn <= 13)
 
+def buildCategoryGraph(catlinks_filename, pages_filename, workers=1):
+    """
+    Reads the page and categorylinks files into a compact CategoryGraph.
+    Metadata pages are skipped, as in getAllPages.
+    
+    With workers > 1 the files are split into chunks that start on line
+    boundaries and are parsed by a process pool; the chunks are merged in
+    file order, so the graph is the same as with a single process.
+    
+    The files can also both be the .sql.gz dumps themselves, which are then
+    streamed straight into the graph by a single process (see
+    readDumpIntoBuilder): a gzip stream cannot be split into chunks, so
+    workers > 1 is rejected for them. Raises ValueError if only one of the
+    files is a dump.
+    
+    """
+    builder = CategoryGraphBuilder()
+    dumps = [filename.endswith('.sql.gz')
+             for filename in (catlinks_filename, pages_filename)]
+    if any(dumps):
+        if not all(dumps):
+            raise ValueError('the categorylinks and page files must both be '
+                             '.sql.gz dumps, or both text files')
+        if workers > 1:
+            raise ValueError('.sql.gz dumps are read by a single process; '
+                             'use workers=1')
+        readDumpIntoBuilder(builder, catlinks_filename, pages_filename)
+        return builder.build()
+    if workers > 1:
+        _load_in_pool(builder, catlinks_filename, pages_filename, workers)
+        return builder.build()
+    with open(pages_filename, 'r') as pages_file:
+        for page in pages_file:
+            page_id, page_namespace, page_title, _ = page.split('\t', 3)
+            if not isMetaData(page_namespace):
+                builder.add_page(page_id, page_namespace, page_title)
+    with open(catlinks_filename, 'r') as catlinks_file:
+        for category in catlinks_file:
+            page_id, cat_label, page_type = category.strip('\n').split('\t')
+            builder.add_link(page_id, cat_label, page_type)
+    return builder.build()
+
+def readDumpIntoBuilder(builder, catlinks_filename, pages_filename):
+    """
+    Streams the rows of the page and categorylinks MySQL dumps
+    (e.g. enwiki-20201020-page.sql.gz) into a CategoryGraphBuilder, without
+    extracting them to text files first. Rows are the same as those of the
+    text files, so the graph is too.
+    
+    """
+    for page_id, page_namespace, page_title in read_rows(
+            pages_filename, ('page_id', 'page_namespace', 'page_title')):
+        if not isMetaData(page_namespace):
+            builder.add_page(page_id, page_namespace, page_title)
+    for page_id, cat_label, page_type in read_rows(
+            catlinks_filename, ('cl_from', 'cl_to', 'cl_type')):
+        builder.add_link(page_id, cat_label, page_type)
+
+def _intern_local(table, strings, value):
+    # Id of value in a chunk-local string table
+    local_id = table.get(value)
+    if local_id is None:
+        local_id = table[value] = len(strings)
+        strings.append(value)
+    return local_id
+
+def parsePageChunk(chunk):
+    """
+    Parses the byte range (filename, start, end) of a page file. Returns
+    arrays of page ids, namespaces and title ids, and the list of titles
+    the title ids refer to, for CategoryGraphBuilder.add_pages.
+    
+    """
+    filename, start, end = chunk
+    page_ids = array('i')
+    namespaces = array('h')
+    title_ids = array('i')
+    table = dict()
+    titles = []
+    for page in read_lines(filename, start, end):
+        page_id, page_namespace, page_title, _ = page.split('\t', 3)
+        if not isMetaData(page_namespace):
+            page_ids.append(int(page_id))
+            namespaces.append(int(page_namespace))
+            title_ids.append(_intern_local(table, titles, page_title))
+    return page_ids, namespaces, title_ids, titles
+
+def parseCatlinksChunk(chunk):
+    """
+    Parses the byte range (filename, start, end) of a categorylinks file,
+    for CategoryGraphBuilder.add_links.
+    
+    """
+    filename, start, end = chunk
+    page_ids = array('i')
+    category_ids = array('i')
+    link_types = array('b')
+    table = dict()
+    categories = []
+    for category in read_lines(filename, start, end):
+        page_id, cat_label, page_type = category.split('\t')
+        page_ids.append(int(page_id))
+        category_ids.append(_intern_local(table, categories, cat_label))
+        link_types.append(LINK_TYPES.index(page_type))
+    return page_ids, category_ids, link_types, categories
+
+def _load_in_pool(builder, catlinks_filename, pages_filename, workers):
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context('fork' if 'fork' in methods else None)
+    with context.Pool(workers) as pool:
+        for filename, parse, add in (
+                (pages_filename, parsePageChunk, builder.add_pages),
+                (catlinks_filename, parseCatlinksChunk, builder.add_links)):
+            chunks = [(filename, start, end)
+                      for (start, end) in line_chunks(filename, 4 * workers)]
+            # Chunks arrive in file order, and are merged while the pool
+            # parses the next ones
+            for result in pool.imap(parse, chunks):
+                add(*result)
+
+def countDescendantInstances(graph, approximate=False):
+    """
+    Returns an array with the number of distinct descendant pages of every
+    title of the graph, following the same links as
+    WCGTaxonomy.get_descendant_instances.
+    
+    """
+    def children_of(title_id):
+        result = []
+        for page, page_type in graph.members(title_id):
+            member = graph.page_title(page)
+            if page_type == SUBCAT and graph.is_category_label(member):
+                result.append(member)
+        return result
+    
+    def instances_of(title_id):
+        return [graph.page_title(page)
+                for page, page_type in graph.members(title_id)
+                if page_type == PAGE]
+    
+    return descendant_instance_counts(graph.num_titles(), children_of,
+                                      instances_of, approximate)
+
+def compileSnapshot(catlinks_filename, pages_filename, snapshot_filename,
+                    approximate_counts=False, workers=1):
+    """
+    Parses the categorylinks and page files once and writes the resulting
+    graph, with its precomputed counts, to a snapshot file that
+    WCGTaxonomy(snapshot_filename=...) can load in seconds.
+    
+    e.g. compileSnapshot("enwiki-20201020-categorylinks",
+                         "enwiki-20201020-page", "enwiki-20201020.wcg")
+    
+    """
+    taxonomy = WCGTaxonomy(catlinks_filename, pages_filename,
+                           approximate_counts=approximate_counts,
+                           workers=workers)
+    taxonomy.graph.save(snapshot_filename,
+                        {'root': taxonomy.get_root(),
+                         'num_instances': taxonomy.num_instances(),
+                         'approximate_counts': approximate_counts})
+
 def getAllPages(pages_filename):
     pages_file = open(pages_filename, 'r')
     
@@ -112,7 +338,8 @@ def getAllPages(pages_filename):
             pages[page_id].append( (page_title, page_namespace) )
             pages[page_title].append( (page_id, page_namespace) )
     pages_file.close()
-    return pages
+    # Plain dict, so that lookups of missing keys cannot grow the map
+    return dict(pages)
 
 def getAllCategories(catlinks_filename):
     catlinks_file = open(catlinks_filename, 'r')
@@ -124,7 +351,7 @@ def getAllCategories(catlinks_filename):
         cats[cat_label].append( (page_id, page_type) )
         cats[page_id].append( (cat_label, page_type) )
     catlinks_file.close()
-    return cats
+    return dict(cats)
 
 def getCategoriesOfPage(root, catlinks_filename, p_id):
     catlinks_file = open(catlinks_filename, 'r')
@@ -138,3 +365,15 @@ def getCategoriesOfPage(root, catlinks_filename, p_id):
     catlinks_file.close()
     return categories
 
+
+if __name__ == "__main__":
+    import sys
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    workers = [int(arg.split("=", 1)[1]) for arg in sys.argv[1:]
+               if arg.startswith("--workers=")]
+    if len(args) != 4 or args[0] != "compile":
+        sys.exit("usage: python wikigraph.py compile [--approximate] "
+                 "[--workers=N] CATEGORYLINKS PAGES SNAPSHOT")
+    compileSnapshot(args[1], args[2], args[3],
+                    approximate_counts="--approximate" in sys.argv,
+                    workers=workers[-1] if workers else 1)
@@ -5,19 +5,110 @@ nltk.download('wordnet')
 
 from nltk.corpus import wordnet as wn
 from nltk.corpus.reader.wordnet import WordNetError
-from taxonomy import Taxonomy, Specificity
+import os
+from taxonomy import Taxonomy, Specificity, LRUCache, closure
+from wordnetindex import build_wordnet_index, load_wordnet_index
 
 
 class WordnetTaxonomy(Taxonomy):
 
-    def __init__(self):
-        self.specificity = Specificity()
-        self.num_insts = len(self.get_descendant_instances(self.get_root()))
+    def __init__(self, index_filename=None, all_hypernyms=False,
+                 cache_size=100000, specificity_cache_size=100000,
+                 specificity_filename=None):
+        """
+        With index_filename, lookups are answered from a precomputed index
+        (see wordnetindex.py), which is built from the corpus and saved
+        there the first time. Words and synset names the index does not
+        know (e.g. inflected forms) still go through the corpus reader.
+
+        By default only the first hypernym of every synset is followed.
+        With all_hypernyms=True, ancestors include every hypernym path and
+        instance hypernyms, and descendants include instance hyponyms.
+        The closures of the last cache_size synsets are kept in LRU caches,
+        and the specificities of specificity_cache_size categories in a
+        Specificity, warm-started from specificity_filename if given.
+
+        """
+        self.all_hypernyms = all_hypernyms
+        self.ancestor_cache = LRUCache(cache_size)
+        self.descendant_cache = LRUCache(cache_size)
+        self.index = None
+        if index_filename is not None:
+            if not os.path.exists(index_filename):
+                build_wordnet_index(wn).save(index_filename)
+            self.index = load_wordnet_index(index_filename)
+            self.descendant_counts = self.index.descendant_counts
+            if all_hypernyms:
+                self.descendant_counts = self.index.all_descendant_counts
+            self.num_insts = self.descendant_counts[
+                self.index.synset_id(self.get_root())]
+        else:
+            self.num_insts = len(self.get_descendant_instances(self.get_root()))
+        self.specificity = Specificity(self, specificity_cache_size,
+                                       specificity_filename)
+
+    def _indexed_synsets(self, node):
+        # Synset ids of a word, or None if the index cannot answer
+        if self.index is None:
+            return None
+        return self.index.synsets(node)
+
+    def _indexed_synset(self, node):
+        # Synset id of a synset name, or None if the index cannot answer
+        if self.index is None:
+            return None
+        return self.index.synset_id(node)
+
+    def _synset(self, node):
+        # A synset given its name: an index id if possible, else a Synset
+        synset_id = self._indexed_synset(node)
+        if synset_id is not None:
+            return synset_id
+        return wn.synset(node)
+
+    # The helpers below take either an index id or an NLTK Synset
+
+    def _name(self, synset):
+        if isinstance(synset, int):
+            return self.index.synset_name(synset)
+        return synset.name()
+
+    def _lemma_names(self, synset):
+        if isinstance(synset, int):
+            return self.index.synset_lemmas(synset)
+        return [lemma.name() for lemma in synset.lemmas()]
+
+    def _parents(self, synset):
+        if isinstance(synset, int):
+            hypernyms = self.index.synset_hypernyms(synset)
+            if self.all_hypernyms:
+                return (list(hypernyms)
+                        + list(self.index.synset_instance_hypernyms(synset)))
+            return hypernyms[:1]
+        if self.all_hypernyms:
+            return synset.hypernyms() + synset.instance_hypernyms()
+        return synset.hypernyms()[:1]
+
+    def _children(self, synset):
+        if isinstance(synset, int):
+            hyponyms = self.index.synset_hyponyms(synset)
+            if self.all_hypernyms:
+                return (list(hyponyms)
+                        + list(self.index.synset_instance_hyponyms(synset)))
+            return hyponyms
+        if self.all_hypernyms:
+            return synset.hyponyms() + synset.instance_hyponyms()
+        return synset.hyponyms()
 
     def is_instance(self, node):
+        synsets = self._indexed_synsets(node)
+        if synsets is not None:
+            return len(synsets) > 0
         return len(wn.synsets(node)) > 0
 
     def is_category(self, node):
+        if self._indexed_synset(node) is not None:
+            return True
         try:
             wn.synset(node)
             return True
@@ -32,28 +123,39 @@ class WordnetTaxonomy(Taxonomy):
     def get_root(self):
         return 'entity.n.01'
 
+    def get_categories(self):
+        if self.index is not None:
+            return [self.index.synset_name(synset_id)
+                    for synset_id in range(self.index.num_synsets())]
+        return [synset.name() for synset in wn.all_synsets()]
+
+    def num_descendant_instances(self, node):
+        synset_id = self._indexed_synset(node)
+        if synset_id is not None:
+            return self.descendant_counts[synset_id]
+        return len(self.get_descendant_instances(node))
+
     def get_ancestor_categories(self, node):
-        if self.is_instance(node):
-            synsets = wn.synsets(node)
-        else:
-            synsets = [wn.synset(node)]
-        result = []
+        synsets = self._indexed_synsets(node)
+        if not synsets:
+            synset_id = self._indexed_synset(node)
+            if synset_id is not None:
+                synsets = [synset_id]
+            elif self.is_instance(node):
+                synsets = wn.synsets(node)
+            else:
+                synsets = [wn.synset(node)]
+        result = set()
         for synset in synsets:
-            result.append(synset.name())
-            while len(synset.hypernyms()) > 0:
-                synset = synset.hypernyms()[0]
-                result.append(synset.name())
-        return set(result)
+            result |= closure(synset, self._parents,
+                              lambda s: (self._name(s),), self.ancestor_cache)
+        return result
 
     def get_descendant_instances(self, node):
         result = set()
-        sense = wn.synset(node)
-        for y in sense.hyponyms():
-            for lemma in y.lemmas():
-                result.add(lemma.name())
-            for z in get_all_hyponyms_from_sense(y):
-                for lemma in z.lemmas():
-                    result.add(lemma.name())
+        for synset in self._children(self._synset(node)):
+            result |= closure(synset, self._children, self._lemma_names,
+                              self.descendant_cache)
         return result
 
 
@@ -0,0 +1,246 @@
+"""
+wordnetindex.py
+
+Precomputed index of the WordNet structure used by WordnetTaxonomy.
+
+Building the index walks the NLTK corpus once; it holds, as flat integer
+arrays over sorted string tables:
+    - for every lemma name, the synsets wn.synsets(lemma) returns, in order
+    - for every synset, its lemma names, hypernyms and hyponyms, and its
+      instance hypernyms and hyponyms
+    - for every synset, the number of distinct lemma names of its
+      descendants (as in WordnetTaxonomy.get_descendant_instances), both
+      through hyponyms only and through hyponyms and instance hyponyms
+The index is saved as a snapshot (see snapshot.py) and memory-mapped when
+loaded, so later runs never touch the corpus reader for the words and
+synsets it covers.
+"""
+
+from array import array
+from categorygraph import StringTable, csr
+from descendantcounts import descendant_instance_counts
+from snapshot import write_snapshot, open_snapshot
+
+
+SNAPSHOT_KIND = 'wordnet'
+SNAPSHOT_VERSION = 2
+
+SNAPSHOT_SECTIONS = ('word_synset_offsets', 'word_synsets',
+                     'lemma_offsets', 'lemmas',
+                     'hypernym_offsets', 'hypernyms',
+                     'hyponym_offsets', 'hyponyms',
+                     'instance_hypernym_offsets', 'instance_hypernyms',
+                     'instance_hyponym_offsets', 'instance_hyponyms',
+                     'descendant_counts', 'all_descendant_counts')
+
+STRING_TABLES = ('words', 'synset_names', 'lemma_names')
+
+
+class WordnetIndex:
+    """
+    Words are the lower-case lemma names looked up by wn.synsets, synsets
+    are numbered by their position in the sorted table of synset names, and
+    lemma names keep their case.
+
+    """
+
+    def __init__(self, words, synset_names, lemma_names,
+                 word_synset_offsets, word_synsets, lemma_offsets, lemmas,
+                 hypernym_offsets, hypernyms, hyponym_offsets, hyponyms,
+                 instance_hypernym_offsets, instance_hypernyms,
+                 instance_hyponym_offsets, instance_hyponyms,
+                 descendant_counts, all_descendant_counts, meta=None):
+        self.words = words
+        self.synset_names = synset_names
+        self.lemma_names = lemma_names
+        self.word_synset_offsets = word_synset_offsets
+        self.word_synsets = word_synsets
+        self.lemma_offsets = lemma_offsets
+        self.lemmas = lemmas
+        self.hypernym_offsets = hypernym_offsets
+        self.hypernyms = hypernyms
+        self.hyponym_offsets = hyponym_offsets
+        self.hyponyms = hyponyms
+        self.instance_hypernym_offsets = instance_hypernym_offsets
+        self.instance_hypernyms = instance_hypernyms
+        self.instance_hyponym_offsets = instance_hyponym_offsets
+        self.instance_hyponyms = instance_hyponyms
+        self.descendant_counts = descendant_counts
+        self.all_descendant_counts = all_descendant_counts
+        self.meta = meta or dict()
+        self.snapshot_filename = None
+
+    def __reduce_ex__(self, protocol):
+        # As for CategoryGraph: other processes map the same file
+        if self.snapshot_filename is not None:
+            return (load_wordnet_index, (self.snapshot_filename,))
+        return super().__reduce_ex__(protocol)
+
+    def save(self, filename):
+        sections = dict()
+        for name in STRING_TABLES:
+            table = getattr(self, name)
+            sections[name + '_blob'] = table.blob
+            sections[name + '_offsets'] = table.offsets
+        for name in SNAPSHOT_SECTIONS:
+            sections[name] = getattr(self, name)
+        write_snapshot(filename, SNAPSHOT_KIND, SNAPSHOT_VERSION, sections,
+                       self.meta)
+
+    def num_synsets(self):
+        return len(self.synset_names)
+
+    def synset_id(self, name):
+        return self.synset_names.index(name)
+
+    def synset_name(self, synset_id):
+        return self.synset_names[synset_id]
+
+    def synsets(self, word):
+        """
+        Returns the ids of the synsets of a word, or None if the word is
+        not one of the indexed lemma names.
+
+        """
+        word_id = self.words.index(word)
+        if word_id is None:
+            return None
+        return self.word_synsets[self.word_synset_offsets[word_id]:
+                                 self.word_synset_offsets[word_id + 1]]
+
+    def synset_lemmas(self, synset_id):
+        return [self.lemma_names[lemma] for lemma in
+                self.lemmas[self.lemma_offsets[synset_id]:
+                            self.lemma_offsets[synset_id + 1]]]
+
+    def synset_hypernyms(self, synset_id):
+        return self.hypernyms[self.hypernym_offsets[synset_id]:
+                              self.hypernym_offsets[synset_id + 1]]
+
+    def synset_hyponyms(self, synset_id):
+        return self.hyponyms[self.hyponym_offsets[synset_id]:
+                             self.hyponym_offsets[synset_id + 1]]
+
+    def synset_instance_hypernyms(self, synset_id):
+        return self.instance_hypernyms[
+            self.instance_hypernym_offsets[synset_id]:
+            self.instance_hypernym_offsets[synset_id + 1]]
+
+    def synset_instance_hyponyms(self, synset_id):
+        return self.instance_hyponyms[
+            self.instance_hyponym_offsets[synset_id]:
+            self.instance_hyponym_offsets[synset_id + 1]]
+
+
+def _edges(synsets, synset_ids, related):
+    # (synset, related synset) pairs, in corpus order
+    rows = array('i')
+    values = array('i')
+    for synset in synsets:
+        for other in related(synset):
+            rows.append(synset_ids[synset.name()])
+            values.append(synset_ids[other.name()])
+    return rows, values
+
+
+def build_wordnet_index(wordnet):
+    """
+    Builds the index from an NLTK WordNet corpus reader (nltk.corpus.wordnet).
+
+    """
+    synsets = list(wordnet.all_synsets())
+    synset_names = StringTable.from_strings(synset.name() for synset in synsets)
+    synset_ids = {name: i for (i, name) in
+                  enumerate(synset_names[i] for i in range(len(synset_names)))}
+    num_synsets = len(synset_names)
+    synsets.sort(key=lambda synset: synset_ids[synset.name()])
+
+    words = StringTable.from_strings(wordnet.all_lemma_names())
+    word_rows = array('i')
+    word_values = array('i')
+    for word_id in range(len(words)):
+        for synset in wordnet.synsets(words[word_id]):
+            word_rows.append(word_id)
+            word_values.append(synset_ids[synset.name()])
+    word_synset_offsets, word_synsets = csr(len(words), word_rows, word_values)
+
+    lemma_names = StringTable.from_strings(lemma.name() for synset in synsets
+                                           for lemma in synset.lemmas())
+    lemma_rows = array('i')
+    lemma_values = array('i')
+    for synset_id, synset in enumerate(synsets):
+        for lemma in synset.lemmas():
+            lemma_rows.append(synset_id)
+            lemma_values.append(lemma_names.index(lemma.name()))
+    lemma_offsets, lemmas = csr(num_synsets, lemma_rows, lemma_values)
+
+    hypernym_offsets, hypernyms = csr(
+        num_synsets, *_edges(synsets, synset_ids, lambda s: s.hypernyms()))
+    hyponym_offsets, hyponyms = csr(
+        num_synsets, *_edges(synsets, synset_ids, lambda s: s.hyponyms()))
+    instance_hypernym_offsets, instance_hypernyms = csr(
+        num_synsets, *_edges(synsets, synset_ids,
+                             lambda s: s.instance_hypernyms()))
+    instance_hyponym_offsets, instance_hyponyms = csr(
+        num_synsets, *_edges(synsets, synset_ids,
+                             lambda s: s.instance_hyponyms()))
+    synsets = synset_ids = None
+
+    index = WordnetIndex(words, synset_names, lemma_names,
+                         word_synset_offsets, word_synsets,
+                         lemma_offsets, lemmas,
+                         hypernym_offsets, hypernyms,
+                         hyponym_offsets, hyponyms,
+                         instance_hypernym_offsets, instance_hypernyms,
+                         instance_hyponym_offsets, instance_hyponyms,
+                         None, None,
+                         {'wordnet_version': wordnet.get_version()})
+    index.descendant_counts = count_descendant_lemmas(
+        index, index.synset_hyponyms)
+    index.all_descendant_counts = count_descendant_lemmas(
+        index, lambda synset_id: (list(index.synset_hyponyms(synset_id)) +
+                                  list(index.synset_instance_hyponyms(synset_id))))
+    return index
+
+
+def count_descendant_lemmas(index, hyponyms_of):
+    """
+    Number of distinct lemma names below every synset, following
+    hyponyms_of(synset_id), not counting the synset's own lemmas unless a
+    hyponym shares them.
+
+    Node 2s stands for the descendants of synset s and node 2s+1 for s
+    itself, so that a synset's own lemmas are only counted for its
+    hypernyms.
+
+    """
+    def children_of(node):
+        synset_id, own = divmod(node, 2)
+        if own:
+            return [2 * synset_id]
+        return [2 * hyponym + 1 for hyponym in hyponyms_of(synset_id)]
+
+    def instances_of(node):
+        synset_id, own = divmod(node, 2)
+        if own:
+            return index.lemmas[index.lemma_offsets[synset_id]:
+                                index.lemma_offsets[synset_id + 1]]
+        return ()
+
+    counts = descendant_instance_counts(2 * index.num_synsets(), children_of,
+                                        instances_of)
+    return array('q', counts[0::2])
+
+
+def load_wordnet_index(filename):
+    """
+    Memory-maps an index written by WordnetIndex.save.
+
+    """
+    snapshot = open_snapshot(filename, SNAPSHOT_KIND, SNAPSHOT_VERSION)
+    tables = [StringTable(snapshot[name + '_blob'], snapshot[name + '_offsets'])
+              for name in STRING_TABLES]
+    index = WordnetIndex(*tables, *[snapshot[name] for name in SNAPSHOT_SECTIONS],
+                         meta=snapshot.meta)
+    index.snapshot_filename = filename
+    return index
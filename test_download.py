@@ -0,0 +1,222 @@
+"""
+Tests download.py against a stub dump server on localhost.
+"""
+
+import gzip
+import hashlib
+import os
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from download import download, download_and_compile, DownloadError, CHUNK_SIZE
+from categorygraph import load_category_graph
+
+
+PAGE_DUMP = """CREATE TABLE `page` (
+  `page_id` int(8) unsigned NOT NULL AUTO_INCREMENT,
+  `page_namespace` int(11) NOT NULL DEFAULT 0,
+  `page_title` varbinary(255) NOT NULL DEFAULT '',
+  PRIMARY KEY (`page_id`)
+) ENGINE=InnoDB DEFAULT CHARSET=binary;
+INSERT INTO `page` VALUES (1,14,'Contents'),(2,14,'Recipes'),(3,0,'Tofu');
+"""
+
+CATLINKS_DUMP = """CREATE TABLE `categorylinks` (
+  `cl_from` int(8) unsigned NOT NULL DEFAULT 0,
+  `cl_to` varbinary(255) NOT NULL DEFAULT '',
+  `cl_type` enum('page','subcat','file') NOT NULL DEFAULT 'page',
+  PRIMARY KEY (`cl_from`,`cl_to`)
+) ENGINE=InnoDB DEFAULT CHARSET=binary;
+INSERT INTO `categorylinks` VALUES (2,'Contents','subcat'),(3,'Recipes','page');
+"""
+
+
+class StubDumpHandler(BaseHTTPRequestHandler):
+    """
+    Serves the server's `files` by path, honouring Range requests. A path
+    in the server's `drops` has its body cut short, once, after that many
+    bytes; a path in its `shorts` is answered, once, with a partial range
+    of that many bytes.
+
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests.append((self.path, self.headers.get('Range')))
+            drop = server.drops.pop(self.path, None)
+            short = server.shorts.pop(self.path, None)
+        body = server.files.get(self.path)
+        if body is None:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        start = 0
+        status = 200
+        range_header = self.headers.get('Range')
+        if range_header is not None:
+            start = int(range_header[len('bytes='):].rstrip('-'))
+            if start >= len(body):
+                self.send_response(416)
+                self.send_header('Content-Range', 'bytes */%d' % len(body))
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            status = 206
+        end = len(body)
+        if short is not None:
+            status = 206
+            end = start + short
+        self.send_response(status)
+        if status == 206:
+            self.send_header('Content-Range', 'bytes %d-%d/%d' % (
+                start, end - 1, len(body)))
+        self.send_header('Content-Length', str(end - start))
+        self.end_headers()
+        if drop is not None:
+            self.wfile.write(body[start:start + drop])
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        self.wfile.write(body[start:end])
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestDownload(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        os.chdir(self.tmpdir.name)
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubDumpHandler)
+        self.server.lock = threading.Lock()
+        self.server.files = dict()
+        self.server.requests = []
+        self.server.drops = dict()
+        self.server.shorts = dict()
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+        host, port = self.server.server_address
+        self.url = 'http://{}:{}'.format(host, port)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        os.chdir(self.cwd)
+        self.tmpdir.cleanup()
+
+    def serve(self, dumps, manifest='sha1sums.txt', algorithm='sha1'):
+        # Serves {filename: contents} under testwiki/20201020, with a manifest
+        for dump, contents in dumps.items():
+            self.server.files['/testwiki/20201020/' + dump] = contents
+        if manifest is not None:
+            self.server.files['/testwiki/20201020/testwiki-20201020-' + manifest] = \
+                ''.join('{}  {}\n'.format(hashlib.new(algorithm, contents).hexdigest(),
+                                          dump)
+                        for dump, contents in dumps.items()).encode('utf-8')
+
+    def test_download(self):
+        dumps = {'testwiki-20201020-page.sql.gz': os.urandom(3 << 20),
+                 'testwiki-20201020-categorylinks.sql.gz': os.urandom(1000)}
+        self.serve(dumps, 'md5sums.txt', 'md5')
+        assert download(list(dumps), self.url) == list(dumps)
+        for dump, contents in dumps.items():
+            with open(dump, 'rb') as reader:
+                assert reader.read() == contents
+        assert not [f for f in os.listdir('.') if f.endswith('.part')]
+        # Downloaded dumps are not fetched again
+        count = len(self.server.requests)
+        download(list(dumps), self.url)
+        assert len(self.server.requests) == count + 2   # The manifests
+
+    def test_resume(self):
+        contents = os.urandom(100000)
+        self.serve({'testwiki-20201020-page.sql.gz': contents})
+        with open('testwiki-20201020-page.sql.gz.part', 'wb') as part:
+            part.write(contents[:40000])
+        download(['testwiki-20201020-page.sql.gz'], self.url)
+        with open('testwiki-20201020-page.sql.gz', 'rb') as reader:
+            assert reader.read() == contents
+        assert ('/testwiki/20201020/testwiki-20201020-page.sql.gz',
+                'bytes=40000-') in self.server.requests
+
+    def test_dropped_connection(self):
+        contents = os.urandom(3 * CHUNK_SIZE)
+        self.serve({'testwiki-20201020-page.sql.gz': contents})
+        # Only whole chunks reach the .part file before the connection drops
+        self.server.drops['/testwiki/20201020/testwiki-20201020-page.sql.gz'] = \
+            CHUNK_SIZE + 1000
+        download(['testwiki-20201020-page.sql.gz'], self.url)
+        with open('testwiki-20201020-page.sql.gz', 'rb') as reader:
+            assert reader.read() == contents
+        ranges = [r for path, r in self.server.requests if path.endswith('page.sql.gz')]
+        assert ranges[0] is None and ranges[1] == 'bytes=%d-' % CHUNK_SIZE
+
+    def test_checksum_mismatch(self):
+        self.serve({'testwiki-20201020-page.sql.gz': b'the real dump'})
+        self.server.files['/testwiki/20201020/testwiki-20201020-page.sql.gz'] = \
+            b'a corrupted dump'
+        with self.assertRaises(DownloadError):
+            download(['testwiki-20201020-page.sql.gz'], self.url)
+        assert os.listdir('.') == []
+
+    def test_size_without_manifest(self):
+        contents = os.urandom(100000)
+        self.serve({'testwiki-20201020-page.sql.gz': contents}, manifest=None)
+        path = '/testwiki/20201020/testwiki-20201020-page.sql.gz'
+        # A short answer is resumed rather than taken for the whole dump
+        self.server.shorts[path] = 30000
+        download(['testwiki-20201020-page.sql.gz'], self.url)
+        with open('testwiki-20201020-page.sql.gz', 'rb') as reader:
+            assert reader.read() == contents
+        assert (path, 'bytes=30000-') in self.server.requests
+
+    def test_oversized_part(self):
+        contents = os.urandom(1000)
+        self.serve({'testwiki-20201020-page.sql.gz': contents}, manifest=None)
+        with open('testwiki-20201020-page.sql.gz.part', 'wb') as part:
+            part.write(os.urandom(2000))
+        download(['testwiki-20201020-page.sql.gz'], self.url)
+        with open('testwiki-20201020-page.sql.gz', 'rb') as reader:
+            assert reader.read() == contents
+
+    def test_download_error_not_masked(self):
+        # otherwiki compiles (and fails) while testwiki's download fails:
+        # the download error is the one raised
+        self.serve({'testwiki-20201020-page.sql.gz': b'the real dump',
+                    'testwiki-20201020-categorylinks.sql.gz': b'links'})
+        self.server.files['/testwiki/20201020/testwiki-20201020-page.sql.gz'] = \
+            b'a corrupted dump'
+        self.server.files['/otherwiki/20201020/otherwiki-20201020-page.sql.gz'] = \
+            b'not gzip'
+        self.server.files['/otherwiki/20201020/otherwiki-20201020-categorylinks.sql.gz'] = \
+            b'not gzip either'
+        with self.assertRaises(DownloadError):
+            download_and_compile(['otherwiki-20201020-page.sql.gz',
+                                  'otherwiki-20201020-categorylinks.sql.gz',
+                                  'testwiki-20201020-page.sql.gz',
+                                  'testwiki-20201020-categorylinks.sql.gz'],
+                                 self.url)
+
+    def test_download_and_compile(self):
+        dumps = {'testwiki-20201020-page.sql.gz':
+                     gzip.compress(PAGE_DUMP.encode('utf-8')),
+                 'testwiki-20201020-categorylinks.sql.gz':
+                     gzip.compress(CATLINKS_DUMP.encode('utf-8'))}
+        self.serve(dumps)
+        download_and_compile(list(dumps), self.url)
+        graph = load_category_graph('testwiki-20201020.wcg')
+        recipes = graph.title_id("'Recipes'")
+        assert graph.is_category_label(recipes)
+        assert graph.descendant_counts[recipes] == 1
+
+
+if __name__ == '__main__':
+    unittest.main()